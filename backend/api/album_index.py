@@ -0,0 +1,90 @@
+import random
+import bisect
+import sqlite3
+import logging
+import threading
+from backend.config import ELO_PAIR_RANGE
+from backend.db.meta import get_meta
+
+
+class AlbumIndex:
+    """
+    Album IDs and ratings kept in memory for /random_album and /compare_albums, so that picking albums does not read
+    (or, with ORDER BY RANDOM(), sort) the whole albums table. Reloaded when the scanner bumps library_version, and its
+    ratings when another process (an API worker, a ratings replay) bumps ratings_version.
+    Albums without a name (album 0, the placeholder for tracks without one) are left out.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.ratings_version = None
+        self.album_ids = []
+        self.by_rating = []  # (rating, album_id), sorted
+        self.lock = threading.Lock()
+
+    def refresh(self, cursor: sqlite3.Cursor):
+        """Reload from the database if the library or the ratings changed since the last load. Two lookups otherwise."""
+        # versions before the data, so that the index is never older than the versions it is marked with
+        version = get_meta(cursor, "library_version", 0)
+        ratings_version = get_meta(cursor, "ratings_version", 0)
+        if version == self.version and ratings_version == self.ratings_version:
+            return
+        with self.lock:
+            if version == self.version and ratings_version == self.ratings_version:
+                return
+            cursor.execute("SELECT album_id, album_rating FROM albums WHERE album_id != 0 AND album_name IS NOT NULL")
+            rows = cursor.fetchall()
+            if version != self.version:
+                self.album_ids = [album_id for album_id, _ in rows]
+            self.by_rating = sorted((rating if rating is not None else 1000, album_id) for album_id, rating in rows)
+            self.version, self.ratings_version = version, ratings_version
+        logging.info(f"Loaded {len(rows)} albums into the album index "
+                     f"(library version {version}, ratings version {ratings_version}).")
+
+    def random_album(self) -> int:
+        """A random album ID, or None if there are no albums."""
+        album_ids = self.album_ids
+        return random.choice(album_ids) if album_ids else None
+
+    def random_pair(self) -> tuple:
+        """Two different random album IDs, or None if there are fewer than two albums."""
+        album_ids = self.album_ids
+        return tuple(random.sample(album_ids, 2)) if len(album_ids) >= 2 else None
+
+    def close_pair(self) -> tuple:
+        """
+        A random album and a random one rated within ELO_PAIR_RANGE points of it (or the next one in rating order if
+        there is none), or None if there are fewer than two albums. Votes between albums of similar rating are the
+        least predictable, so they tell the most about the order of the albums. Pairing only the very nearest albums
+        does worse than random pairs though, as albums then rarely meet the ones they are misordered with.
+        """
+        with self.lock:
+            by_rating = self.by_rating
+            if len(by_rating) < 2:
+                return None
+            i = random.randrange(len(by_rating))
+            rating = by_rating[i][0]
+            low = bisect.bisect_left(by_rating, (rating - ELO_PAIR_RANGE,))
+            high = bisect.bisect_left(by_rating, (rating + ELO_PAIR_RANGE + 1e-9,)) - 1
+            low, high = min(low, max(0, i - 1)), max(high, min(len(by_rating) - 1, i + 1))
+            j = random.randint(low, high - 1)
+            j += j >= i  # skip the album itself
+            return by_rating[i][1], by_rating[j][1]
+
+    def update_rating(self, album_id: int, old_rating: float, new_rating: float):
+        """Move an album to its new place in the rating order after a vote."""
+        with self.lock:
+            i = bisect.bisect_left(self.by_rating, (old_rating, album_id))
+            if i < len(self.by_rating) and self.by_rating[i] == (old_rating, album_id):
+                del self.by_rating[i]
+                bisect.insort(self.by_rating, (new_rating, album_id))
+
+    def mark_ratings_version(self, ratings_version: int):
+        """
+        After this process applied its own vote with update_rating, mark the index current with the ratings_version
+        the vote set, so that it is not reloaded for it. Unless the index was current just before the vote: then
+        another change came in between, which the next refresh loads.
+        """
+        with self.lock:
+            if self.ratings_version == ratings_version - 1:
+                self.ratings_version = ratings_version
@@ -1,52 +1,142 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
+from starlette.concurrency import run_in_threadpool
 import os
-import mimetypes
-import random
+import json
+from contextlib import asynccontextmanager
+import anyio
 from backend.config import DB_PATH
-from backend.db.scan_media import get_artist_id_maps
+import backend.config as config
+from backend.db import art_store, seek_index, search, ratings, meta
+from backend.db.connection import ConnectionPool
+from backend.db.utils import guess_mime_type
+from backend.api.streaming import (
+    FileRangeResponse, MultipartFileRangeResponse, make_validators, is_not_modified, if_range_matches, parse_range_header,
+    etag_matches,
+)
+from backend.api.album_index import AlbumIndex
+from backend.api import metrics
+from backend.api.response_cache import ResponseCache
+from backend.api.pagination import CURSOR_HEADER, DEFAULT_LIMIT, MAX_LIMIT, encode_cursor, decode_cursor, keyset_page
 import logging
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the thread pool that sync endpoints and stream reads run in (config.API_THREADS)."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.API_THREADS
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+db = ConnectionPool(DB_PATH, factory=metrics.TimedConnection)
+album_index = AlbumIndex()
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE)
 
 # enable CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
     allow_credentials=True,
-    allow_methods=["GET", "POST"],
+    allow_methods=["GET", "HEAD", "POST"],
     allow_headers=["*"],
+    expose_headers=[CURSOR_HEADER],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Music Streaming API!"}
 
-@app.get("/songs")
-def get_songs():
-    """Fetch all songs from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT music_id, title FROM music")
-    songs = cursor.fetchall()
-    conn.close()
+def get_versions(*keys: str) -> tuple:
+    """Current values of meta version counters (library_version, ratings_version), for response_cache keys."""
+    cursor = db.reader().cursor()
+    return tuple(meta.get_meta(cursor, key, 0) for key in keys)
+
+
+SONG_SORTS = {  # sort -> (column, collation, descending by default)
+    "id": ("music_id", "", False),
+    "name": ("title", " COLLATE NOCASE", False),
+    "artist": ("track_artist", "", False),  # the column itself is COLLATE NOCASE
+    "date": ("date", "", False),
+    "duration": ("duration", "", False),
+}
+
+
+def parse_sort(sorts: dict, sort: str, order: str, after: str) -> tuple:
+    """
+    Check the sort, order and cursor of a sorted list (see ALBUM_SORTS, SONG_SORTS), or raise an HTTP 400.
+    Returns (column, collation, descending, after key for keyset_page).
+    """
+    if sort not in sorts:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {list(sorts)}")
+    if order not in (None, "asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    column, collation, descending = sorts[sort]
+    if order:
+        descending = order == "desc"
+    after_key = None
+    if after:
+        try:
+            after_sort, after_descending, value, row_id = decode_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if (after_sort, after_descending) != (sort, descending):
+            raise HTTPException(status_code=400, detail="Cursor is for another sort order")
+        after_key = (value, row_id)
+    return column, collation, descending, after_key
+
 
+@app.get("/songs")
+def get_songs(
+    request: Request, sort: str = "id", order: str = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: str = None,
+):
+    """
+    Fetch a page of songs, sorted by ID (default), name, artist, date or duration.
+    order is "asc" or "desc", ascending by default.
+    If there may be more songs, the X-Next-Cursor header is the `after` of the next page.
+    """
+    column, collation, descending, after_key = parse_sort(SONG_SORTS, sort, order, after)
+
+    def build():
+        cursor = db.reader().cursor()
+        songs = keyset_page(
+            cursor, f"SELECT music_id, title, track_artist, {column} FROM music",
+            column, "music_id", descending, after_key, limit, collation,
+        )
+        headers = {}
+        if len(songs) == limit:
+            headers[CURSOR_HEADER] = encode_cursor(sort, descending, songs[-1][3], songs[-1][0])
+        return [
+            {"id": song[0], "title": song[1], 'artist': song[2], 'album': None}
+            for song in songs
+        ], headers
+
+    return response_cache.respond(request, get_versions("library_version"), build)
+
+
+@app.get("/search")
+def search_songs(q: str, limit: int = Query(20, ge=1, le=100)):
+    """
+    Find songs whose title, album, artists, composer or genre contain words starting with each word of q, best first.
+    All matches are ranked if there are at most 10000 (search.RANK_ALL_MATCHES). Beyond that, e.g. a two letter prefix
+    in a large library, only the first 1000 in scan order are, and better matches scanned later are missed.
+    """
+    cursor = db.reader().cursor()
     return [
-        {"id": song[0], "title": song[1], 'artist': None, 'album': None}
-        for song in songs
+        {"id": music_id, "title": title, "album_id": album_id, "album": album_name, "artist": artist_name}
+        for music_id, title, album_id, album_name, artist_name in search.search(cursor, q, limit)
     ]
 
 
 @app.get("/songs/{song_id}")
 def get_song(song_id: int):
     """Fetch metadata for a specific song by ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM music WHERE id = ?", (song_id,))
+    cursor = db.reader().cursor()
+    cursor.execute("SELECT * FROM music WHERE music_id = ?", (song_id,))
     row = cursor.fetchone()
-    conn.close()
 
     if not row:
         raise HTTPException(status_code=404, detail="Song not found")
@@ -62,220 +152,344 @@ def get_song(song_id: int):
 
 def get_song_path(song_id: int) -> str:
     """Fetch the file path of a song by ID from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = db.reader().cursor()
     cursor.execute("SELECT file_path FROM music WHERE music_id = ?", (song_id,))
     row = cursor.fetchone()
-    conn.close()
 
     if not row:
         return None
     return row[0]  # Extract file path from the result
 
 
-@app.get("/stream/{song_id}")
-def stream_song(song_id: int, request: Request):
-    """Stream an audio file by song ID."""
-    file_path = get_song_path(song_id)
-    if not file_path:
+def get_song_file(song_id: int) -> dict:
+    """Fetch the file path, fingerprint and MIME type of a song by ID, as stored at scan time. Returns None if not found."""
+    cursor = db.reader().cursor()
+    cursor.execute(
+        "SELECT file_path, file_size, file_mtime, file_inode, mime_type FROM music WHERE music_id = ?",
+        (song_id,),
+    )
+    row = cursor.fetchone()
+
+    if not row:
+        return None
+    song_file = dict(zip(["file_path", "file_size", "file_mtime", "file_inode", "mime_type"], row))
+    # rows written before file info was stored
+    if None in (song_file["file_size"], song_file["file_mtime"], song_file["file_inode"]):
+        stat = os.stat(song_file["file_path"])
+        song_file.update(file_size=stat.st_size, file_mtime=stat.st_mtime_ns, file_inode=stat.st_ino)
+    if song_file["mime_type"] is None:
+        song_file["mime_type"] = guess_mime_type(song_file["file_path"])
+    return song_file
+
+
+def get_seek_table(song_id: int) -> bytes:
+    """Fetch the seek table of a song, falling back to a linear one over the whole file. Returns None if not found."""
+    cursor = db.reader().cursor()
+    cursor.execute(
+        """
+        SELECT music.duration, music.file_size, music.file_path, seek_tables.seek_table
+        FROM music LEFT JOIN seek_tables ON seek_tables.music_id = music.music_id
+        WHERE music.music_id = ?
+        """,
+        (song_id,),
+    )
+    row = cursor.fetchone()
+
+    if not row:
+        return None
+    duration, file_size, file_path, seek_table = row
+    if seek_table:
+        return seek_table
+    return seek_index.linear_seek_table(duration, file_size if file_size is not None else os.path.getsize(file_path))
+
+
+@app.get("/seek/{song_id}")
+def seek_song(song_id: int, t: float):
+    """Resolve a time in seconds to the byte offset to request from /stream/{song_id}."""
+    seek_table = get_seek_table(song_id)
+    if seek_table is None:
         raise HTTPException(status_code=404, detail="Song not found")
-    file_size = os.path.getsize(file_path)  # TODO: add file size to db
+    return {"id": song_id, "time": t, "offset": seek_index.seek_offset(seek_table, max(t, 0))}
+
+
+def iter_file(file_path: str, start: int, length: int):
+    """Yield `length` bytes of a file from `start` in 64 KB chunks. Used when config.STREAM_MODE is "generator"."""
+    with open(file_path, "rb") as f:
+        f.seek(start)  # Move to requested position
+        while length > 0 and (chunk := f.read(min(1024 * 64, length))):  # Read in chunks
+            length -= len(chunk)
+            yield chunk
+
+
+@app.api_route("/stream/{song_id}", methods=["GET", "HEAD"])
+def stream_song(song_id: int, request: Request, t: float = None):
+    """
+    Stream an audio file by song ID.
+    Supports single, suffix and multiple byte ranges, If-Range, and If-None-Match / If-Modified-Since against the file's
+    scan fingerprint, so that seeks and resumes only transfer the bytes they need.
+    Without a Range header, ?t=<seconds> streams from that time, resolved with the song's seek table.
+    """
+    try:
+        song_file = get_song_file(song_id)
+    except FileNotFoundError:
+        song_file = None
+    if not song_file:
+        raise HTTPException(status_code=404, detail="Song not found")
+    file_path, file_size, mime_type = song_file["file_path"], song_file["file_size"], song_file["mime_type"]
 
-    # NOTE: without html5 audio player, the browser will download the file if the mime type is not audio/mpeg
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if not mime_type:
-        mime_type = "application/octet-stream"  # Fallback if unknown
+    etag, last_modified = make_validators(song_file["file_size"], song_file["file_mtime"], song_file["file_inode"])
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+    }
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
 
+    ranges = None
     range_header = request.headers.get("range")
-    if range_header:
-        print(range_header)
-        # Parse the "Range" header (Example: "bytes=1000-")
-        range_value = range_header.replace("bytes=", "").strip()
-        start, end = range_value.split(
-            "-") if "-" in range_value else (None, None)
-
-        # If not specified, start = 0 and end = full file
-        start = int(start) if start else 0
-        end = int(end) if end else file_size - 1
-
-        # Ensure valid range
-        if start >= file_size:
+    if range_header and if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        ranges = parse_range_header(range_header, file_size)
+        if ranges == []:
             raise HTTPException(
-                status_code=416, detail="Requested Range Not Satisfiable"
+                status_code=416, detail="Requested Range Not Satisfiable",
+                headers={"Content-Range": f"bytes */{file_size}"},
             )
 
-        chunk_size = end - start + 1
+    elif t is not None:
+        start = seek_index.seek_offset(get_seek_table(song_id), max(t, 0))
+        ranges = [(min(start, file_size - 1), file_size - 1)] if file_size > 0 else None
+
+    if ranges and len(ranges) > 1:
+        return MultipartFileRangeResponse(open_song_file(file_path), ranges, file_size, mime_type, headers=headers)
+
+    if ranges:
+        start, end = ranges[0]
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    else:
+        # If no (usable) Range header, serve the full file
+        start, end = 0, file_size - 1
+        status_code = 200
+    chunk_size = end - start + 1
+    headers["Content-Length"] = str(chunk_size)
+    headers["Content-Type"] = mime_type
+
+    if config.STREAM_MODE == "generator":
+        body = iter_file(file_path, start, chunk_size) if request.method != "HEAD" else iter([])
+        return StreamingResponse(body, status_code=status_code, headers=headers)
+    return FileRangeResponse(open_song_file(file_path), start, chunk_size, status_code=status_code, headers=headers)
+
+
+def open_song_file(file_path: str):
+    """Open a song file for FileRangeResponse, turning errors into HTTP errors."""
+    try:
+        return open(file_path, "rb", buffering=0)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Song file not found")
+    except OSError as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error streaming file: {str(e)}")
+
 
-        def file_iterator():
-            with open(file_path, "rb") as f:
-                f.seek(start)  # Move to requested position
-                while chunk := f.read(min(1024 * 64, chunk_size)):  # Read in chunks
-                    yield chunk
+def art_url(request: Request, album_art_hash: str) -> str:
+    """URL of an album art image served by get_art, or None if the album has no art."""
+    return f"{request.base_url}art/{album_art_hash}" if album_art_hash else None
 
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(chunk_size),
-            "Content-Type": mime_type,
-        }
 
-        return StreamingResponse(file_iterator(), status_code=206, headers=headers)
+@app.get("/art/{art_hash}")
+def get_art(art_hash: str, request: Request):
+    """Serve an album art image from the art store. Images never change for a given hash, so they are cached forever."""
+    if not art_store.is_art_hash(art_hash):
+        raise HTTPException(status_code=404, detail="Album art not found")
+    file_path = art_store.art_path(art_hash)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Album art not found")
 
-    # If no Range header, serve the full file
+    etag = f'"{art_hash}"'
     headers = {
-        "Content-Length": str(file_size),
-        "Content-Type": mime_type,
-        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
     }
-    try:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-        def full_file_iterator():
-            with open(file_path, "rb") as f:
-                while chunk := f.read(1024 * 64):  # Read in 64 KB chunks
-                    yield chunk
+    with open(file_path, "rb") as f:
+        mime_type = art_store.guess_art_mime(f.read(12))
+    return FileResponse(file_path, media_type=mime_type, headers=headers)
 
-        return StreamingResponse(
-            full_file_iterator(),
-            media_type=mime_type,
-        )
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Error streaming file: {str(e)}")
+ALBUM_SORTS = {  # sort -> (column, collation, descending by default)
+    "rating": ("album_rating", "", True),
+    "name": ("album_name", " COLLATE NOCASE", False),
+    "artist": ("album_artist", "", False),  # the column itself is COLLATE NOCASE
+    "date": ("album_date", "", False),
+    "duration": ("album_duration", "", False),
+}
 
 
 @app.get("/albums")
-def get_albums():
-    """Fetch all albums from the database, sorted by rating."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT album_id, album_name, album_art, album_rating FROM albums")
-    albums = cursor.fetchall()
-    conn.close()
-
-    ret = [
-        {"key": album[0], "name": album[1], "art": album[2], "artist": None, "rating": album[3]}
-        for album in albums
-    ]
-    ret.sort(key=lambda x: x["rating"], reverse=True)
-    return ret
+def get_albums(
+    request: Request, sort: str = "rating", order: str = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: str = None,
+):
+    """
+    Fetch a page of albums, sorted by rating (default), name, artist, date or duration.
+    order is "asc" or "desc"; ratings are highest first by default, the others ascending.
+    If there may be more albums, the X-Next-Cursor header is the `after` of the next page.
+    """
+    column, collation, descending, after_key = parse_sort(ALBUM_SORTS, sort, order, after)
+
+    def build():
+        cursor = db.reader().cursor()
+        albums = keyset_page(
+            cursor, f"SELECT album_id, album_name, album_art_hash, album_rating, album_artist, {column} FROM albums",
+            column, "album_id", descending, after_key, limit, collation,
+        )
+        headers = {}
+        if len(albums) == limit:
+            headers[CURSOR_HEADER] = encode_cursor(sort, descending, albums[-1][5], albums[-1][0])
+        return [
+            {"key": album[0], "name": album[1], "art": art_url(request, album[2]), "artist": album[4], "rating": album[3]}
+            for album in albums
+        ], headers
+
+    return response_cache.respond(request, get_versions("library_version", "ratings_version"), build)
+
+
+def get_album_details(cursor, album_ids: list, request: Request) -> dict:
+    """
+    Fetch name, art URL, album artists and tracks (with their artists) of several albums with two joined queries.
+    Returns a dict of album_id -> album detail, without the albums that do not exist.
+    """
+    placeholders = ",".join(["?"] * len(album_ids))
+
+    # albums and their album artists
+    cursor.execute(
+        f"""
+        SELECT albums.album_id, albums.album_name, albums.album_art_hash, artists.artist_name
+        FROM albums
+        LEFT JOIN artists_albums ON artists_albums.album_id = albums.album_id
+        LEFT JOIN artists ON artists.artist_id = artists_albums.artist_id
+        WHERE albums.album_id IN ({placeholders})
+        """,
+        album_ids,
+    )
+    albums = {}
+    for album_id, album_name, album_art_hash, artist_name in cursor.fetchall():
+        album = albums.setdefault(album_id, {
+            "album_id": album_id,
+            "album_name": album_name,
+            "album_art": art_url(request, album_art_hash),
+            "album_artists": [],
+            "tracks": [],
+        })
+        if artist_name is not None:
+            album["album_artists"].append(artist_name)
+    for album in albums.values():
+        album["album_artists"] = ", ".join(sorted(album["album_artists"]))
+
+    # tracks and their artists, one row per (track, artist)
+    cursor.execute(
+        f"""
+        SELECT music.album_id, music.music_id, music.tracknumber, music.title, artists.artist_name
+        FROM music
+        LEFT JOIN artists_music ON artists_music.music_id = music.music_id
+        LEFT JOIN artists ON artists.artist_id = artists_music.artist_id
+        WHERE music.album_id IN ({placeholders})
+        ORDER BY music.album_id, music.music_id, artists.artist_id
+        """,
+        album_ids,
+    )
+    tracks = {}  # music_id -> (track, artist names)
+    for album_id, music_id, tracknumber, title, artist_name in cursor.fetchall():
+        if music_id not in tracks:
+            track = {"id": music_id, "track_number": tracknumber, "title": title, "artist": None}
+            tracks[music_id] = (track, [])
+            albums[album_id]["tracks"].append(track)
+        if artist_name is not None:
+            tracks[music_id][1].append(artist_name)
+    for track, artist_names in tracks.values():
+        track["artist"] = ", ".join(artist_names) if artist_names else None
+
+    return albums
 
 
 @app.get("/album/{album_id}")
-def get_album(album_id: int):
+def get_album(album_id: int, request: Request):
     """Fetch all tracks in a specific album, including artists."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    def build():
+        albums = get_album_details(db.reader().cursor(), [album_id], request)
+        if album_id not in albums:
+            raise HTTPException(status_code=404, detail="Album not found")
+        return albums[album_id], {}
 
-    # Fetch album name and album art
-    cursor.execute("SELECT album_name FROM albums WHERE album_id = ?", (album_id,))
-    album_row = cursor.fetchone()
-    if not album_row:
-        raise HTTPException(status_code=404, detail="Album not found")
-    
-    album_name = album_row[0]
-
-    # Fetch album art (if available)
-    cursor.execute("SELECT album_art FROM albums WHERE album_id = ?", (album_id,))
-    album_art_row = cursor.fetchone()
-    album_art = album_art_row[0] if album_art_row else None
-
-    # Fetch tracks in the album (including music IDs)
-    cursor.execute("SELECT music_id, tracknumber, title, file_path FROM music WHERE album_id = ?", (album_id,))
-    tracks = cursor.fetchall()
-
-    # Fetch artist IDs associated with these tracks
-    music_ids = [track[0] for track in tracks]
-    track_artist_map = get_artist_id_maps(cursor, music_ids)
-    artists = {}
-    for music_id, artist_ids in track_artist_map.items():
-        cursor.execute(f"SELECT artist_name FROM artists WHERE artist_id IN ({','.join('?' * len(artist_ids))})", artist_ids)
-        artist_names = [row[0] for row in cursor.fetchall()]
-        artists[music_id] = ', '.join(artist_names) if artist_names else None
-
-    # Fetch album artists
-    cursor.execute("SELECT artist_id from artists_albums WHERE album_id = ?", (album_id,))
-    artist_ids = [row[0] for row in cursor.fetchall()]
-    cursor.execute(f"SELECT artist_name FROM artists WHERE artist_id IN ({','.join('?' * len(artist_ids))})", artist_ids)
-    album_artists = [row[0] for row in cursor.fetchall()]
-    album_artists.sort()
-    album_artists = ', '.join(album_artists)
-
-    conn.close()
-    
-    # Process the response
-    ret = {
-        "album_id": album_id,
-        "album_name": album_name,
-        "album_art": album_art,
-        "album_artists": album_artists,
-        "tracks": [
-            {
-                "id": track[0],
-                "track_number": track[1],
-                "title": track[2],
-                "artist": artists.get(track[0], None),
-            }
-            for track in tracks
-        ]
-    }
+    return response_cache.respond(request, get_versions("library_version"), build)
 
-    # print(ret)
-    return ret
+
+@app.get("/albums/batch")
+def get_albums_batch(ids: str, request: Request):
+    """Fetch several albums like /album/{album_id} in one call, e.g. /albums/batch?ids=3,7. Keeps the requested order."""
+    try:
+        album_ids = [int(album_id) for album_id in ids.split(",") if album_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma separated integers")
+    if not album_ids or len(album_ids) > 100:
+        raise HTTPException(status_code=400, detail="Between 1 and 100 ids are required")
+
+    def build():
+        albums = get_album_details(db.reader().cursor(), album_ids, request)
+        missing = [album_id for album_id in album_ids if album_id not in albums]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Albums not found: {missing}")
+        return {"albums": [albums[album_id] for album_id in album_ids]}, {}
+
+    return response_cache.respond(request, get_versions("library_version"), build)
 
 
 @app.get("/random_album")
 def get_random_album():
     """Fetch a random album ID from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT album_id FROM albums WHERE album_name IS NOT NULL")
-    album_ids = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    album_index.refresh(db.reader().cursor())
+    random_album_id = album_index.random_album()
 
-    if not album_ids:
+    if random_album_id is None:
         raise HTTPException(status_code=404, detail="No albums found")
 
-    random_album_id = random.choice(album_ids)
-    print(random_album_id)
     return {"album_id": random_album_id}
 
 
 def get_album_name(album_id):
     """Fetch the name of an album by ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = db.reader().cursor()
     cursor.execute("SELECT album_name FROM albums WHERE album_id = ?", (album_id,))
     result = cursor.fetchone()
-    conn.close()
     return result[0] if result else None
 
 
-def get_elo_rating(album_id):
-    """Fetch the Elo rating of an album."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT album_rating FROM albums WHERE album_id = ?", (album_id,))
-    result = cursor.fetchone()
-    conn.close()
-    if not result:
-        logging.info(f"No rating found for album ID {album_id}")
-    return result[0] if result else 1000
-
 @app.get("/compare_albums")
-def compare_albums():
-    """Fetch two random albums for comparison."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT album_id, album_name, album_art, album_rating FROM albums WHERE album_id != 0 ORDER BY RANDOM() LIMIT 2")
+def compare_albums(request: Request, mode: str = "random"):
+    """
+    Fetch two albums for comparison. With mode=random they are picked at random; with mode=elo the second one is rated
+    close to the first (see AlbumIndex.close_pair and backend/bench/bench_pairing.py).
+    """
+    if mode not in ("random", "elo"):
+        raise HTTPException(status_code=400, detail="mode must be random or elo")
+    cursor = db.reader().cursor()
+    album_index.refresh(cursor)
+    pair = album_index.close_pair() if mode == "elo" else album_index.random_pair()
+    if pair is None:
+        raise HTTPException(status_code=404, detail="Not enough albums to compare.")
+
+    cursor.execute("SELECT album_id, album_name, album_art_hash, album_rating FROM albums WHERE album_id IN (?, ?)", pair)
+    rows = {row[0]: row for row in cursor.fetchall()}
     albums = [
         # {"id": row[0], "name": row[1], "artist": row[2], "album_art": row[3], "elo": row[4]}
-        {"id": row[0], "name": row[1], "art": row[2], "rating": row[3]}
-        for row in cursor.fetchall()
+        {"id": row[0], "name": row[1], "art": art_url(request, row[2]), "rating": row[3]}
+        for row in (rows[album_id] for album_id in pair if album_id in rows)
     ]
-    conn.close()
 
-    if len(albums) < 2:
+    if len(albums) < 2:  # removed since the index was loaded
         raise HTTPException(status_code=404, detail="Not enough albums to compare.")
 
     return {"albums": albums}
@@ -286,7 +500,6 @@ def compare_albums():
 async def update_rating(request: Request):
     """Update the Elo ratings of two albums after a comparison."""
     data = await request.json()  # Manually parse JSON
-    print("Received data:", data)  # Debugging log
 
     winner_id = data.get("winner_id")
     loser_id = data.get("loser_id")
@@ -294,27 +507,26 @@ async def update_rating(request: Request):
     if not isinstance(winner_id, int) or not isinstance(loser_id, int):
         raise HTTPException(status_code=400, detail="Invalid input data")
 
-    # Fetch current ratings
-    winner_elo = get_elo_rating(winner_id)
-    loser_elo = get_elo_rating(loser_id)
-
-    K = 32  # Elo rating adjustment factor
+    def vote():
+        # Log the vote and update both ratings in one transaction, holding the write lock from the first read
+        with db.writer(immediate=True) as conn:
+            cursor = conn.cursor()
+            return ratings.record_vote(cursor, winner_id, loser_id), meta.get_meta(cursor, "ratings_version")
 
-    # Expected scores
-    expected_winner = 1 / (1 + 10 ** ((loser_elo - winner_elo) / 400))
-    expected_loser = 1 - expected_winner
-
-    # Update ratings
-    new_winner_elo = round(winner_elo + K * (1 - expected_winner))
-    new_loser_elo = round(loser_elo + K * (0 - expected_loser))
-
-    # Update database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE albums SET album_rating = ? WHERE album_id = ?", (new_winner_elo, winner_id))
-    cursor.execute("UPDATE albums SET album_rating = ? WHERE album_id = ?", (new_loser_elo, loser_id))
-    conn.commit()
-    conn.close()
+    # in a worker thread, as waiting for the write lock (e.g. during a scan) would block the event loop
+    (winner_elo, loser_elo, new_winner_elo, new_loser_elo), ratings_version = await run_in_threadpool(vote)
+    album_index.update_rating(winner_id, winner_elo, new_winner_elo)
+    album_index.update_rating(loser_id, loser_elo, new_loser_elo)
+    album_index.mark_ratings_version(ratings_version)
 
     return {"message": "Elo ratings updated", "winner_new_elo": new_winner_elo, "loser_new_elo": new_loser_elo}
 
+
+@app.get("/metrics")
+def get_metrics():
+    """Request, stream and SQLite metrics of this process, and timings of the last scan, in Prometheus text format."""
+    cursor = db.reader().cursor()
+    last_scan = meta.get_meta(cursor, "last_scan")
+    lines = metrics.registry.render() + metrics.render_response_cache(response_cache) + metrics.render_scan(
+        json.loads(last_scan) if last_scan else None, meta.get_meta(cursor, "library_version", 0))
+    return Response("\n".join(lines) + "\n", media_type=metrics.CONTENT_TYPE)
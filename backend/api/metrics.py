@@ -0,0 +1,275 @@
+import time
+import bisect
+import sqlite3
+import threading
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Request, stream and SQLite metrics of the API process, served by /metrics in the Prometheus text format, together with
+# the timings of the last scan (stored in the meta table by scan_media.record_scan). Each uvicorn worker process keeps
+# its own, so with several workers every scrape sees one of them.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "mediastreamer"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values, as a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str) -> list:
+        ret = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            ret.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+        ret.append(f"{name}_sum{{{labels}}} {self.sum}")
+        ret.append(f"{name}_count{{{labels}}} {cumulative}")
+        return ret
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Counters and histograms of one process. Observations come from the event loop and from worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = {}  # (method, route, status) -> count
+        self.latency = {}  # route -> Histogram of seconds until the response starts
+        self.response_bytes = {}  # route -> body bytes sent
+        self.active_streams = 0
+        self.queries = {}  # statement (SELECT, INSERT, ...) -> Histogram of execute() seconds
+        self.fetch_seconds = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        with self.lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if route not in self.latency:
+                self.latency[route] = Histogram(LATENCY_BUCKETS)
+            self.latency[route].observe(seconds)
+
+    def add_response_bytes(self, route: str, n_bytes: int):
+        with self.lock:
+            self.response_bytes[route] = self.response_bytes.get(route, 0) + n_bytes
+
+    def add_active_streams(self, n: int):
+        with self.lock:
+            self.active_streams += n
+
+    def observe_query(self, sql: str, seconds: float):
+        statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "EMPTY"
+        with self.lock:
+            if statement not in self.queries:
+                self.queries[statement] = Histogram(QUERY_BUCKETS)
+            self.queries[statement].observe(seconds)
+
+    def add_fetch_seconds(self, seconds: float):
+        with self.lock:
+            self.fetch_seconds += seconds
+
+    def render(self) -> list:
+        """The metrics of this process, as lines of the Prometheus text format."""
+        with self.lock:
+            lines = [
+                f"# HELP {PREFIX}_http_requests_total Requests by method, route template and status.",
+                f"# TYPE {PREFIX}_http_requests_total counter",
+            ]
+            lines += [f'{PREFIX}_http_requests_total{{method="{method}",route="{escape(route)}",status="{status}"}} {count}'
+                      for (method, route, status), count in sorted(self.requests.items())]
+            lines += [
+                f"# HELP {PREFIX}_http_request_seconds Seconds until the response starts, by route template.",
+                f"# TYPE {PREFIX}_http_request_seconds histogram",
+            ]
+            for route, histogram in sorted(self.latency.items()):
+                lines += histogram.lines(f"{PREFIX}_http_request_seconds", f'route="{escape(route)}"')
+            lines += [
+                f"# HELP {PREFIX}_http_response_bytes_total Body bytes sent, by route template (/stream: bytes streamed).",
+                f"# TYPE {PREFIX}_http_response_bytes_total counter",
+            ]
+            lines += [f'{PREFIX}_http_response_bytes_total{{route="{escape(route)}"}} {n_bytes}'
+                      for route, n_bytes in sorted(self.response_bytes.items())]
+            lines += [
+                f"# HELP {PREFIX}_active_streams /stream responses being sent.",
+                f"# TYPE {PREFIX}_active_streams gauge",
+                f"{PREFIX}_active_streams {self.active_streams}",
+                f"# HELP {PREFIX}_sqlite_query_seconds Seconds in execute() (prepare and run to the first row), by statement.",
+                f"# TYPE {PREFIX}_sqlite_query_seconds histogram",
+            ]
+            for statement, histogram in sorted(self.queries.items()):
+                lines += histogram.lines(f"{PREFIX}_sqlite_query_seconds", f'statement="{escape(statement)}"')
+            lines += [
+                f"# HELP {PREFIX}_sqlite_fetch_seconds_total Seconds fetching rows after execute().",
+                f"# TYPE {PREFIX}_sqlite_fetch_seconds_total counter",
+                f"{PREFIX}_sqlite_fetch_seconds_total {self.fetch_seconds}",
+                f"# HELP {PREFIX}_process_start_time_seconds Start time of this process since the epoch.",
+                f"# TYPE {PREFIX}_process_start_time_seconds gauge",
+                f"{PREFIX}_process_start_time_seconds {self.started_at}",
+            ]
+        return lines
+
+
+registry = Metrics()
+
+
+def render_scan(last_scan: dict, library_version: int) -> list:
+    """The library version and the timings of the last scan (see scan_media.record_scan), as Prometheus text lines."""
+    lines = [
+        f"# HELP {PREFIX}_library_version Bumped by every scan that changes the library.",
+        f"# TYPE {PREFIX}_library_version gauge",
+        f"{PREFIX}_library_version {library_version}",
+    ]
+    if not last_scan:
+        return lines
+    lines += [
+        f"# HELP {PREFIX}_scan_finished_time_seconds End of the last scan since the epoch.",
+        f"# TYPE {PREFIX}_scan_finished_time_seconds gauge",
+        f"{PREFIX}_scan_finished_time_seconds {last_scan['finished_at']}",
+        f"# HELP {PREFIX}_scan_files Files of the last scan, by outcome.",
+        f"# TYPE {PREFIX}_scan_files gauge",
+    ]
+    lines += [f'{PREFIX}_scan_files{{outcome="{outcome}"}} {n}' for outcome, n in sorted(last_scan["files"].items())]
+    lines += [
+        f"# HELP {PREFIX}_scan_phase_seconds Seconds per phase of the last scan.",
+        f"# TYPE {PREFIX}_scan_phase_seconds gauge",
+    ]
+    lines += [f'{PREFIX}_scan_phase_seconds{{phase="{escape(phase)}"}} {seconds}'
+              for phase, seconds in last_scan["phases"].items()]
+    lines += [
+        f"# HELP {PREFIX}_scan_file_seconds Seconds per step of reading files in the last scan, summed over files.",
+        f"# TYPE {PREFIX}_scan_file_seconds gauge",
+    ]
+    lines += [f'{PREFIX}_scan_file_seconds{{step="{escape(step)}"}} {seconds}'
+              for step, (seconds, _) in sorted(last_scan["file_steps"].items())]
+    lines += [
+        f"# HELP {PREFIX}_scan_file_max_seconds Seconds of the slowest file per step of reading files in the last scan.",
+        f"# TYPE {PREFIX}_scan_file_max_seconds gauge",
+    ]
+    lines += [f'{PREFIX}_scan_file_max_seconds{{step="{escape(step)}"}} {max_seconds}'
+              for step, (_, max_seconds) in sorted(last_scan["file_steps"].items())]
+    return lines
+
+
+def render_response_cache(cache) -> list:
+    """Hits, misses, 304 answers and size of a response_cache.ResponseCache, as Prometheus text lines."""
+    return [
+        f"# HELP {PREFIX}_response_cache_total Cached read responses by outcome (not_modified ones are hits or misses too).",
+        f"# TYPE {PREFIX}_response_cache_total counter",
+        f'{PREFIX}_response_cache_total{{result="hit"}} {cache.hits}',
+        f'{PREFIX}_response_cache_total{{result="miss"}} {cache.misses}',
+        f'{PREFIX}_response_cache_total{{result="not_modified"}} {cache.not_modified}',
+        f"# HELP {PREFIX}_response_cache_entries Responses in the cache.",
+        f"# TYPE {PREFIX}_response_cache_entries gauge",
+        f"{PREFIX}_response_cache_entries {len(cache.entries)}",
+    ]
+
+
+class MetricsMiddleware:
+    """
+    Count requests and the body bytes sent, time them until the response starts, and track the number of /stream
+    responses in progress. Routes are labeled with their template (/album/{album_id}), or "other" if none matched, so
+    that the number of series stays bounded. Timing stops at the response start so that long streams, whose body is
+    sent for minutes, do not drown the time spent handling them.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        is_stream = scope["path"].startswith("/stream/")
+        status = 500
+        n_bytes = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, n_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                registry.observe_request(scope["method"], route_of(scope), status, time.perf_counter() - start)
+            elif message["type"] == "http.response.body":
+                n_bytes += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                n_bytes += message.get("count") or 0
+            await send(message)
+
+        if is_stream:
+            registry.add_active_streams(1)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if is_stream:
+                registry.add_active_streams(-1)
+            registry.add_response_bytes(route_of(scope), n_bytes)
+
+
+def route_of(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "other"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds its execute() and fetch times to metrics."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            registry.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            registry.observe_query(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            registry.add_fetch_seconds(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            registry.add_fetch_seconds(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            registry.add_fetch_seconds(time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the ones behind Connection.execute, are TimedCursors."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,68 @@
+import json
+import base64
+import sqlite3
+
+# Keyset ("cursor") pagination: a page starts right after the (sort value, id) of the last row of the previous page,
+# so each page is an index range scan of `limit` rows however deep it is, unlike OFFSET.
+
+CURSOR_HEADER = "X-Next-Cursor"
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def encode_cursor(*values) -> str:
+    """Pack JSON-serializable values into an opaque URL-safe cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Unpack a cursor made by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def keyset_page(
+    cursor: sqlite3.Cursor, select: str, sort_column: str, id_column: str, descending: bool, after: tuple, limit: int,
+    collation: str = "",
+) -> list:
+    """
+    Fetch one page of rows sorted by (sort_column, id_column).
+    Args:
+        cursor (sqlite3.Cursor): The cursor to read with.
+        select (str): "SELECT ... FROM table" without WHERE or ORDER BY.
+        sort_column (str): The column to sort by. It should be indexed; id_column should be the rowid.
+        id_column (str): A unique column breaking ties.
+        descending (bool): Sort from the largest value.
+        after (tuple): (sort value, id) of the last row of the previous page, or None for the first page.
+        limit (int): Maximum number of rows.
+        collation (str): e.g. " COLLATE NOCASE" if the index on sort_column uses it.
+    Returns:
+        list: The rows.
+    """
+    # Row values cannot compare NULLs, so rows without a sort value are read in a separate query, sorted by id.
+    # As in SQLite, they come first when ascending and last when descending.
+    order = "DESC" if descending else "ASC"
+    compare = "<" if descending else ">"
+    value_rows = (f"{sort_column} IS NOT NULL", f"({sort_column}, {id_column}) {compare} (?{collation}, ?)",
+                  f"{sort_column}{collation} {order}, {id_column} {order}")
+    null_rows = (f"{sort_column} IS NULL", f"{id_column} {compare} ?", f"{id_column} {order}")
+    phases = [value_rows, null_rows] if descending else [null_rows, value_rows]
+    if after is not None:
+        phases = phases[phases.index(null_rows if after[0] is None else value_rows):]
+
+    rows = []
+    for i, (where, bound, order_by) in enumerate(phases):
+        params = []
+        if i == 0 and after is not None:
+            where = f"{where} AND {bound}"
+            params = [after[1]] if after[0] is None else list(after)
+        cursor.execute(f"{select} WHERE {where} ORDER BY {order_by} LIMIT ?", params + [limit - len(rows)])
+        rows += cursor.fetchall()
+        if len(rows) >= limit:
+            break
+    return rows
@@ -0,0 +1,59 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+from starlette.responses import Response
+from backend.api.streaming import etag_matches
+
+# Responses of the library read endpoints, kept in memory keyed on the request URL and the versions of the data they
+# show (library_version, bumped by scans, and ratings_version, bumped by votes; see backend/db/meta.py). A new version
+# makes new keys, so nothing is ever invalidated: old entries fall out of the LRU. Read the versions before the data,
+# so that an entry is never older than its key (at worst, newer data is cached under the previous version).
+
+
+class ResponseCache:
+    """LRU of JSON response bodies with their ETag and headers. Safe to use from several threads."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (body, etag, headers)
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = 0
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: tuple):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.misses += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def respond(self, request: Request, versions: tuple, build) -> Response:
+        """
+        Serve the response to request for these data versions from the cache, or build and cache it.
+        build() returns (content, headers): JSON-serializable content and extra response headers. It is not called on
+        hits. The ETag is a hash of the body, so If-None-Match is answered with 304 Not Modified until the data changes.
+        """
+        key = (str(request.url), versions)
+        entry = self.get(key)
+        if entry is None:
+            content, headers = build()
+            body = JSONResponse(content).body
+            entry = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', headers)
+            self.put(key, entry)
+        body, etag, headers = entry
+        headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}  # always revalidate, as the library may change
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            with self.lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
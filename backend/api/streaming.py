@@ -0,0 +1,225 @@
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+import backend.config as config
+
+MAX_RANGES = 16  # more ranges than this in one request are ignored and the whole file is sent
+
+
+def make_validators(file_size: int, file_mtime: int, file_inode: int) -> tuple:
+    """
+    Build the ETag and Last-Modified header values of a file from its scan fingerprint.
+    Args:
+        file_size (int): Size in bytes.
+        file_mtime (int): Modification time in nanoseconds.
+        file_inode (int): Inode number.
+    Returns:
+        tuple: (etag, last_modified)
+    """
+    etag = f'"{file_size:x}-{file_mtime:x}-{file_inode:x}"'
+    return etag, formatdate(file_mtime / 1e9, usegmt=True)
+
+
+def parse_http_date(value: str):
+    """Parse an HTTP date into seconds since the epoch, or None if it is not a valid date."""
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """
+    Check if an If-None-Match / If-Range style header matches an ETag.
+    Weak comparison ignores W/ prefixes. Strong comparison (weak=False) never matches weak tags.
+    """
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def is_not_modified(headers: Headers, etag: str, last_modified: str) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since if there is no If-None-Match. True means 304 Not Modified."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = parse_http_date(headers.get("if-modified-since"))
+    if if_modified_since is None:
+        return False
+    return parse_http_date(last_modified) <= if_modified_since
+
+
+def if_range_matches(if_range: str, etag: str, last_modified: str) -> bool:
+    """Evaluate If-Range. If it does not match, the Range header must be ignored and the whole file sent."""
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag_matches(if_range, etag, weak=False)
+    return if_range == last_modified
+
+
+def parse_range_header(range_header: str, file_size: int) -> list:
+    """
+    Parse a Range header, e.g. "bytes=0-499", "bytes=500-", "bytes=-500" or "bytes=0-0,-1".
+    Ranges are clamped to the file, and overlapping or adjacent ranges are merged.
+    Args:
+        range_header (str): The value of the Range header.
+        file_size (int): Size of the file in bytes.
+    Returns:
+        list: (start, end) tuples with inclusive ends. Empty if no range is satisfiable (416), None if the header must be
+        ignored (not a bytes range, malformed, or more than MAX_RANGES ranges).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    parts = [part.strip() for part in spec.split(",") if part.strip()]
+    if len(parts) > MAX_RANGES:
+        return None
+    for part in parts:
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        if not first:  # suffix range: the last N bytes
+            if int(last) > 0 and file_size > 0:
+                ranges.append((max(file_size - int(last), 0), file_size - 1))
+            continue
+        start, end = int(first), int(last) if last else file_size - 1
+        if last and end < start:
+            return None
+        if start < file_size:
+            ranges.append((start, min(end, file_size - 1)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FileRangeResponse(Response):
+    """
+    Send `count` bytes of an open file, starting at `offset`.
+    If the ASGI server offers the zero-copy send extension, the file is handed over and the kernel copies the range to the
+    socket (sendfile). Otherwise the range is read with os.pread in a worker thread, config.STREAM_CHUNK_SIZE bytes at a time,
+    without going through a python generator. Sending stops when the client disconnects. The file is closed once the
+    response is sent or the client is gone.
+    """
+
+    def __init__(self, file, offset: int, count: int, status_code: int = 200, headers: dict = None, media_type: str = None):
+        self.file = file
+        self.offset = offset
+        self.count = count
+        headers = dict(headers or {})
+        headers["Content-Length"] = str(self.content_length())
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+
+    def content_length(self) -> int:
+        return self.count
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # servers before ASGI 2.4 (uvicorn included) drop sends once the client is gone instead of raising, so listen
+        # for the disconnect alongside, as StreamingResponse does, and stop reading the file when it comes. Players
+        # abort a response on every seek and skip
+        try:
+            async with anyio.create_task_group() as task_group:
+                async def send_response():
+                    try:
+                        await self.send_response(scope, send)
+                    except OSError:  # ASGI 2.4 servers raise when the client is gone
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(send_response)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+        finally:
+            self.file.close()
+        if self.background is not None:
+            await self.background()
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def send_response(self, scope: Scope, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.content_length() <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await self.send_body(scope, send)
+
+    async def send_body(self, scope: Scope, send: Send) -> None:
+        await self.send_range(scope, send, self.offset, self.count, more_body=False)
+
+    async def send_range(self, scope: Scope, send: Send, offset: int, count: int, more_body: bool) -> None:
+        """Send `count` bytes of the file from `offset`, with sendfile if possible, else in large chunks read in a worker thread."""
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": self.file,
+                "offset": offset,
+                "count": count,
+                "more_body": more_body,
+            })
+            return
+        fd = self.file.fileno()
+        remaining = count
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(config.STREAM_CHUNK_SIZE, remaining), offset)
+            if not chunk:  # file got shorter since it was scanned
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body or remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": more_body})
+
+
+class MultipartFileRangeResponse(FileRangeResponse):
+    """Send several ranges of an open file as a 206 multipart/byteranges response."""
+
+    def __init__(self, file, ranges: list, file_size: int, media_type: str, headers: dict = None):
+        self.boundary = secrets.token_hex(16)
+        self.parts = [
+            (
+                (f"\r\n--{self.boundary}\r\nContent-Type: {media_type}\r\n"
+                 f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n").encode("latin-1"),
+                start,
+                end - start + 1,
+            )
+            for start, end in ranges
+        ]
+        self.closing = f"\r\n--{self.boundary}--\r\n".encode("latin-1")
+        super().__init__(file, 0, 0, status_code=206, headers=headers,
+                         media_type=f"multipart/byteranges; boundary={self.boundary}")
+
+    def content_length(self) -> int:
+        return sum(len(part_header) + count for part_header, _, count in self.parts) + len(self.closing)
+
+    async def send_body(self, scope: Scope, send: Send) -> None:
+        for part_header, offset, count in self.parts:
+            await send({"type": "http.response.body", "body": part_header, "more_body": True})
+            await self.send_range(scope, send, offset, count, more_body=True)
+        await send({"type": "http.response.body", "body": self.closing, "more_body": False})
@@ -0,0 +1,168 @@
+"""
+Load test the library endpoints with concurrent clients and report request rate and p50/p99 latency per endpoint.
+
+    python -m backend.bench.bench_api_load [--url http://127.0.0.1:8000] [--clients 16] [--duration 10] [--spawn] [--writes]
+
+--spawn starts `uvicorn backend.api.main:app` on a free port for the run instead of using a running server. --writes also
+sends votes to /update_rating, which changes the ratings in the database. Run it before and after a change, against the
+same library, to compare.
+"""
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+READ_MIX = [  # (weight, path template)
+    (4, "/album/{album_id}"),
+    (2, "/compare_albums"),
+    (2, "/random_album"),
+    (1, "/albums"),
+    (1, "/albums?sort=name"),
+]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, body: dict = None) -> tuple:
+    """Send one request on a keep-alive connection and read the whole response. Returns (status, body bytes)."""
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def fetch_album_ids(host: str, port: int) -> list:
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    status, body = request(conn, "GET", "/albums?limit=500")
+    conn.close()
+    if status != 200:
+        raise RuntimeError(f"GET /albums returned {status}")
+    data = json.loads(body)
+    albums = data["albums"] if isinstance(data, dict) else data
+    return [album["key"] for album in albums if album["key"] != 0] or [0]
+
+
+def run_client(host: str, port: int, deadline: float, album_ids: list, writes: bool, results: list):
+    """Send requests until the deadline, appending (endpoint, seconds, status) to results."""
+    rng = random.Random()
+    mix = READ_MIX + ([(1, "POST /update_rating")] if writes else [])
+    weights = [weight for weight, _ in mix]
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local = []
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices([path for _, path in mix], weights)[0]
+        start = time.perf_counter()
+        try:
+            if endpoint == "POST /update_rating":
+                winner_id, loser_id = rng.sample(album_ids, 2) if len(album_ids) > 1 else (album_ids[0], album_ids[0])
+                status, _ = request(conn, "POST", "/update_rating", {"winner_id": winner_id, "loser_id": loser_id})
+            else:
+                status, _ = request(conn, "GET", endpoint.format(album_id=rng.choice(album_ids)))
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        local.append((endpoint, time.perf_counter() - start, status))
+    conn.close()
+    results.extend(local)
+
+
+def spawn_server(uvicorn_args: list = (), env: dict = None) -> tuple:
+    """Start uvicorn on a free port and wait until it answers. Returns (process, url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.api.main:app", "--port", str(port), "--log-level", "warning",
+         *uvicorn_args],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            request(conn, "GET", "/")
+            conn.close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def summarize(results: list, duration: float) -> dict:
+    """Request rate, error count and latency percentiles (ms) per endpoint and overall."""
+    by_endpoint = {}
+    for endpoint, seconds, status in results:
+        by_endpoint.setdefault(endpoint, []).append((seconds, status))
+    by_endpoint["all"] = [(seconds, status) for _, seconds, status in results]
+    summary = {}
+    for endpoint, samples in by_endpoint.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        summary[endpoint] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if status != 200),
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] if latencies else float("nan"),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the library endpoints.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--spawn", action="store_true", help="start a uvicorn server for the run")
+    parser.add_argument("--writes", action="store_true", help="also vote through /update_rating (modifies ratings)")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process, url = spawn_server()
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        album_ids = fetch_album_ids(host, port)
+        results = []
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=run_client, args=(host, port, deadline, album_ids, args.writes, results))
+            for _ in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    summary = summarize(results, args.duration)
+    print(f"{args.clients} clients for {args.duration:.0f} s against {url} ({len(album_ids)} albums)")
+    print(f"{'endpoint':<24}{'req':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<24}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"clients": args.clients, "duration": args.duration, "endpoints": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark: generate synthetic libraries (see synthetic_library.py), scan them phase by phase, and time the
+main API endpoints through the ASGI app. Results are written to a JSON file, so runs can be compared.
+
+    python -m backend.bench.bench_e2e [--tracks 1000,10000] [--out bench_e2e.json] [--compare old.json] [--keep DIR]
+
+Each library size runs in its own process with MEDIA_DIR, DB_PATH and ART_DIR (see config.py) pointing into a temporary
+directory, or into --keep DIR, where generated libraries are kept and reused by later runs. Endpoints are called
+in-process, without a server or sockets, so the timings are those of the app and the database alone.
+--compare prints every timing next to the same one in an earlier results file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+
+SCAN_PHASES = ["migrate", "scan_basics", "link_albumartists", "fill_album_ratings", "fill_album_summaries"]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+async def asgi_request(app, method: str, path: str, headers: dict = None, body: bytes = b"") -> tuple:
+    """Call an ASGI app directly. Returns (status, body bytes)."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    received = False
+    status, chunks = None, []
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)  # no disconnect while the response is sent
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def time_scan(workers: int) -> dict:
+    """Scan MEDIA_DIR into a new DB_PATH as scan_media.main does, timing each phase; then time a rescan."""
+    from backend.db import migrations, db_setup, scan_media
+    from backend.db.connection import connect
+    from backend.config import DB_PATH
+
+    timings = {}
+
+    def timed(phase, function, *args, **kwargs):
+        start = time.perf_counter()
+        ret = function(*args, **kwargs)
+        timings[phase] = time.perf_counter() - start
+        return ret
+
+    conn = connect(DB_PATH)
+    cursor = conn.cursor()
+    timed("migrate", migrations.migrate, conn)
+    stats = timed("scan_basics", scan_media.scan_basics, cursor, workers=workers, commit_batches=True)
+    album_ids = sorted(stats["albums"])
+    timed("link_albumartists", scan_media.link_albumartists, cursor, album_ids)
+    timed("fill_album_ratings", scan_media.fill_album_ratings, cursor)
+    timed("fill_album_summaries", db_setup.fill_album_summaries, cursor, album_ids)
+    conn.commit()
+    conn.close()
+    timings["total"] = sum(timings.values())
+    # steps of reading files in scan_basics, summed over the files (in parallel with several workers)
+    timings.update({f"file {step}": seconds for step, (seconds, _) in stats["file_steps"].items()})
+    # nothing changed, so this is the walk and the fingerprint checks
+    timed("rescan", scan_media.main, workers=workers)
+    return timings
+
+
+# endpoints served from the response cache (see backend/api/response_cache.py), timed on misses and on hits
+CACHED_ENDPOINTS = ["GET /albums", "GET /albums?sort=name", "GET /album/{id}", "GET /albums/batch", "GET /songs"]
+
+
+def time_api(n_requests: int, seed: int = 0) -> dict:
+    """
+    Time the main endpoints, n_requests calls each, with IDs and queries drawn from the database.
+    Cached endpoints are timed twice: "(cold)" bumps library_version before each call, like a scan does, so every call
+    builds its response; "(warm)" repeats one request, so every call is a cache hit.
+    """
+    from backend.api.main import app
+    from backend.config import DB_PATH
+    from backend.db import meta
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(DB_PATH)
+    album_ids = [row[0] for row in conn.execute("SELECT album_id FROM albums WHERE album_id != 0")]
+    music_ids = [row[0] for row in conn.execute("SELECT music_id FROM music")]
+    words = [row[0].split()[0] for row in conn.execute("SELECT title FROM music LIMIT 200") if row[0]]
+
+    def new_library_version():
+        meta.bump_library_version(conn.cursor())
+        conn.commit()
+
+    endpoints = {  # name -> function returning (method, path, headers, body)
+        "GET /albums": lambda: ("GET", "/albums", None, b""),
+        "GET /albums?sort=name": lambda: ("GET", "/albums?sort=name", None, b""),
+        "GET /album/{id}": lambda: ("GET", f"/album/{rng.choice(album_ids)}", None, b""),
+        "GET /albums/batch": lambda: ("GET", f"/albums/batch?ids={','.join(map(str, rng.sample(album_ids, min(20, len(album_ids)))))}", None, b""),
+        "GET /songs": lambda: ("GET", "/songs", None, b""),
+        "GET /search": lambda: ("GET", f"/search?q={rng.choice(words)[:rng.randint(2, 5)]}", None, b""),
+        "GET /random_album": lambda: ("GET", "/random_album", None, b""),
+        "GET /compare_albums": lambda: ("GET", "/compare_albums", None, b""),
+        "GET /compare_albums?mode=elo": lambda: ("GET", "/compare_albums?mode=elo", None, b""),
+        "GET /stream/{id}": lambda: ("GET", f"/stream/{rng.choice(music_ids)}", {"Range": "bytes=0-"}, b""),
+        "POST /update_rating": lambda: ("POST", "/update_rating", {"Content-Type": "application/json"}, json.dumps(
+            dict(zip(["winner_id", "loser_id"], rng.sample(album_ids, 2)))).encode()),
+    }
+
+    async def time_requests(make_request, before=None) -> dict:
+        """Time n_requests calls; before() runs ahead of each one, untimed."""
+        times, errors = [], 0
+        for _ in range(n_requests):
+            if before:
+                before()
+            method, path, headers, body = make_request()
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, method, path, headers, body)
+            times.append((time.perf_counter() - start) * 1000)
+            errors += status >= 400
+        times.sort()
+        return {"p50_ms": percentile(times, 50), "p99_ms": percentile(times, 99),
+                "mean_ms": sum(times) / len(times), "errors": errors}
+
+    async def run():
+        ret = {}
+        for name, make_request in endpoints.items():
+            await asgi_request(app, *make_request())  # warm up connections and caches
+            if name not in CACHED_ENDPOINTS:
+                ret[name] = await time_requests(make_request)
+                continue
+            ret[f"{name} (cold)"] = await time_requests(make_request, before=new_library_version)
+            request = make_request()
+            await asgi_request(app, *request)
+            ret[f"{name} (warm)"] = await time_requests(lambda: request)
+        return ret
+
+    try:
+        return asyncio.run(run())
+    finally:
+        conn.close()
+
+
+def run_size(n_tracks: int, workdir: str, workers: int, n_requests: int) -> dict:
+    """Generate (or reuse) a library of n_tracks tracks in workdir and benchmark it in a child process."""
+    from backend.bench import synthetic_library
+
+    media_dir = os.path.join(workdir, f"media_{n_tracks}")
+    ret = {"tracks": n_tracks}
+    if not os.path.isdir(media_dir):
+        start = time.perf_counter()
+        ret["albums"] = synthetic_library.generate(media_dir, n_tracks, workers=workers)
+        ret["generate_s"] = time.perf_counter() - start
+    db_path = os.path.join(workdir, f"media_{n_tracks}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    env = dict(os.environ, MEDIA_DIR=media_dir, DB_PATH=db_path, ART_DIR=os.path.join(workdir, "art"))
+    child = subprocess.run(
+        [sys.executable, "-m", "backend.bench.bench_e2e", "--child", "--workers", str(workers),
+         "--requests", str(n_requests)],
+        env=env, capture_output=True, text=True,
+    )
+    if child.returncode:
+        raise RuntimeError(f"benchmark of {n_tracks} tracks failed:\n{child.stderr[-2000:]}")
+    ret.update(json.loads(child.stdout.strip().splitlines()[-1]))
+    return ret
+
+
+def flatten(run: dict) -> dict:
+    """(section, name) -> seconds or ms, for comparing runs."""
+    ret = {("scan", phase): value for phase, value in run.get("scan", {}).items()}
+    ret.update({("api p50", name): value["p50_ms"] for name, value in run.get("api", {}).items()})
+    ret.update({("api p99", name): value["p99_ms"] for name, value in run.get("api", {}).items()})
+    return ret
+
+
+def print_run(run: dict, previous: dict = None):
+    print(f"\n{run['tracks']} tracks" + (f" (vs {previous['git'] or 'previous'})" if previous else ""))
+    old = flatten(previous["run"]) if previous else {}
+    for (section, name), value in flatten(run).items():
+        unit = "s" if section == "scan" else "ms"
+        line = f"  {section:<8}{name:<34}{value:>10.3f} {unit}"
+        if (section, name) in old and old[(section, name)]:
+            line += f"{old[(section, name)]:>10.3f} {unit}{(value / old[(section, name)] - 1) * 100:>+8.1f}%"
+        print(line)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scanning and the API on synthetic libraries.")
+    parser.add_argument("--tracks", default="1000,10000", help="comma-separated library sizes, e.g. 1000,100000,500000")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scanner (and generator) processes")
+    parser.add_argument("--requests", type=int, default=200, help="calls per endpoint")
+    parser.add_argument("--out", default="bench_e2e.json", help="results file")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--keep", help="directory to keep generated libraries in (reused when present)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:  # runs with MEDIA_DIR, DB_PATH and ART_DIR set by run_size
+        result = {"scan": time_scan(args.workers), "api": time_api(args.requests)}
+        print(json.dumps(result))
+        return
+
+    results = {
+        "git": git_revision(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(), "workers": args.workers, "runs": [],
+    }
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        previous = {run["tracks"]: {"git": old.get("git"), "run": run} for run in old["runs"]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.keep or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for n_tracks in [int(n) for n in args.tracks.split(",")]:
+            run = run_size(n_tracks, workdir, args.workers, args.requests)
+            results["runs"].append(run)
+            print_run(run, previous.get(n_tracks))
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare reading tags and album art with two parses per file (extract_metadata + extract_album_art, as the scanner used to do
+for the first track of every album) against a single extract_file call.
+
+    python -m backend.bench.bench_extract [directory] [--limit N]
+
+Bytes read are taken from rchar in /proc/self/io, so they are only reported on Linux.
+"""
+import os
+import sys
+import time
+import argparse
+from backend.config import MEDIA_DIR, SUPPORTED_EXTS
+from backend.db.scan_media import extract_metadata, extract_album_art, extract_file
+
+
+def read_bytes_so_far() -> int:
+    """Bytes this process has read through read() syscalls so far, or None if unavailable."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def find_audio_files(directory: str, limit: int = None) -> list:
+    """List supported audio files under a directory, in walk order."""
+    ret = []
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if not file.startswith(".") and any(file.lower().endswith(ext) for ext in SUPPORTED_EXTS):
+                ret.append(os.path.join(root, file))
+                if limit and len(ret) >= limit:
+                    return ret
+    return ret
+
+
+def two_parses(file_path: str):
+    extract_metadata(file_path)
+    extract_album_art(file_path)
+
+
+def one_parse(file_path: str):
+    extract_file(file_path)
+
+
+def measure(func, files: list) -> dict:
+    """Run func over files and return time and bytes read per file."""
+    bytes_before = read_bytes_so_far()
+    start = time.perf_counter()
+    for file_path in files:
+        func(file_path)
+    elapsed = time.perf_counter() - start
+    bytes_after = read_bytes_so_far()
+    return {
+        "ms_per_file": elapsed * 1000 / len(files),
+        "bytes_per_file": (bytes_after - bytes_before) / len(files) if bytes_before is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-parse tag and album art extraction.")
+    parser.add_argument("directory", nargs="?", default=MEDIA_DIR)
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N files")
+    parser.add_argument("--rounds", type=int, default=3, help="best of N rounds")
+    args = parser.parse_args()
+
+    files = find_audio_files(args.directory, args.limit)
+    if not files:
+        print(f"No audio files found in {args.directory}")
+        sys.exit(1)
+
+    results = {}
+    for name, func in (("two parses", two_parses), ("one parse", one_parse)):
+        rounds = [measure(func, files) for _ in range(args.rounds)]
+        results[name] = min(rounds, key=lambda x: x["ms_per_file"])
+
+    print(f"{len(files)} files, best of {args.rounds} rounds")
+    for name, result in results.items():
+        bytes_per_file = f"{result['bytes_per_file']:.0f}" if result["bytes_per_file"] is not None else "n/a"
+        print(f"{name:>12}: {result['ms_per_file']:.3f} ms/file, {bytes_per_file} bytes read/file")
+    before, after = results["two parses"], results["one parse"]
+    print(f"time saved: {100 * (1 - after['ms_per_file'] / before['ms_per_file']):.1f}%")
+    if before["bytes_per_file"]:
+        print(f"bytes read saved: {100 * (1 - after['bytes_per_file'] / before['bytes_per_file']):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
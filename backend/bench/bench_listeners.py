@@ -0,0 +1,300 @@
+"""
+Simulate listeners of the web player against a server, to size the machine and find what limits it: the number of
+uvicorn workers, the size of the thread pool (config.API_THREADS) or the streaming path itself.
+
+    python -m backend.bench.bench_listeners [--url http://127.0.0.1:8000] [--listeners 8,32,128] [--duration 30]
+        [--speed 1] [--bitrate 320] [--spawn [--server-workers 1] [--threads 40]] [--json out.json]
+
+Each listener behaves like src/components/AudioPlayer.jsx and the pages around it: it picks an album (/random_album or
+/compare_albums, then /album/{id}) and plays its tracks in order. A track starts with `Range: bytes=0-` and is read
+at the playback rate (--bitrate, times --speed), staying BUFFER_SECONDS ahead as the <audio> element does. Some tracks
+are skipped partway, and some are seeked: a seek outside what has been received aborts the response and requests
+`bytes=<offset>-`, like the browser does. Between tracks the listener sometimes browses /compare_albums and /album/{id}.
+
+Reported for every number of listeners: streams started per second, MB/s received, time to first byte of the first
+request of a track and of seeks, stalls (the buffer ran dry while playing), the latency of the browsing requests, and
+the CPU used by the client and, with --spawn, the server. A server near 100% CPU per worker needs more workers; high
+time to first byte with idle CPU points at the thread pool (raise --threads) or at the disk. --speed N plays N times
+faster, so that short runs cover many tracks; each listener then needs N times the bandwidth of a real one.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from backend.bench.bench_api_load import percentile, request, spawn_server
+
+BUFFER_SECONDS = 30  # how much audio the player reads ahead of the playback position
+READ_SIZE = 64 * 1024
+TRACK_ACTIONS = [(2, "end"), (1, "skip"), (1, "seek")]  # (weight, what happens to a track)
+BROWSE_BETWEEN_TRACKS = 0.3  # chance of browsing a little between two tracks
+
+
+def is_stale(error: Exception) -> bool:
+    """True if a request failed because the server had closed the idle keep-alive connection; browsers then retry it."""
+    return isinstance(error, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+
+
+class Listener:
+    """One simulated player. Samples are appended to shared lists (list.append is atomic)."""
+
+    def __init__(self, host: str, port: int, bitrate: float, speed: float, think: float, seed: int, samples: dict):
+        self.host, self.port = host, port
+        self.byte_rate = bitrate * 1000 / 8 * speed  # bytes played per second
+        self.buffer_bytes = BUFFER_SECONDS * bitrate * 1000 / 8
+        self.think = think
+        self.rng = random.Random(seed)
+        self.samples = samples
+        self.api = http.client.HTTPConnection(host, port, timeout=30)
+        self.audio = http.client.HTTPConnection(host, port, timeout=30)
+
+    def get(self, name: str, path: str):
+        """Browse: one GET on the API connection, recorded under name. Returns the parsed JSON body or None."""
+        start = time.perf_counter()
+        for retry in (False, True):
+            try:
+                status, body = request(self.api, "GET", path)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                status, body = 0, b""
+                self.api.close()
+                self.api = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                if retry or not is_stale(e):
+                    break
+        self.samples["api"].append((name, time.perf_counter() - start, status))
+        return json.loads(body) if status == 200 else None
+
+    def pick_album(self, deadline: float) -> list:
+        """Open an album like a user would, from Random Album or the compare page. Returns its track IDs."""
+        if self.rng.random() < 0.5:
+            data = self.get("GET /random_album", "/random_album")
+            album_id = data["album_id"] if data else None
+        else:
+            data = self.get("GET /compare_albums", "/compare_albums")
+            album_id = self.rng.choice(data["albums"])["id"] if data else None
+        if album_id is None:
+            return []
+        time.sleep(min(self.rng.expovariate(1 / self.think), max(0.0, deadline - time.perf_counter())))
+        data = self.get("GET /album/{id}", f"/album/{album_id}")
+        return [track["id"] for track in data["tracks"]] if data else []
+
+    def open_stream(self, song_id: int, offset: int, kind: str) -> tuple:
+        """
+        Request the song from offset on and wait for the first bytes.
+        Returns:
+            tuple: (response, file size, first bytes), or (None, 0, b"") on errors.
+        """
+        start = time.perf_counter()
+        status = 0
+        try:
+            try:
+                self.audio.request("GET", f"/stream/{song_id}", headers={"Range": f"bytes={offset}-"})
+                response = self.audio.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                if not is_stale(e):
+                    raise
+                self.reconnect_audio()
+                self.audio.request("GET", f"/stream/{song_id}", headers={"Range": f"bytes={offset}-"})
+                response = self.audio.getresponse()
+            status = response.status
+            if status in (200, 206):
+                content_range = response.getheader("Content-Range")
+                size = int(content_range.rsplit("/", 1)[1]) if content_range else int(response.getheader("Content-Length"))
+                first = response.read1(READ_SIZE)
+            else:
+                response.read()
+        except (OSError, http.client.HTTPException, ValueError, TypeError):
+            status = 0
+        self.samples["streams"].append((kind, time.perf_counter() - start, status))
+        if status not in (200, 206):
+            self.reconnect_audio()
+            return None, 0, b""
+        self.samples["bytes"].append(len(first))
+        return response, size, first
+
+    def reconnect_audio(self):
+        """Drop the audio connection, as the browser does when it abandons a response."""
+        self.audio.close()
+        self.audio = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def play(self, song_id: int, deadline: float):
+        """Play one track until it ends, is skipped, or the deadline passes."""
+        response, size, first = self.open_stream(song_id, 0, "bytes=0-")
+        if response is None:
+            return
+        action = self.rng.choices([action for _, action in TRACK_ACTIONS], [weight for weight, _ in TRACK_ACTIONS])[0]
+        event_at = self.rng.uniform(0, size) if action != "end" else None  # playback position of the skip or seek
+        offset, received = 0, len(first)  # the response covers offset..size, received up to there
+        played_from, clock = 0, time.perf_counter()  # playback position at clock
+        while True:
+            now = time.perf_counter()
+            position = min(played_from + (now - clock) * self.byte_rate, received)
+            if now >= deadline:
+                self.reconnect_audio()
+                return
+            if event_at is not None and position >= event_at:
+                event_at = None
+                if action == "skip":
+                    self.reconnect_audio()
+                    return
+                target = int(self.rng.uniform(0, size))
+                if not offset <= target < received:  # not buffered yet: abandon the response and ask for the new range
+                    self.reconnect_audio()
+                    response, size, first = self.open_stream(song_id, target, "seek")
+                    if response is None:
+                        return
+                    offset, received = target, target + len(first)
+                played_from, clock = target, time.perf_counter()
+                continue
+            if received >= size:  # all received, play out the rest
+                if position >= size:
+                    response.close()
+                    return
+                time.sleep(min((size - position) / self.byte_rate, deadline - now, 0.25))
+                continue
+            if received - position > self.buffer_bytes:  # far enough ahead
+                time.sleep(min((received - position - self.buffer_bytes) / self.byte_rate, deadline - now, 0.25))
+                continue
+            try:
+                chunk = response.read1(READ_SIZE)
+            except (OSError, http.client.HTTPException):
+                chunk = b""
+            if not chunk:  # cut short
+                self.samples["streams"].append(("body", 0.0, 0))
+                self.reconnect_audio()
+                return
+            now = time.perf_counter()
+            if played_from + (now - clock) * self.byte_rate > received:  # played everything received while waiting
+                self.samples["stalls"].append(now)
+                played_from, clock = received, now
+            received += len(chunk)
+            self.samples["bytes"].append(len(chunk))
+
+    def run(self, deadline: float):
+        while time.perf_counter() < deadline:
+            for song_id in self.pick_album(deadline):
+                if time.perf_counter() >= deadline:
+                    break
+                self.play(song_id, deadline)
+                if self.rng.random() < BROWSE_BETWEEN_TRACKS:
+                    data = self.get("GET /compare_albums", "/compare_albums")
+                    if data and self.rng.random() < 0.5:
+                        self.get("GET /album/{id}", f"/album/{self.rng.choice(data['albums'])['id']}")
+            time.sleep(min(self.rng.expovariate(1 / self.think), max(0.0, deadline - time.perf_counter())))
+        self.api.close()
+        self.audio.close()
+
+
+def cpu_seconds(pid: int) -> float:
+    """User and system CPU time of a process and its children (uvicorn workers), from /proc. None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        total = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError, IndexError):
+        return None
+    return total + sum(cpu_seconds(child) or 0 for child in children)
+
+
+def run_step(host: str, port: int, n_listeners: int, duration: float, bitrate: float, speed: float, think: float,
+             server_pid: int = None) -> dict:
+    """Run n_listeners listeners for duration seconds and summarize what they saw."""
+    samples = {"streams": [], "api": [], "bytes": [], "stalls": []}
+    listeners = [Listener(host, port, bitrate, speed, think, seed, samples) for seed in range(n_listeners)]
+    server_cpu = cpu_seconds(server_pid) if server_pid else None
+    client_cpu = time.process_time()
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=listener.run, args=(deadline,)) for listener in listeners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ret = {
+        "listeners": n_listeners,
+        "seconds": elapsed,
+        "streams_per_s": sum(1 for kind, _, _ in samples["streams"] if kind == "bytes=0-") / elapsed,
+        "seeks_per_s": sum(1 for kind, _, _ in samples["streams"] if kind == "seek") / elapsed,
+        "mb_per_s": sum(samples["bytes"]) / elapsed / 1e6,
+        "stalls": len(samples["stalls"]),
+        "stream_errors": sum(1 for _, _, status in samples["streams"] if status not in (200, 206)),
+        "api_errors": sum(1 for _, _, status in samples["api"] if status != 200),
+        "client_cpu": (time.process_time() - client_cpu) / elapsed,
+    }
+    if server_cpu is not None:
+        ret["server_cpu"] = ((cpu_seconds(server_pid) or 0) - server_cpu) / elapsed
+    for kind in ("bytes=0-", "seek"):
+        ttfb = sorted(seconds * 1000 for k, seconds, status in samples["streams"] if k == kind and status in (200, 206))
+        ret[f"ttfb {kind}"] = {"n": len(ttfb), "p50_ms": percentile(ttfb, 50), "p95_ms": percentile(ttfb, 95),
+                               "p99_ms": percentile(ttfb, 99), "max_ms": ttfb[-1] if ttfb else float("nan")}
+    for name in sorted({name for name, _, _ in samples["api"]}):
+        latencies = sorted(seconds * 1000 for n, seconds, _ in samples["api"] if n == name)
+        ret[name] = {"n": len(latencies), "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+                     "p99_ms": percentile(latencies, 99), "max_ms": latencies[-1]}
+    return ret
+
+
+def print_step(step: dict):
+    cpu = f"client {step['client_cpu'] * 100:.0f}%"
+    if "server_cpu" in step:
+        cpu += f", server {step['server_cpu'] * 100:.0f}%"
+    print(f"\n{step['listeners']} listeners: {step['streams_per_s']:.1f} tracks/s, {step['seeks_per_s']:.1f} seeks/s, "
+          f"{step['mb_per_s']:.1f} MB/s, {step['stalls']} stalls, {step['stream_errors']} stream errors, "
+          f"{step['api_errors']} API errors, CPU {cpu}")
+    print(f"  {'':<24}{'n':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in step.items():
+        if isinstance(row, dict):
+            print(f"  {name:<24}{row['n']:>7}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                  f"{row['max_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate web player listeners streaming and browsing.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--listeners", default="8,32,128", help="comma-separated numbers of listeners, run in turn")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per number of listeners")
+    parser.add_argument("--bitrate", type=float, default=320, help="playback rate in kbit/s")
+    parser.add_argument("--speed", type=float, default=1, help="play this many times faster than real time")
+    parser.add_argument("--think", type=float, default=2, help="mean seconds between browsing steps")
+    parser.add_argument("--spawn", action="store_true", help="start a uvicorn server for the run")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn worker processes (with --spawn)")
+    parser.add_argument("--threads", type=int, help="API_THREADS of the spawned server (default: config.py)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        env = dict(os.environ, **({"API_THREADS": str(args.threads)} if args.threads else {}))
+        process, url = spawn_server(["--workers", str(args.server_workers)], env)
+    steps = []
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        print(f"{url}, {args.bitrate:g} kbit/s at {args.speed:g}x, {args.duration:g} s per step"
+              + (f", {args.server_workers} workers, {args.threads or 'default'} threads" if args.spawn else ""))
+        for n_listeners in [int(n) for n in args.listeners.split(",")]:
+            step = run_step(host, port, n_listeners, args.duration, args.bitrate, args.speed, args.think,
+                            process.pid if process else None)
+            steps.append(step)
+            print_step(step)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"url": url, "bitrate": args.bitrate, "speed": args.speed, "server_workers": args.server_workers,
+                       "threads": args.threads, "steps": steps}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
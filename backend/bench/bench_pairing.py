@@ -0,0 +1,82 @@
+"""
+Simulate votes on /compare_albums pairs to compare how fast random and Elo-aware (mode=elo) pairing sort albums.
+
+    python -m backend.bench.bench_pairing [--albums 500] [--votes 20000] [--runs 5]
+
+Every album gets a hidden true rating; a vote is won with the Elo win probability of the true ratings, and ratings are
+updated as /update_rating does (K = 32, starting at 1000). After each tenth of the votes, reports the Spearman
+correlation between the ratings and the true ratings (1.0 means all albums are in their true order) and how many of the
+true top albums are in the top by rating, averaged over runs.
+"""
+import random
+import argparse
+from backend.api.album_index import AlbumIndex
+
+K = 32
+TOP = 25
+
+
+def spearman(xs: list, ys: list) -> float:
+    def ranks(values):
+        order = sorted(range(len(values)), key=lambda i: values[i])
+        ret = [0] * len(values)
+        for rank, i in enumerate(order):
+            ret[i] = rank
+        return ret
+    rx, ry = ranks(xs), ranks(ys)
+    n = len(xs)
+    return 1 - 6 * sum((a - b) ** 2 for a, b in zip(rx, ry)) / (n * (n * n - 1))
+
+
+def top_overlap(xs: list, ys: list) -> int:
+    """How many of the TOP largest of ys are among the TOP largest of xs."""
+    def top(values):
+        return set(sorted(range(len(values)), key=lambda i: -values[i])[:TOP])
+    return len(top(xs) & top(ys))
+
+
+def simulate(mode: str, n_albums: int, n_votes: int, checkpoints: list, seed: int) -> list:
+    rng = random.Random(seed)
+    random.seed(seed)  # AlbumIndex picks with the random module
+    true_ratings = [rng.gauss(1000, 200) for _ in range(n_albums)]
+    ratings = [1000.0] * n_albums
+    index = AlbumIndex()
+    index.album_ids = list(range(n_albums))
+    index.by_rating = sorted((rating, album_id) for album_id, rating in enumerate(ratings))
+
+    ret = []
+    for vote in range(1, n_votes + 1):
+        a, b = index.close_pair() if mode == "elo" else index.random_pair()
+        a_wins = rng.random() < 1 / (1 + 10 ** ((true_ratings[b] - true_ratings[a]) / 400))
+        winner, loser = (a, b) if a_wins else (b, a)
+        expected_winner = 1 / (1 + 10 ** ((ratings[loser] - ratings[winner]) / 400))
+        new_winner, new_loser = round(ratings[winner] + K * (1 - expected_winner)), round(ratings[loser] - K * (1 - expected_winner))
+        index.update_rating(winner, ratings[winner], new_winner)
+        index.update_rating(loser, ratings[loser], new_loser)
+        ratings[winner], ratings[loser] = new_winner, new_loser
+        if vote in checkpoints:
+            ret.append((spearman(ratings, true_ratings), top_overlap(ratings, true_ratings)))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare random and Elo-aware album pairing.")
+    parser.add_argument("--albums", type=int, default=500)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    checkpoints = [args.votes * share // 10 for share in range(1, 11)]
+    print(f"{args.albums} albums, mean of {args.runs} runs")
+    print(f"{'':>8}{'Spearman':>18}{f'top {TOP} found':>18}")
+    print(f"{'votes':>8}{'random':>9}{'elo':>9}{'random':>9}{'elo':>9}")
+    results = {mode: [simulate(mode, args.albums, args.votes, checkpoints, seed) for seed in range(args.runs)]
+               for mode in ("random", "elo")}
+    for i, votes in enumerate(checkpoints):
+        correlations = [sum(run[i][0] for run in results[mode]) / args.runs for mode in ("random", "elo")]
+        overlaps = [sum(run[i][1] for run in results[mode]) / args.runs for mode in ("random", "elo")]
+        print(f"{votes:>8}{correlations[0]:>9.3f}{correlations[1]:>9.3f}{overlaps[0]:>9.1f}{overlaps[1]:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Count the SQL statements a scan runs per track, and compare resolving album/genre/organization/artist IDs per track
+(get_or_create_id and get_or_create_ids, as the scanner used to do) against the per-scan NameIds caches.
+
+    python -m backend.bench.bench_scan [directory] [--workers N]
+
+Both parts use throwaway databases and art store in a temporary directory; the configured ones are not touched.
+Statements are counted with sqlite3's trace callback, so every row of an executemany counts as one statement.
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter
+import backend.config as config
+from backend.db import migrations, scan_media, art_store
+
+
+class StatementCounter:
+    """Trace callback counting executed statements by their verb and table, e.g. "SELECT artists"."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, statement: str):
+        verb = statement.split(None, 1)[0].upper() if statement.strip() else ""
+        if verb in ("", "BEGIN", "COMMIT", "ROLLBACK"):
+            return
+        table = re.search(r"\b(?:INTO|FROM|UPDATE)\s+(\w+)", statement, re.IGNORECASE)
+        self.counts[f"{verb} {table.group(1) if table else ''}".strip()] += 1
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def new_database(directory: str, name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(directory, name))
+    migrations.migrate(conn)
+    return conn
+
+
+def lookups_per_row(cursor: sqlite3.Cursor, metadatas: list):
+    for metadata in metadatas:
+        for key in config.ID_KEYS:
+            scan_media.get_or_create_id(cursor, key, metadata.get(key, None))
+        for key in config.IDS_KEYS:
+            value = metadata.get(key, None)
+            scan_media.get_or_create_ids(cursor, key, value.split(", ") if value else [])
+
+
+def lookups_cached(cursor: sqlite3.Cursor, metadatas: list):
+    names = {key: scan_media.NameIds(cursor, key) for key in config.ID_KEYS + config.IDS_KEYS}
+    for start in range(0, len(metadatas), config.SCAN_BATCH_SIZE):
+        for metadata in metadatas[start:start + config.SCAN_BATCH_SIZE]:
+            for key in config.ID_KEYS:
+                names[key].add(metadata.get(key, None))
+            for key in config.IDS_KEYS:
+                for name in scan_media.split_names(metadata.get(key, None)):
+                    names[key].add(name)
+        for key in config.ID_KEYS + config.IDS_KEYS:
+            names[key].flush(cursor)
+
+
+def measure(conn: sqlite3.Connection, func, *args) -> tuple:
+    """Run func(cursor, *args) in one transaction. Returns (seconds, StatementCounter, return value of func)."""
+    counter = StatementCounter()
+    conn.set_trace_callback(counter)
+    start = time.perf_counter()
+    ret = func(conn.cursor(), *args)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.set_trace_callback(None)
+    return elapsed, counter, ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQL statements per track during a scan.")
+    parser.add_argument("directory", nargs="?", default=config.MEDIA_DIR)
+    parser.add_argument("--workers", type=int, default=config.SCAN_WORKERS, help="number of processes reading tags")
+    parser.add_argument("--top", type=int, default=8, help="show the N most frequent statements of the scan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = new_database(tmp, "scan.db")
+        art_dir = art_store.ART_DIR
+        art_store.ART_DIR = os.path.join(tmp, "art")  # inherited by the forked scan workers
+        try:
+            elapsed, counter, stats = measure(conn, scan_media.scan_basics, True, args.workers, args.directory)
+        finally:
+            art_store.ART_DIR = art_dir
+        conn.close()
+        n_tracks = stats["new"]
+        if not n_tracks:
+            print(f"No audio files found in {args.directory}")
+            sys.exit(1)
+
+        print(f"full scan of {n_tracks} tracks: {elapsed:.2f} s, "
+              f"{counter.total()} statements, {counter.total() / n_tracks:.1f} per track")
+        for statement, count in counter.counts.most_common(args.top):
+            print(f"    {count / n_tracks:>7.2f}/track  {statement}")
+
+        # the same ID lookups, without reading files or writing tracks
+        conn = sqlite3.connect(os.path.join(tmp, "scan.db"))
+        metadatas = [dict(zip(("album", "genre", "organization", "artist"), row)) for row in conn.execute(
+            """
+            SELECT albums.album_name, genres.genre_name, organizations.organization_name,
+                   (SELECT group_concat(artist_name, ', ') FROM artists_music
+                    JOIN artists ON artists.artist_id = artists_music.artist_id
+                    WHERE artists_music.music_id = music.music_id)
+            FROM music
+            LEFT JOIN albums ON albums.album_id = music.album_id
+            LEFT JOIN genres ON genres.genre_id = music.genre_id
+            LEFT JOIN organizations ON organizations.organization_id = music.organization_id
+            ORDER BY music.music_id
+            """
+        )]
+        conn.close()
+
+        print(f"ID lookups for {n_tracks} tracks:")
+        results = {}
+        for name, func in (("per row", lookups_per_row), ("cached", lookups_cached)):
+            conn = new_database(tmp, f"{name.replace(' ', '_')}.db")
+            results[name] = measure(conn, func, metadatas)
+            conn.close()
+            elapsed, counter, _ = results[name]
+            print(f"{name:>12}: {elapsed * 1000:.1f} ms, {counter.total()} statements, "
+                  f"{counter.total() / n_tracks:.2f} per track")
+        before, after = results["per row"][1].total(), results["cached"][1].total()
+        print(f"statements saved: {100 * (1 - after / before):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Time /search queries against a synthetic library of N tracks (default 500k) in a temporary database.
+
+    python -m backend.bench.bench_search [--tracks 500000] [--repeat 50]
+
+The library is made of random words, so short prefixes match a large share of the tracks, like real libraries do.
+Queries go through backend.db.search.search, i.e. everything /search does except JSON encoding.
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from backend.db import migrations, search
+
+QUERIES = ["a", "lo", "the", "love", "mid nig", "symphony no", "zz", "beatles abbey"]
+
+
+def make_words(rng: random.Random, n: int) -> list:
+    syllables = ["la", "lo", "ve", "the", "mi", "dnig", "sym", "pho", "ny", "no", "bea", "tles", "ab", "bey", "ro", "ad",
+                 "ka", "ze", "ri", "on", "a", "ta", "mu", "si", "ca"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(n)]
+
+
+def build_library(conn: sqlite3.Connection, n_tracks: int, seed: int = 0):
+    """Fill music, albums, artists and genres with random names, then index them like a scan would."""
+    rng = random.Random(seed)
+    words = make_words(rng, 20000)
+    n_albums, n_artists = max(1, n_tracks // 12), max(1, n_tracks // 50)
+
+    def name(k):
+        return " ".join(rng.choice(words) for _ in range(k)).title()
+
+    conn.executemany("INSERT INTO albums (album_id, album_name) VALUES (?, ?)",
+                     ((i, name(rng.randint(1, 3))) for i in range(1, n_albums + 1)))
+    conn.executemany("INSERT INTO artists (artist_id, artist_name) VALUES (?, ?)",
+                     ((i, f"{name(rng.randint(1, 2))} {i}") for i in range(1, n_artists + 1)))
+    conn.executemany("INSERT INTO genres (genre_id, genre_name) VALUES (?, ?)",
+                     ((i, genre) for i, genre in enumerate(["Rock", "Jazz", "Classical", "Pop", "Hip Hop"], start=1)))
+    conn.executemany(
+        "INSERT INTO music (music_id, title, album_id, genre_id, composer, file_path) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, name(rng.randint(1, 5)), rng.randint(1, n_albums), rng.randint(1, 5),
+          name(2) if rng.random() < 0.2 else None, f"/synthetic/{i}.mp3") for i in range(1, n_tracks + 1)),
+    )
+    conn.executemany("INSERT INTO artists_music (artist_id, music_id) VALUES (?, ?)",
+                     ((rng.randint(1, n_artists), i) for i in range(1, n_tracks + 1)))
+    search.index_tracks(conn.cursor())
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full text search.")
+    parser.add_argument("--tracks", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=50, help="runs per query")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "search.db"))
+        migrations.migrate(conn)
+        start = time.perf_counter()
+        build_library(conn, args.tracks)
+        print(f"built and indexed {args.tracks} tracks in {time.perf_counter() - start:.1f} s")
+
+        cursor = conn.cursor()
+        print(f"{'query':<16}{'hits':>8}{'p50 ms':>9}{'p99 ms':>9}")
+        for query in QUERIES:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                hits = search.search(cursor, query, args.limit)
+                times.append((time.perf_counter() - start) * 1000)
+            times.sort()
+            print(f"{query:<16}{len(hits):>8}{times[len(times) // 2]:>9.2f}{times[min(len(times) - 1, len(times) * 99 // 100)]:>9.2f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
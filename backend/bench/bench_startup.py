@@ -0,0 +1,134 @@
+"""
+Measure how long an API worker takes to start, and fail when that goes over budget, as workers are restarted often.
+
+    python -m backend.bench.bench_startup [--runs 7] [--budget-ms 1000] [--own-budget-ms 50] [--serve] [--json out.json]
+
+Every run imports backend.api.main in a fresh interpreter with -X importtime, after one warm-up run that writes the
+bytecode caches. Reported are the medians of the whole import (FastAPI included) and of the time spent in backend.*
+modules themselves, and the slowest modules. --serve also times spawning uvicorn until it answers, and its first
+database query. The exit status is 1 if a median is over its budget, or if the API imports a module only the scanner
+needs (SCANNER_ONLY_MODULES), such as mutagen: those must stay out of the API's import graph.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import http.client
+from backend.config import PROJECT_ROOT
+
+API_MODULE = "backend.api.main"
+IMPORT_BUDGET_MS = 1000  # importing API_MODULE, FastAPI and pydantic included
+OWN_BUDGET_MS = 50  # self time of backend.* modules while importing API_MODULE
+SERVE_BUDGET_MS = 3000  # from spawning uvicorn to the first answered request
+SCANNER_ONLY_MODULES = ["mutagen", "backend.db.scan_media", "backend.db.watch_media", "backend.db.shadow",
+                        "backend.db.migrations", "backend.db.db_setup", "backend.bench"]
+
+
+def import_times(module: str) -> dict:
+    """Import module in a fresh interpreter. Returns {module name: (self us, cumulative us)} from -X importtime."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # restarted workers find the bytecode caches written by the first one
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                           cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if child.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{child.stderr[-2000:]}")
+    ret = {}
+    for line in child.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        ret[name.strip()] = (int(self_us), int(cumulative_us))
+    return ret
+
+
+def time_serve() -> tuple:
+    """Spawn uvicorn and poll it. Returns (ms until GET / answers, ms of the first GET /albums after that)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.api.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+    )
+    try:
+        while time.perf_counter() - start < 30:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                conn.request("GET", "/")
+                conn.getresponse().read()
+                break
+            except OSError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError("uvicorn did not start")
+        ready_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        conn.request("GET", "/albums?limit=1")
+        conn.getresponse().read()
+        conn.close()
+        return ready_ms, (time.perf_counter() - start) * 1000
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API startup time against a budget.")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help=f"import of {API_MODULE}")
+    parser.add_argument("--own-budget-ms", type=float, default=OWN_BUDGET_MS, help="self time of backend.* modules")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn until it answers")
+    parser.add_argument("--serve-budget-ms", type=float, default=SERVE_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to list")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import_times(API_MODULE)  # warm-up
+    runs = [import_times(API_MODULE) for _ in range(args.runs)]
+    import_ms = statistics.median(run[API_MODULE][1] / 1000 for run in runs)
+    own_ms = statistics.median(
+        sum(self_us for name, (self_us, _) in run.items() if name.split(".")[0] == "backend") / 1000 for run in runs)
+    results = {"runs": args.runs, "import_ms": import_ms, "own_ms": own_ms}
+    print(f"import {API_MODULE}: {import_ms:.1f} ms (budget {args.budget_ms:g}), "
+          f"of which backend.*: {own_ms:.1f} ms (budget {args.own_budget_ms:g}), median of {args.runs}")
+
+    by_cumulative = sorted(runs[-1].items(), key=lambda item: -item[1][1])
+    top = [(name, cumulative_us) for name, (_, cumulative_us) in by_cumulative if name != API_MODULE][:args.top]
+    print("slowest imports (cumulative, last run):")
+    for name, cumulative_us in top:
+        print(f"  {name:<48}{cumulative_us / 1000:>9.1f} ms")
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"import takes {import_ms:.1f} ms, over the {args.budget_ms:g} ms budget")
+    if own_ms > args.own_budget_ms:
+        failures.append(f"backend.* modules take {own_ms:.1f} ms, over the {args.own_budget_ms:g} ms budget")
+    scanner_modules = sorted(name for name in runs[-1]
+                             if any(name == module or name.startswith(module + ".") for module in SCANNER_ONLY_MODULES))
+    results["scanner_modules"] = scanner_modules
+    if scanner_modules:
+        failures.append(f"the API imports scanner-only modules: {', '.join(scanner_modules)}")
+
+    if args.serve:
+        ready_ms, first_query_ms = statistics.median_low([time_serve() for _ in range(max(1, args.runs // 2))])
+        results.update(serve_ms=ready_ms, first_query_ms=first_query_ms)
+        print(f"uvicorn answers after {ready_ms:.0f} ms (budget {args.serve_budget_ms:g}), "
+              f"first /albums query {first_query_ms:.1f} ms")
+        if ready_ms > args.serve_budget_ms:
+            failures.append(f"uvicorn takes {ready_ms:.0f} ms to answer, over the {args.serve_budget_ms:g} ms budget")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(results, failures=failures), f, indent=2)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Generate a synthetic media folder of tiny but valid MP3, FLAC and M4A files with realistic tags, for benchmarks.
+
+    python -m backend.bench.synthetic_library <directory> [--tracks 1000] [--seed 0] [--workers 4]
+
+Albums have 6-18 tracks (some on two discs) in Artist/Album (Year)/ folders. Tags are written with mutagen:
+- artist is often "Main Artist, Featured Artist", and compilations have a different artist per track
+- most albums have albumartist, the rest rely on the scanner's fallbacks
+- about half the albums embed their cover art, a quarter have a separate cover.png or folder.png (sometimes next to
+  back.png), the rest have none
+Files are a few KB each: a handful of silent MPEG frames, a FLAC STREAMINFO block or an MP4 sample table, plus tags.
+The same seed gives the same library.
+"""
+import os
+import zlib
+import random
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from mutagen.id3 import ID3, TIT2, TALB, TPE1, TPE2, TRCK, TPOS, TCON, TDRC, TCOM, APIC
+from mutagen.flac import FLAC, Picture
+from mutagen.mp4 import MP4, MP4Cover
+
+GENRES = ["Rock", "Jazz", "Classical", "Pop", "Hip Hop", "Electronic", "Folk", "Metal", "Soul", "Ambient"]
+WORDS = ["love", "night", "blue", "fire", "river", "dream", "city", "light", "heart", "shadow", "gold", "rain",
+         "echo", "wild", "summer", "ghost", "silver", "ocean", "velvet", "storm", "paper", "neon", "glass", "moon"]
+EXTS = [".mp3", ".flac", ".m4a"]
+
+
+def png(seed: int) -> bytes:
+    """A valid 1x1 PNG whose colour (and so content hash) depends on seed."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixel = bytes([0]) + (seed % (1 << 24)).to_bytes(3, "big")
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(pixel)) + chunk(b"IEND", b""))
+
+
+def write_mp3(path: str, frames: int = 8):
+    """Silent MPEG-1 layer III frames, 128 kbps at 44.1 kHz."""
+    with open(path, "wb") as f:
+        f.write((b"\xff\xfb\x90\x00" + b"\x00" * 413) * frames)
+
+
+def write_flac(path: str, seconds: int = 3):
+    """A STREAMINFO block followed by some bytes standing in for audio frames."""
+    sample_rate, samples = 44100, 44100 * seconds
+    # sample rate (20 bits), channels - 1 (3), bits per sample - 1 (5), total samples (36)
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | samples
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00" * 6 + packed.to_bytes(8, "big") + b"\x00" * 16
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo + b"\x00" * 2048)
+
+
+def write_m4a(path: str, seconds: int = 3):
+    """An MP4 with one AAC track, its sample table pointing into an mdat of silence."""
+    def box(kind, payload):
+        return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+    def full_box(kind, payload):
+        return box(kind, b"\x00\x00\x00\x00" + payload)
+
+    timescale, samples_per_frame, frame_size, frames_per_chunk = 44100, 1024, 16, 43
+    n_frames = seconds * timescale // samples_per_frame
+    n_chunks = -(-n_frames // frames_per_chunk)
+
+    def moov(mdat_offset):
+        esds = full_box(b"esds", bytes.fromhex("0319000000041140150000000001f4000001f40005021210060102"))
+        mp4a = box(b"mp4a", b"\x00" * 6 + b"\x00\x01" + b"\x00" * 8 + struct.pack(">HHHHI", 2, 16, 0, 0, timescale << 16) + esds)
+        stbl = box(b"stbl", b"".join([
+            full_box(b"stsd", struct.pack(">I", 1) + mp4a),
+            full_box(b"stts", struct.pack(">III", 1, n_frames, samples_per_frame)),
+            full_box(b"stsc", struct.pack(">IIII", 1, 1, frames_per_chunk, 1)),
+            full_box(b"stsz", struct.pack(">II", frame_size, n_frames)),
+            full_box(b"stco", struct.pack(">I", n_chunks) + b"".join(
+                struct.pack(">I", mdat_offset + i * frames_per_chunk * frame_size) for i in range(n_chunks))),
+        ]))
+        minf = box(b"minf", full_box(b"smhd", b"\x00" * 4) + stbl)
+        hdlr = full_box(b"hdlr", b"\x00" * 4 + b"soun" + b"\x00" * 12 + b"SoundHandler\x00")
+        mdhd = full_box(b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, n_frames * samples_per_frame, 0x55c4, 0))
+        tkhd = full_box(b"tkhd", struct.pack(">IIIII", 0, 0, 1, 0, 0) + b"\x00" * 60)
+        mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, seconds * 1000) + b"\x00" * 80)
+        return box(b"moov", mvhd + box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + minf)))
+
+    ftyp = box(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42isom")
+    mdat_offset = len(ftyp) + len(moov(0)) + 8
+    with open(path, "wb") as f:
+        f.write(ftyp + moov(mdat_offset) + box(b"mdat", b"\x00" * (n_frames * frame_size)))
+
+
+def tag_file(path: str, tags: dict, cover: bytes = None):
+    """Write tags (title, album, artist, albumartist, tracknumber, discnumber, genre, date, composer) and embedded art."""
+    ext = os.path.splitext(path)[1]
+    if ext == ".mp3":
+        frames = {"title": TIT2, "album": TALB, "artist": TPE1, "albumartist": TPE2, "tracknumber": TRCK,
+                  "discnumber": TPOS, "genre": TCON, "date": TDRC, "composer": TCOM}
+        id3 = ID3()
+        for key, value in tags.items():
+            id3.add(frames[key](encoding=3, text=[value]))
+        if cover:
+            id3.add(APIC(encoding=3, mime="image/png", type=3, desc="", data=cover))
+        id3.save(path)
+    elif ext == ".flac":
+        audio = FLAC(path)
+        audio.update({key: value for key, value in tags.items()})
+        if cover:
+            picture = Picture()
+            picture.type, picture.mime, picture.data = 3, "image/png", cover
+            audio.add_picture(picture)
+        audio.save()
+    else:
+        atoms = {"title": "\xa9nam", "album": "\xa9alb", "artist": "\xa9ART", "albumartist": "aART", "genre": "\xa9gen",
+                 "date": "\xa9day", "composer": "\xa9wrt"}
+        audio = MP4(path)
+        for key, value in tags.items():
+            if key in atoms:
+                audio[atoms[key]] = [value]
+        number, _, total = tags["tracknumber"].partition("/")
+        audio["trkn"] = [(int(number), int(total or 0))]
+        number, _, total = tags.get("discnumber", "1/1").partition("/")
+        audio["disk"] = [(int(number), int(total or 0))]
+        if cover:
+            audio["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_PNG)]
+        audio.save()
+
+
+def plan_library(n_tracks: int, seed: int = 0) -> list:
+    """
+    Decide every album and track of a library of n_tracks tracks, without writing anything.
+    Returns:
+        list: One dict per album: {"dir", "art" ("embedded", "separate", "ambiguous" or None), "art_seed", "tracks"}
+            where tracks are (file name, tags) pairs.
+    """
+    rng = random.Random(seed)
+    n_artists = max(2, n_tracks // 40)
+    artists = [f"{' '.join(rng.sample(WORDS, rng.randint(1, 2))).title()} {i}" for i in range(n_artists)]
+    albums = []
+    track_count = 0
+    while track_count < n_tracks:
+        album_no = len(albums)
+        n = min(rng.randint(6, 18), n_tracks - track_count)
+        compilation = rng.random() < 0.1
+        artist = "Various Artists" if compilation else rng.choice(artists)
+        name = f"{' '.join(rng.sample(WORDS, rng.randint(1, 3))).title()} {album_no}"
+        year = str(rng.randint(1960, 2025))
+        discs = 2 if n >= 12 and rng.random() < 0.15 else 1
+        ext = rng.choice(EXTS)
+        with_albumartist = compilation or rng.random() < 0.8
+        tracks = []
+        for i in range(n):
+            disc = 1 + i * discs // n
+            track_artist = rng.choice(artists) if compilation else artist
+            if rng.random() < 0.25:
+                track_artist += ", " + rng.choice(artists)
+            tags = {
+                "title": " ".join(rng.sample(WORDS, rng.randint(1, 4))).title(),
+                "album": name,
+                "artist": track_artist,
+                "tracknumber": f"{i + 1}/{n}",
+                "discnumber": f"{disc}/{discs}",
+                "genre": rng.choice(GENRES),
+                "date": year,
+            }
+            if with_albumartist:
+                tags["albumartist"] = artist
+            if rng.random() < 0.1:
+                tags["composer"] = rng.choice(artists)
+            folder = f"CD{disc}" if discs > 1 else ""
+            tracks.append((os.path.join(folder, f"{i + 1:02d} {tags['title']}{ext}"), tags))
+        art = rng.choices(["embedded", "separate", "ambiguous", None], weights=[50, 20, 5, 25])[0]
+        albums.append({"dir": os.path.join(artist, f"{name} ({year})"), "art": art, "art_seed": seed * 1000003 + album_no,
+                       "tracks": tracks})
+        track_count += n
+    return albums
+
+
+def write_album(args: tuple):
+    root, album = args
+    album_dir = os.path.join(root, album["dir"])
+    cover = png(album["art_seed"])
+    writers = {".mp3": write_mp3, ".flac": write_flac, ".m4a": write_m4a}
+    for file_name, tags in album["tracks"]:
+        path = os.path.join(album_dir, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writers[os.path.splitext(path)[1]](path)
+        tag_file(path, tags, cover if album["art"] == "embedded" else None)
+    if album["art"] == "separate":
+        with open(os.path.join(album_dir, "cover.png" if album["art_seed"] % 2 else "folder.png"), "wb") as f:
+            f.write(cover)
+    elif album["art"] == "ambiguous":  # cover.png wins over back.png
+        for name, data in (("cover.png", cover), ("back.png", png(album["art_seed"] + 1))):
+            with open(os.path.join(album_dir, name), "wb") as f:
+                f.write(data)
+
+
+def generate(root: str, n_tracks: int, seed: int = 0, workers: int = 1) -> int:
+    """Write a library of n_tracks tracks under root. Returns the number of albums."""
+    albums = plan_library(n_tracks, seed)
+    jobs = [(root, album) for album in albums]
+    if workers <= 1:
+        for job in jobs:
+            write_album(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(write_album, jobs, chunksize=16))
+    return len(albums)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic media folder.")
+    parser.add_argument("directory")
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    n_albums = generate(args.directory, args.tracks, args.seed, args.workers)
+    print(f"wrote {args.tracks} tracks in {n_albums} albums to {args.directory}")
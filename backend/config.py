@@ -5,13 +5,20 @@ BE_PATH = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(BE_PATH, ".."))
 # PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 
-# Define important paths
-MEDIA_DIR = os.path.join(PROJECT_ROOT, "media")  # Media files directory
-DB_PATH = os.path.join(PROJECT_ROOT, "media.db")  # SQLite database file
+# Define important paths. Each can be overridden by an environment variable of the same name, e.g. to run the API on
+# a benchmark library.
+MEDIA_DIR = os.environ.get("MEDIA_DIR", os.path.join(PROJECT_ROOT, "media"))  # Media files directory
+DB_PATH = os.environ.get("DB_PATH", os.path.join(PROJECT_ROOT, "media.db"))  # SQLite database file
+ART_DIR = os.environ.get("ART_DIR", os.path.join(PROJECT_ROOT, "art"))  # Album art files, named by content hash
 
 # Define supported audio file extensions
 SUPPORTED_EXTS = [".mp3", ".wav", ".flac", ".m4a"]
 
+# separate album art files: image extensions, and file names (without extension, case-insensitive) preferred, in order,
+# when a folder has more than one image
+IMAGE_EXTS = [".jpg", ".jpeg", ".png"]
+COVER_ART_NAMES = ["cover", "folder", "front", "album", "albumart"]
+
 # id and file_path not included
 AUDIO_METADATA_KEY_TYPES = {
     "title": "TEXT",
@@ -33,6 +40,82 @@ AUDIO_METADATA_KEY_TYPES = {
     "composer": "TEXT",
 }
 
+# file fingerprint stored per track, used to skip unchanged files on rescans
+FILE_STAT_KEY_TYPES = {
+    "file_size": "INTEGER",
+    "file_mtime": "INTEGER",  # st_mtime_ns
+    "file_inode": "INTEGER",
+}
+
+# file info stored per track, so that streaming needs no filesystem lookups
+FILE_INFO_KEY_TYPES = {
+    "mime_type": "TEXT",
+}
+
+# partial content hash stored per track (see scan_media.content_hash), so that moved or renamed files keep their rows
+FILE_HASH_KEY_TYPES = {
+    "content_hash": "TEXT",
+}
+CONTENT_HASH_CHUNK = 64 * 1024  # bytes hashed from the start and from the end of a file
+
+# SQLite settings for long-lived connections (see backend/db/connection.py)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers do not block the writer and vice versa
+    "synchronous": "NORMAL",  # safe with WAL, skips an fsync per commit
+    "busy_timeout": 5000,  # ms to wait for another writer, e.g. a running scan
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16 * 1024,  # KiB per connection
+    "temp_store": "MEMORY",
+}
+SQLITE_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+
+# per-track seek table (see backend/db/seek_index.py), kept out of the music table so that its rows stay small
+SEEK_TABLE_KEY_TYPES = {
+    "music_id": "INTEGER PRIMARY KEY",
+    "seek_table": "BLOB",
+}
+
+# streaming: "file" sends the requested range with FileRangeResponse (sendfile if the server supports it),
+# "generator" streams it through a python generator in 64 KB chunks
+STREAM_MODE = "file"
+STREAM_CHUNK_SIZE = 1024 * 1024
+# worker threads of the API process, shared by sync endpoints and file reads of streams (anyio's default is 40). Each
+# listener whose stream is being read holds one while a chunk is read. Overridable with the API_THREADS variable.
+API_THREADS = int(os.environ.get("API_THREADS", 40))
+# JSON responses of the library read endpoints kept per API process (see backend/api/response_cache.py)
+RESPONSE_CACHE_SIZE = 1024
+
+# scanner: processes reading tags in parallel, and rows written per batch
+SCAN_WORKERS = os.cpu_count() or 1
+SCAN_BATCH_SIZE = 500
+
+# watcher (backend/db/watch_media.py): a rescan starts once no change was seen for WATCH_DEBOUNCE seconds, or at most
+# WATCH_MAX_DELAY seconds after the first change. Without inotify, directories are polled every WATCH_POLL_INTERVAL
+# seconds and everything is rescanned every WATCH_RESCAN_INTERVAL seconds.
+WATCH_DEBOUNCE = 2.0
+WATCH_MAX_DELAY = 30.0
+WATCH_POLL_INTERVAL = 5.0
+WATCH_RESCAN_INTERVAL = 600.0
+
+META_KEY_TYPES = {
+    "key": "TEXT PRIMARY KEY",
+    "value": "",  # any type
+}
+
+ELO_K_FACTOR = 32  # rating points moved by a vote between equally rated albums, times 2
+ELO_DEFAULT_RATING = 1000
+
+VOTE_KEY_TYPES = {
+    "vote_id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "winner_id": "INTEGER",
+    "loser_id": "INTEGER",
+    "voted_at": "REAL",  # unix time
+    "k": "REAL",  # K factor the vote was applied with
+}
+
+# compare_albums?mode=elo pairs an album with one rated at most this many points away
+ELO_PAIR_RANGE = 150
+
 # keys that require special handling
 # (e.g. splitting by comma for multiple values)
 ID_KEYS = ["album", "genre", "organization"]
@@ -41,11 +124,24 @@ IDS_KEYS = ["artist"]
 ALBUM_METADATA_KEY_TYPES = {
     "album_name": "TEXT",
     "album_path": "TEXT",
-    "album_art": "TEXT",
+    # "album_art": "TEXT",  # base64 data URI, replaced by album_art_hash
     # "album_art_path": "TEXT",
+    "album_art_hash": "TEXT",  # see backend/db/art_store.py
     "album_rating": "REAL",
 }
 
+# summaries of an album's tracks kept on the albums table, so that the album list can be sorted by them with an index
+ALBUM_SUMMARY_KEY_TYPES = {
+    "album_artist": "TEXT COLLATE NOCASE",  # album artists, joined with ", "
+    "album_date": "TEXT",  # earliest track date
+    "album_duration": "REAL",  # total duration in seconds
+}
+
+# summaries of a track's links kept on the music table, so that the song list can be sorted by them with an index
+TRACK_SUMMARY_KEY_TYPES = {
+    "track_artist": "TEXT COLLATE NOCASE",  # track artists, joined with ", "
+}
+
 if __name__ == "__main__":
     print("You are running config.py directly.")
     print(f"Project root: {PROJECT_ROOT}")
@@ -0,0 +1,55 @@
+import os
+import re
+import hashlib
+import logging
+from backend.config import ART_DIR
+
+ART_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def art_hash(album_art: bytes) -> str:
+    """Content hash of album art, used as its ID in the art store."""
+    return hashlib.sha256(album_art).hexdigest()
+
+
+def art_path(hash_: str) -> str:
+    """Path of an album art file in the art store. Files are sharded by the first two characters of the hash."""
+    return os.path.join(ART_DIR, hash_[:2], hash_)
+
+
+def is_art_hash(value: str) -> bool:
+    """Check if a string is a well-formed art hash, so that it is safe to use as a path."""
+    return bool(ART_HASH_PATTERN.match(value))
+
+
+def store_art(album_art: bytes) -> str:
+    """
+    Store album art in the art store, unless the same image is already there.
+    Safe to call from several processes at once.
+    Args:
+        album_art (bytes): The raw image.
+    Returns:
+        str: The hash of the image.
+    """
+    hash_ = art_hash(album_art)
+    path = art_path(hash_)
+    if os.path.exists(path):
+        return hash_
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(album_art)
+    os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+    logging.info(f"Stored album art {hash_}.")
+    return hash_
+
+
+def guess_art_mime(head: bytes) -> str:
+    """Guess the MIME type of an image from its first bytes."""
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from backend.config import DB_PATH, SQLITE_PRAGMAS, SQLITE_STATEMENT_CACHE_SIZE
+
+
+def connect(db_path: str = DB_PATH, read_only: bool = False, factory: type = sqlite3.Connection) -> sqlite3.Connection:
+    """Open a connection with SQLITE_PRAGMAS applied (WAL, mmap, cache size, ...). factory is a sqlite3.Connection subclass."""
+    conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+                           factory=factory)
+    for pragma, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections for the API: one read connection per thread, and a single writer shared behind a lock.
+    Connections stay open, so sqlite3's per-connection statement cache lets repeated queries skip preparing.
+    In WAL mode readers never wait for the writer, and the writer only waits for other writers (e.g. a running scan).
+    Connections are made with factory, e.g. metrics.TimedConnection to time queries.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, factory: type = sqlite3.Connection):
+        self.db_path = db_path
+        self.factory = factory
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.writer_conn = None
+
+    def reader(self) -> sqlite3.Connection:
+        """The read-only connection of the calling thread. Do not close it."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path, read_only=True, factory=self.factory)
+            self.local.conn = conn
+            logging.info(f"Opened read connection for thread {threading.get_ident()}.")
+        return conn
+
+    @contextmanager
+    def writer(self, immediate: bool = False):
+        """
+        Hold the writer connection for one transaction. Commits on exit, rolls back on error.
+        With immediate, the transaction starts with BEGIN IMMEDIATE, taking the database write lock before the first
+        read, so that rows read in it cannot be changed by other processes (a scan, other API workers) before it commits.
+        Usage:
+            with pool.writer() as conn:
+                conn.execute(...)
+        """
+        with self.write_lock:
+            if self.writer_conn is None:
+                self.writer_conn = connect(self.db_path, factory=self.factory)
+            try:
+                if immediate:
+                    self.writer_conn.execute("BEGIN IMMEDIATE")
+                yield self.writer_conn
+                self.writer_conn.commit()
+            except BaseException:
+                self.writer_conn.rollback()
+                raise
@@ -1,6 +1,6 @@
 import sqlite3
 import logging
-from backend.config import DB_PATH, AUDIO_METADATA_KEY_TYPES, ALBUM_METADATA_KEY_TYPES, ID_KEYS, IDS_KEYS
+from backend.config import DB_PATH, AUDIO_METADATA_KEY_TYPES, ALBUM_METADATA_KEY_TYPES, FILE_STAT_KEY_TYPES, FILE_INFO_KEY_TYPES, SEEK_TABLE_KEY_TYPES, ID_KEYS, IDS_KEYS
 
 
 def create_table(cursor, table_name, columns, overwrite=True):
@@ -39,51 +39,145 @@ def create_link_table(cursor, table1, table2, col1, col2, overwrite=True):
     )
 
 
-def create_tables():
-    logging.info(f"Creating database and tables at {DB_PATH}...")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def check_columns(cursor: sqlite3.Cursor, table: str, columns_and_types: dict) -> list:
+    """Check if the columns exist in the table. If not, add them. Returns newly added columns."""
+    logging.info(f"Checking columns for {table}...")
+
+    # check if table exists
+    cursor.execute(f"SELECT * FROM {table} LIMIT 1")
+    if not cursor.description:
+        logging.error(f"Table {table} does not exist.")
+        return
+
+    # check if columns exist
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing_columns = [row[1] for row in cursor.fetchall()]
+    ret = []
+    # for column in columns:
+    for column in columns_and_types.keys():
+        if column in existing_columns:
+            continue
+        cursor.execute(
+            f"ALTER TABLE {table} ADD COLUMN {column} {columns_and_types[column]}"
+        )
+        logging.info(f"Added column {column} to {table}.")
+        ret.append(column)
+
+    logging.info(f"Checked columns for {table}.")
+    return ret
 
+
+def ensure_default_entries(cursor):
+    """Ensure default entries of NULL for artist and album where we cannot fetch them. Also, adds default elo rating for albums."""
+    cursor.execute("INSERT OR IGNORE INTO artists (artist_id, artist_name) VALUES (0, NULL)")
+    cursor.execute("INSERT OR IGNORE INTO albums (album_id, album_name) VALUES (0, NULL)")
+    cursor.execute("INSERT OR IGNORE INTO genres (genre_id, genre_name) VALUES (0, NULL)")
+    cursor.execute("INSERT OR IGNORE INTO organizations (organization_id, organization_name) VALUES (0, NULL)")
+
+
+def create_schema(cursor, overwrite=False):
+    """Create the tables of the baseline schema. With overwrite, existing tables are dropped first."""
     # TODO: add added_at
     music_key_types = AUDIO_METADATA_KEY_TYPES.copy()
     music_key_types["music_id"] = "INTEGER PRIMARY KEY AUTOINCREMENT"
     music_key_types["file_path"] = "TEXT UNIQUE NOT NULL"
+    music_key_types.update(FILE_STAT_KEY_TYPES)
+    music_key_types.update(FILE_INFO_KEY_TYPES)
     # [music_key_types.update({f"{key}_id": "INTEGER"}) for key in ID_KEYS] 
     for key in ID_KEYS:
         music_key_types[f"{key}_id"] = "INTEGER"
         # music_key_types.pop(key)
     # for key in IDS_KEYS:
     #     music_key_types.pop(key)
-    create_table(cursor, "music", music_key_types)
+    create_table(cursor, "music", music_key_types, overwrite)
     
     album_key_types = ALBUM_METADATA_KEY_TYPES.copy()
     album_key_types["album_id"] = "INTEGER PRIMARY KEY"
-    create_table(cursor, "albums", album_key_types)
+    create_table(cursor, "albums", album_key_types, overwrite)
     
     artist_key_types = {"artist_id": "INTEGER PRIMARY KEY AUTOINCREMENT", "artist_name": "TEXT UNIQUE"}
-    create_table(cursor, "artists", artist_key_types)
+    create_table(cursor, "artists", artist_key_types, overwrite)
     
     genre_key_types = {"genre_id": "INTEGER PRIMARY KEY AUTOINCREMENT", "genre_name": "TEXT UNIQUE"}
-    create_table(cursor, "genres", genre_key_types)
+    create_table(cursor, "genres", genre_key_types, overwrite)
+    
+    create_table(cursor, "seek_tables", SEEK_TABLE_KEY_TYPES, overwrite)
     
     organization_key_types = {"organization_id": "INTEGER PRIMARY KEY AUTOINCREMENT", "organization_name": "TEXT UNIQUE"}
-    create_table(cursor, "organizations", organization_key_types)
+    create_table(cursor, "organizations", organization_key_types, overwrite)
     
     # tables to link artists-(music, albums)
-    create_link_table(cursor, "artists", "music", "artist", "music")
-    create_link_table(cursor, "artists", "albums", "artist", "album")
-    
-    for table in ID_KEYS + IDS_KEYS:
-        cursor.execute(f"INSERT INTO {table}s ({table}_id, {table}_name) VALUES (0, NULL)")
-    
-    # insert column "album_art_path" into albums table
-    # cursor.execute("ALTER TABLE albums ADD COLUMN album_art_path TEXT")
-    
-    conn.commit()
+    create_link_table(cursor, "artists", "music", "artist", "music", overwrite)
+    create_link_table(cursor, "artists", "albums", "artist", "album", overwrite)
+
+
+def fill_album_summaries(cursor: sqlite3.Cursor, album_ids: list = None):
+    """Recompute album_artist, album_date and album_duration from the tracks and album artists, for all albums or the given ones."""
+    update = """
+        UPDATE albums SET
+            album_artist = (
+                SELECT group_concat(artist_name, ', ') FROM (
+                    SELECT artists.artist_name FROM artists_albums
+                    JOIN artists ON artists.artist_id = artists_albums.artist_id
+                    WHERE artists_albums.album_id = albums.album_id AND artists.artist_name IS NOT NULL
+                    ORDER BY artists.artist_name
+                )
+            ),
+            album_date = (SELECT MIN(date) FROM music WHERE music.album_id = albums.album_id),
+            album_duration = (SELECT SUM(duration) FROM music WHERE music.album_id = albums.album_id)
+        """
+    if album_ids is None:
+        cursor.execute(update)
+        return
+    for start in range(0, len(album_ids), 500):
+        chunk = album_ids[start:start + 500]
+        cursor.execute(f"{update} WHERE album_id IN ({','.join(['?'] * len(chunk))})", chunk)
+
+
+def create_tables(overwrite=False):
+    """
+    Create the database, or bring an existing one up to the current schema version (see migrations.py).
+    With overwrite, all tables are dropped and created again, which loses ratings.
+    """
+    from backend.db import migrations
+
+    logging.info(f"Creating database and tables at {DB_PATH}...")
+    conn = sqlite3.connect(DB_PATH)
+    if overwrite:
+        create_schema(conn.cursor(), overwrite=True)
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+    migrations.migrate(conn)
     conn.close()
     logging.info("Database and tables created successfully.")
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Create the database or migrate it to the current schema.")
+    parser.add_argument("--reset", action="store_true", help="drop all tables first (loses ratings; "
+                        "python -m backend.db.scan_media --rebuild keeps them)")
+    args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    create_tables()
+    create_tables(overwrite=args.reset)
+
+
+def fill_track_summaries(cursor: sqlite3.Cursor, music_ids: list = None):
+    """Recompute track_artist from the track's artists, for all tracks or the given ones."""
+    update = """
+        UPDATE music SET
+            track_artist = (
+                SELECT group_concat(artist_name, ', ') FROM (
+                    SELECT artists.artist_name FROM artists_music
+                    JOIN artists ON artists.artist_id = artists_music.artist_id
+                    WHERE artists_music.music_id = music.music_id AND artists.artist_name IS NOT NULL
+                    ORDER BY artists.artist_name
+                )
+            )
+        """
+    if music_ids is None:
+        cursor.execute(update)
+        return
+    for start in range(0, len(music_ids), 500):
+        chunk = music_ids[start:start + 500]
+        cursor.execute(f"{update} WHERE music_id IN ({','.join(['?'] * len(chunk))})", chunk)
@@ -0,0 +1,27 @@
+import sqlite3
+
+# Small key -> value settings and counters of the library, in the meta table.
+# library_version is bumped by every scan that changes the library, and ratings_version by every change of album
+# ratings (votes, replays), so that readers caching album lists or responses can tell.
+
+
+def get_meta(cursor: sqlite3.Cursor, key: str, default=None):
+    cursor.execute("SELECT value FROM meta WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    return row[0] if row else default
+
+
+def set_meta(cursor: sqlite3.Cursor, key: str, value):
+    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def bump_version(cursor: sqlite3.Cursor, key: str) -> int:
+    """Increment a version counter (library_version, ratings_version) and return the new value."""
+    version = get_meta(cursor, key, 0) + 1
+    set_meta(cursor, key, version)
+    return version
+
+
+def bump_library_version(cursor: sqlite3.Cursor) -> int:
+    """Increment library_version and return the new value."""
+    return bump_version(cursor, "library_version")
@@ -0,0 +1,236 @@
+import sys
+import sqlite3
+import logging
+import backend.config as config
+from backend.db import db_setup, search
+
+
+# Each migration takes the database from version i to i + 1, where i is its index in MIGRATIONS.
+# The version is kept in PRAGMA user_version. Never edit a migration that has shipped; append a new one instead.
+
+
+def migration_1(cursor: sqlite3.Cursor):
+    """Baseline schema. Creates missing tables and adds missing columns, so it also upgrades databases made before versioning."""
+    db_setup.create_schema(cursor, overwrite=False)
+    music_key_types = config.AUDIO_METADATA_KEY_TYPES.copy()
+    music_key_types["file_path"] = "TEXT"
+    music_key_types.update(config.FILE_STAT_KEY_TYPES)
+    music_key_types.update(config.FILE_INFO_KEY_TYPES)
+    for key in config.ID_KEYS:
+        music_key_types[f"{key}_id"] = "INTEGER"
+    db_setup.check_columns(cursor, "music", music_key_types)
+    db_setup.check_columns(cursor, "artists", {"artist_name": "TEXT"})
+    db_setup.check_columns(cursor, "albums", config.ALBUM_METADATA_KEY_TYPES)
+    db_setup.ensure_default_entries(cursor)
+
+
+def migration_2(cursor: sqlite3.Cursor):
+    """Covering indexes for the album page and the album list."""
+    # tracks of an album; music_id is the rowid, so it is in the index too
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_music_album ON music (album_id, tracknumber, title)")
+    # the primary keys of the link tables start with artist_id, so lookups the other way need their own index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_artists_music_music ON artists_music (music_id, artist_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_artists_albums_album ON artists_albums (album_id, artist_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_rating ON albums (album_rating)")
+
+
+def migration_3(cursor: sqlite3.Cursor):
+    """Album artist, date and duration on the albums table, with indexes for each sort of the album list."""
+    db_setup.check_columns(cursor, "albums", config.ALBUM_SUMMARY_KEY_TYPES)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_name ON albums (album_name COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_artist ON albums (album_artist)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_date ON albums (album_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_duration ON albums (album_duration)")
+    # filled by the next scan; fill them now so the sorts work without one
+    db_setup.fill_album_summaries(cursor)
+
+
+def migration_4(cursor: sqlite3.Cursor):
+    """Full text search index over tracks (see search.py)."""
+    search.create_search_index(cursor)
+    search.index_tracks(cursor)
+
+
+def migration_5(cursor: sqlite3.Cursor):
+    """meta table, holding library_version among others (see meta.py)."""
+    db_setup.create_table(cursor, "meta", config.META_KEY_TYPES, overwrite=False)
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('library_version', 0)")
+
+
+def migration_6(cursor: sqlite3.Cursor):
+    """votes log (see ratings.py). Current ratings become the base ratings that the log is replayed from."""
+    db_setup.create_table(cursor, "votes", config.VOTE_KEY_TYPES, overwrite=False)
+    db_setup.check_columns(cursor, "albums", {"album_base_rating": "REAL"})
+    cursor.execute("UPDATE albums SET album_base_rating = album_rating")
+
+
+def migration_7(cursor: sqlite3.Cursor):
+    """Partial content hash of each file, so that moved files keep their rows. Stored as files are (re)scanned."""
+    db_setup.check_columns(cursor, "music", config.FILE_HASH_KEY_TYPES)
+
+
+def migration_8(cursor: sqlite3.Cursor):
+    """Track artist on the music table, with indexes for each sort of the song list."""
+    db_setup.check_columns(cursor, "music", config.TRACK_SUMMARY_KEY_TYPES)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_music_title ON music (title COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_music_artist ON music (track_artist)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_music_date ON music (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_music_duration ON music (duration)")
+    # filled by the next scan; fill it now so the sorts work without one
+    db_setup.fill_track_summaries(cursor)
+
+
+MIGRATIONS = [migration_1, migration_2, migration_3, migration_4, migration_5, migration_6, migration_7, migration_8]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply the pending migrations, each in its own transaction. Returns the schema version."""
+    version = get_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION}).")
+    if conn.in_transaction:
+        conn.commit()
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[target - 1]
+        logging.info(f"Migrating database to version {target}: {migration.__doc__.splitlines()[0]}")
+        conn.execute("BEGIN")
+        try:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return SCHEMA_VERSION
+
+
+# Hot queries of the API with the indexes their plans must use.
+HOT_QUERIES = {
+    "album tracks": (
+        """
+        SELECT music.album_id, music.music_id, music.tracknumber, music.title, artists.artist_name
+        FROM music
+        LEFT JOIN artists_music ON artists_music.music_id = music.music_id
+        LEFT JOIN artists ON artists.artist_id = artists_music.artist_id
+        WHERE music.album_id IN (?, ?)
+        ORDER BY music.album_id, music.music_id, artists.artist_id
+        """,
+        (1, 2),
+        ["idx_music_album", "idx_artists_music_music"],
+    ),
+    "album artists": (
+        """
+        SELECT albums.album_id, albums.album_name, albums.album_art_hash, artists.artist_name
+        FROM albums
+        LEFT JOIN artists_albums ON artists_albums.album_id = albums.album_id
+        LEFT JOIN artists ON artists.artist_id = artists_albums.artist_id
+        WHERE albums.album_id IN (?, ?)
+        """,
+        (1, 2),
+        ["idx_artists_albums_album"],
+    ),
+    "albums by rating": (
+        "SELECT album_id, album_rating FROM albums ORDER BY album_rating DESC LIMIT ?",
+        (50,),
+        ["idx_albums_rating"],
+    ),
+    "albums by name, next page": (
+        """
+        SELECT album_id, album_name FROM albums
+        WHERE album_name IS NOT NULL AND (album_name, album_id) > (? COLLATE NOCASE, ?)
+        ORDER BY album_name COLLATE NOCASE, album_id LIMIT ?
+        """,
+        ("m", 1, 50),
+        ["idx_albums_name"],
+    ),
+    "albums by artist, next page": (
+        """
+        SELECT album_id, album_artist FROM albums
+        WHERE album_artist IS NOT NULL AND (album_artist, album_id) < (?, ?)
+        ORDER BY album_artist DESC, album_id DESC LIMIT ?
+        """,
+        ("m", 1, 50),
+        ["idx_albums_artist"],
+    ),
+    "songs by name, next page": (
+        """
+        SELECT music_id, title, track_artist FROM music
+        WHERE title IS NOT NULL AND (title, music_id) > (? COLLATE NOCASE, ?)
+        ORDER BY title COLLATE NOCASE, music_id LIMIT ?
+        """,
+        ("m", 1, 100),
+        ["idx_music_title"],
+    ),
+    "songs by date, next page": (
+        """
+        SELECT music_id, title, track_artist FROM music
+        WHERE date IS NOT NULL AND (date, music_id) < (?, ?)
+        ORDER BY date DESC, music_id DESC LIMIT ?
+        """,
+        ("2000", 1, 100),
+        ["idx_music_date"],
+    ),
+    "search": (
+        """
+        SELECT music.music_id, music.title, music.album_id, albums.album_name, hits.artist_name
+        FROM (
+            SELECT rowid, artist_name, rank FROM search_index WHERE search_index MATCH ? ORDER BY rank LIMIT ?
+        ) AS hits
+        JOIN music ON music.music_id = hits.rowid
+        LEFT JOIN albums ON albums.album_id = music.album_id
+        ORDER BY hits.rank
+        """,
+        ('"so"*', 20),
+        ["VIRTUAL TABLE INDEX", "SEARCH music USING INTEGER PRIMARY KEY"],
+    ),
+    "song file": (
+        "SELECT file_path, file_size, file_mtime, file_inode, mime_type FROM music WHERE music_id = ?",
+        (1,),
+        ["INTEGER PRIMARY KEY"],
+    ),
+}
+
+
+def explain(cursor: sqlite3.Cursor, query: str, params: tuple = ()) -> list:
+    """The details of EXPLAIN QUERY PLAN for a query, one line per step."""
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+
+def check_query_plans(cursor: sqlite3.Cursor) -> list:
+    """
+    Check that every query in HOT_QUERIES uses its indexes. Logs each plan.
+    Returns a list of (query name, missing index) for the failures.
+    """
+    failures = []
+    for name, (query, params, indexes) in HOT_QUERIES.items():
+        plan = explain(cursor, query, params)
+        logging.info(f"{name}:\n    " + "\n    ".join(plan))
+        for index in indexes:
+            if not any(index in step for step in plan):
+                failures.append((name, index))
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date.")
+    parser.add_argument("--check", action="store_true", help="also check the query plans of the hot queries")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = sqlite3.connect(config.DB_PATH)
+    logging.info(f"Database at version {get_version(conn)}, code at version {SCHEMA_VERSION}.")
+    migrate(conn)
+    if args.check:
+        failures = check_query_plans(conn.cursor())
+        for name, index in failures:
+            logging.error(f"Query '{name}' does not use {index}.")
+        conn.close()
+        sys.exit(1 if failures else 0)
+    conn.close()
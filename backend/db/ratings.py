@@ -0,0 +1,115 @@
+import time
+import sqlite3
+import logging
+from backend.config import DB_PATH, ELO_K_FACTOR, ELO_DEFAULT_RATING
+from backend.db import meta
+from backend.db.connection import connect
+
+# Album Elo ratings. Every vote is appended to the votes table and applied to albums.album_rating in the same
+# transaction, so album_rating always equals a replay of the log from album_base_rating (the rating an album had before
+# votes were logged) with the K factor logged with each vote.
+
+
+def elo_update(winner_rating: float, loser_rating: float, k: float = ELO_K_FACTOR) -> tuple:
+    """New (winner, loser) ratings after a vote, rounded to whole points."""
+    expected_winner = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+    expected_loser = 1 - expected_winner
+    return round(winner_rating + k * (1 - expected_winner)), round(loser_rating + k * (0 - expected_loser))
+
+
+def record_vote(cursor: sqlite3.Cursor, winner_id: int, loser_id: int, k: float = ELO_K_FACTOR) -> tuple:
+    """
+    Log a vote, update both ratings and bump ratings_version. Run it inside a BEGIN IMMEDIATE transaction, so that no other vote can change
+    the ratings between reading and writing them.
+    Returns:
+        tuple: (winner rating, loser rating, new winner rating, new loser rating)
+    """
+    cursor.execute("SELECT album_id, album_rating FROM albums WHERE album_id IN (?, ?)", (winner_id, loser_id))
+    ratings = {album_id: rating for album_id, rating in cursor.fetchall()}
+    for album_id in (winner_id, loser_id):
+        if ratings.get(album_id) is None:
+            logging.info(f"No rating found for album ID {album_id}")
+    winner_rating = ratings.get(winner_id) or ELO_DEFAULT_RATING
+    loser_rating = ratings.get(loser_id) or ELO_DEFAULT_RATING
+    new_winner_rating, new_loser_rating = elo_update(winner_rating, loser_rating, k)
+
+    cursor.execute(
+        "INSERT INTO votes (winner_id, loser_id, voted_at, k) VALUES (?, ?, ?, ?)",
+        (winner_id, loser_id, time.time(), k),
+    )
+    cursor.executemany(
+        "UPDATE albums SET album_rating = ? WHERE album_id = ?",
+        [(new_winner_rating, winner_id), (new_loser_rating, loser_id)],
+    )
+    meta.bump_version(cursor, "ratings_version")
+    return winner_rating, loser_rating, new_winner_rating, new_loser_rating
+
+
+def replay(cursor: sqlite3.Cursor, k: float = None) -> dict:
+    """
+    Recompute every album rating from album_base_rating and the votes log in one pass, without writing anything.
+    With k, every vote is replayed with that K factor instead of the logged one.
+    Returns:
+        dict: album_id -> rating, for every album.
+    """
+    cursor.execute("SELECT album_id, album_base_rating FROM albums")
+    album_ids = []
+    ratings = []  # dense, so that the loop below only indexes lists
+    position = {}
+    for album_id, base_rating in cursor.fetchall():
+        position[album_id] = len(album_ids)
+        album_ids.append(album_id)
+        ratings.append(base_rating if base_rating is not None else ELO_DEFAULT_RATING)
+
+    cursor.execute("SELECT winner_id, loser_id, k FROM votes ORDER BY vote_id")
+    skipped = 0
+    for winner_id, loser_id, logged_k in cursor:
+        w, l = position.get(winner_id), position.get(loser_id)
+        if w is None or l is None:  # album removed since
+            skipped += 1
+            continue
+        ratings[w], ratings[l] = elo_update(ratings[w], ratings[l], k if k is not None else logged_k)
+    if skipped:
+        logging.info(f"Skipped {skipped} votes on albums that no longer exist.")
+    return dict(zip(album_ids, ratings))
+
+
+def write_ratings(cursor: sqlite3.Cursor, ratings: dict):
+    cursor.executemany("UPDATE albums SET album_rating = ? WHERE album_id = ?", [(r, a) for a, r in ratings.items()])
+    meta.bump_version(cursor, "ratings_version")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Recompute album ratings from the votes log.")
+    parser.add_argument("--k", type=float, default=None, help="Elo K factor to replay with (default: the logged ones)")
+    parser.add_argument("--write", action="store_true", help="store the replayed ratings (otherwise only compare)")
+    parser.add_argument("--top", type=int, default=20, help="number of albums to list")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = connect(DB_PATH)
+    cursor = conn.cursor()
+    if args.write:  # no vote may commit between the replay and the write, or it would be lost from album_rating
+        cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT COUNT(*) FROM votes")
+    n_votes = cursor.fetchone()[0]
+    start = time.perf_counter()
+    replayed = replay(cursor, args.k)
+    logging.info(f"Replayed {n_votes} votes on {len(replayed)} albums with K = {args.k or 'as logged'} "
+                 f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    cursor.execute("SELECT album_id, album_name, album_rating FROM albums")
+    current = {album_id: (name, rating) for album_id, name, rating in cursor.fetchall()}
+    print(f"{'album':<40}{'current':>10}{'replayed':>10}")
+    for album_id in sorted(replayed, key=lambda album_id: -replayed[album_id])[:args.top]:
+        name, rating = current[album_id]
+        print(f"{str(name)[:38]:<40}{rating if rating is not None else float('nan'):>10.0f}{replayed[album_id]:>10.0f}")
+    changed = sum(1 for album_id, rating in replayed.items() if current[album_id][1] != rating)
+    print(f"{changed} of {len(replayed)} ratings differ from the current ones.")
+
+    if args.write:
+        write_ratings(cursor, replayed)
+        conn.commit()
+        logging.info("Stored the replayed ratings.")
+    conn.close()
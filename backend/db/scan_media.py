@@ -1,68 +1,35 @@
 import os
+import json
+import mmap
+import time
 import sqlite3
 import logging
 import base64
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from mutagen.easyid3 import EasyID3
 from mutagen.id3 import ID3
 from mutagen.mp3 import MP3
 from mutagen.flac import FLAC
 from mutagen.wavpack import WavPack
 from mutagen.mp4 import MP4
-import sys
-print(sys.path)
-from backend.config import MEDIA_DIR, DB_PATH, SUPPORTED_EXTS, AUDIO_METADATA_KEY_TYPES, ID_KEYS, IDS_KEYS
+from backend.config import MEDIA_DIR, DB_PATH, SUPPORTED_EXTS, IMAGE_EXTS, COVER_ART_NAMES, AUDIO_METADATA_KEY_TYPES, FILE_STAT_KEY_TYPES, FILE_INFO_KEY_TYPES, FILE_HASH_KEY_TYPES, ID_KEYS, IDS_KEYS
 import backend.config as config
-from backend.db import utils
+from backend.db import utils, art_store, seek_index, migrations, db_setup, search, meta, shadow
+from backend.db.connection import connect
 
 
-def ensure_default_entries(cursor):
-    """Ensure default entries of NULL for artist and album where we cannot fetch them. Also, adds default elo rating for albums."""
-    cursor.execute("INSERT OR IGNORE INTO artists (artist_id, artist_name) VALUES (0, NULL)")
-    cursor.execute("INSERT OR IGNORE INTO albums (album_id, album_name) VALUES (0, NULL)")
-    cursor.execute("INSERT OR IGNORE INTO genres (genre_id, genre_name) VALUES (0, NULL)")
-    cursor.execute("INSERT OR IGNORE INTO organizations (organization_id, organization_name) VALUES (0, NULL)")
-    
-
-
-def check_columns(cursor: sqlite3.Cursor, table: str, columns_and_types: dict) -> list:
-    """Check if the columns exist in the table. If not, add them. Returns newly added columns."""
-    logging.info(f"Checking columns for {table}...")
-
-    # check if table exists
-    cursor.execute(f"SELECT * FROM {table} LIMIT 1")
-    if not cursor.description:
-        logging.error(f"Table {table} does not exist.")
-        return
-
-    # check if columns exist
-    cursor.execute(f"PRAGMA table_info({table})")
-    existing_columns = [row[1] for row in cursor.fetchall()]
-    ret = []
-    # for column in columns:
-    for column in columns_and_types.keys():
-        if column in existing_columns:
-            continue
-        cursor.execute(
-            f"ALTER TABLE {table} ADD COLUMN {column} {columns_and_types[column]}"
-        )
-        logging.info(f"Added column {column} to {table}.")
-        ret.append(column)
-
-    logging.info(f"Checked columns for {table}.")
-    return ret
-
-
-def extract_metadata(file_path: str) -> dict:
-    """Extract metadata from an audio file."""
+def open_audio(file_path: str):
+    """Parse an audio file with mutagen. MP3s are parsed with full ID3 tags so that both tags and pictures can be read."""
     try:
         if file_path.lower().endswith(".mp3"):
-            audio = MP3(file_path, ID3=EasyID3)
+            return MP3(file_path, ID3=ID3)
         elif file_path.lower().endswith(".flac"):
-            audio = FLAC(file_path)
+            return FLAC(file_path)
         elif file_path.lower().endswith(".wav"):
-            audio = WavPack(file_path)
+            return WavPack(file_path)
         elif file_path.lower().endswith(".m4a"):
-            audio = MP4(file_path)
+            return MP4(file_path)
         else:
             logging.error(
                 f"Unsupported file format for {file_path}. Extension must be one of: .mp3, .flac, .wav, .m4a"
@@ -74,21 +41,102 @@ def extract_metadata(file_path: str) -> dict:
     except Exception as e:
         logging.error(f"Failed to read audio file {file_path}: {e}")
         return None
-    if not audio:
-        logging.error(f"Failed to read audio file {file_path}.")
+
+
+def get_tag(audio, key: str):
+    """Get the first value of a tag by its EasyID3-style key (e.g. "title", "tracknumber"), or None."""
+    if isinstance(audio.tags, ID3):
+        # same key -> frame mapping as EasyID3, without parsing the file again
+        getter = EasyID3.Get.get(key)
+        try:
+            return getter(audio.tags, key)[0] if getter else None
+        except KeyError:
+            return None
+    return audio.get(key, [None])[0]
+
+
+def get_embedded_art(audio) -> bytes:
+    """Get the embedded album art of parsed audio, or None."""
+    if isinstance(audio.tags, ID3):
+        if "APIC:" in audio.tags:
+            return audio.tags["APIC:"].data
+        pictures = audio.tags.getall("APIC")
+        return pictures[0].data if pictures else None
+    if isinstance(audio, FLAC):
+        return audio.pictures[0].data if audio.pictures else None
+    if isinstance(audio, MP4):
+        return bytes(audio["covr"][0]) if "covr" in audio and len(audio["covr"]) > 0 else None
+    return None
+
+
+def read_album_art(audio, file_path: str, cover_path: str = None) -> bytes:
+    """
+    Get the album art of parsed audio. If not embedded, read the separate album art file cover_path, as found by a
+    CoverIndex ("" if there is none), or look for one next to the file if cover_path is None.
+    """
+    album_art = get_embedded_art(audio)
+    if album_art:
+        return album_art
+    separate_albumart = cover_path if cover_path is not None else find_separate_albumart(os.path.dirname(file_path))
+    if not separate_albumart:
         return None
+    with open(separate_albumart, "rb") as f:
+        return f.read()
+
+
+def add_timing(timings: dict, step: str, start: float) -> float:
+    """Add the seconds since start (a time.perf_counter value) to timings[step]. Returns the current time."""
+    now = time.perf_counter()
+    timings[step] = timings.get(step, 0.0) + now - start
+    return now
+
+
+def extract_file(file_path: str, want_art: bool = True, cover_path: str = None, timings: dict = None) -> tuple:
+    """
+    Extract metadata and album art from an audio file, parsing it only once.
+    Args:
+        file_path (str): The audio file.
+        want_art (bool): Also read the album art. Set to False if only the tags are needed.
+        cover_path (str): The separate album art file, if already looked up. See read_album_art.
+        timings (dict): If given, seconds spent parsing the file and reading its tags are added to timings["parse"],
+            and reading the album art to timings["art"].
+    Returns:
+        tuple: (metadata, album_art). metadata is None if the file could not be read, album_art is the raw image bytes or None.
+    """
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
     try:
+        audio = open_audio(file_path)
+        if not audio:
+            if audio is not None:
+                logging.error(f"Failed to read audio file {file_path}.")
+            return None, None
         ret = {"duration": audio.info.length if audio.info else 0, "file_path": file_path}
         for key in AUDIO_METADATA_KEY_TYPES.keys():
             if key in ret.keys():
                 continue
-            ret[key.replace("_id", "")] = audio.get(key.replace("_id", ""), [None])[0]
+            ret[key.replace("_id", "")] = get_tag(audio, key.replace("_id", ""))
         for key in IDS_KEYS:
-            ret[key] = audio.get(key, [None])[0]
-        return ret
+            ret[key] = get_tag(audio, key)
     except Exception as e:
         logging.error(f"Failed to read metadata for {file_path}: {e}")
-        return None
+        return None, None
+    finally:
+        start = add_timing(timings, "parse", start)
+    if not want_art:
+        return ret, None
+    try:
+        return ret, read_album_art(audio, file_path, cover_path)
+    except Exception as e:
+        logging.error(f"Failed to extract album art from {file_path}: {e}")
+        return ret, None
+    finally:
+        add_timing(timings, "art", start)
+
+
+def extract_metadata(file_path: str) -> dict:
+    """Extract metadata from an audio file."""
+    return extract_file(file_path, want_art=False)[0]
 
 
 def get_or_create_id(cursor, table_wo_s, value):
@@ -106,6 +154,60 @@ def get_or_create_id(cursor, table_wo_s, value):
     return cursor.lastrowid, True
 
 
+def is_image_file(name: str) -> bool:
+    return not name.startswith(".") and any(name.lower().endswith(ext) for ext in IMAGE_EXTS)
+
+
+def pick_cover(candidates: list) -> str:
+    """
+    Choose the album art among image files: the only one, else the first named like COVER_ART_NAMES (e.g. cover.jpg
+    before folder.jpg). Returns None if there are several and none of them has such a name.
+    """
+    if len(candidates) == 1:
+        return candidates[0]
+    by_name = {}
+    for candidate in sorted(candidates):
+        by_name.setdefault(os.path.splitext(os.path.basename(candidate))[0].lower(), candidate)
+    for name in COVER_ART_NAMES:
+        if name in by_name:
+            return by_name[name]
+    return None
+
+
+class CoverIndex:
+    """
+    Image files and subdirectories of each directory, recorded while the scanner walks the media folder, so that
+    finding the separate album art of a track does not list its directory (or subdirectories) again.
+    """
+
+    def __init__(self):
+        self.images = {}  # directory -> image file names
+        self.subdirs = {}  # directory -> subdirectory names
+        self.covers = {}  # directory -> resolved album art path, "" if none
+
+    def add(self, root: str, subdirs: list, files: list):
+        """Record one (root, subdirs, files) entry of os.walk."""
+        self.images[root] = [file for file in files if is_image_file(file)]
+        self.subdirs[root] = list(subdirs)
+
+    def cover(self, directory: str) -> str:
+        """
+        The album art file of a directory, or "" if there is none. If the directory has no images, the ones found in
+        its subdirectories (e.g. "Scans/") are chosen from the same way.
+        """
+        if directory in self.covers:
+            return self.covers[directory]
+        candidates = [os.path.join(directory, image) for image in self.images.get(directory, [])]
+        if not candidates:
+            candidates = [cover for cover in (self.cover(os.path.join(directory, subdir))
+                                              for subdir in self.subdirs.get(directory, [])) if cover]
+        cover = pick_cover(candidates) if candidates else None
+        if cover is None and len(candidates) > 1:
+            logging.error(f"Multiple album art files found for {directory}: {candidates}")
+        self.covers[directory] = cover or ""
+        return self.covers[directory]
+
+
 def find_separate_albumart(directory: str) -> str:
     """
     Checks if there is a separate album art file in the directory.
@@ -114,79 +216,42 @@ def find_separate_albumart(directory: str) -> str:
     Returns:
         str: The path to the album art file if found, else None.
     """
-    candidates = [directory + "/" + item for item in os.listdir(directory)]
-    image_exts = [".jpg", ".jpeg", ".png"]
-    candidates = [item for item in candidates if any(
-        item.lower().endswith(ext) for ext in image_exts)]
-    if len(candidates) == 1:
-        return candidates[0]
-    elif len(candidates) == 0:
-        # try subdirectories recursively
-        for subdir in os.listdir(directory):
-            subdir_path = directory + "/" + subdir
-            if os.path.isdir(subdir_path):
-                candidates += find_separate_albumart(subdir_path)
-        if len(candidates) == 1:
-            return candidates
-        return None
-    else:  # len(candidates) > 1:
-        logging.error(
-            f"Multiple album art files found for {directory}: {candidates}")
-        return None
+    covers = CoverIndex()
+    for root, subdirs, files in os.walk(directory):
+        covers.add(root, subdirs, files)
+    return covers.cover(directory) or None
 
 
-def extract_album_art(file_path: str) -> str:
-    """Extract album art from an audio file and return it as a base64 string. If not embedded, look for a separate album art file."""
+def extract_album_art(file_path: str, cover_path: str = None) -> bytes:
+    """
+    Extract album art from an audio file and return the raw image. If not embedded, look for a separate album art file.
+    See read_album_art for cover_path.
+    """
+    audio = open_audio(file_path)
+    if audio is None:
+        return None
     try:
-        if file_path.lower().endswith(".mp3"):
-            audio = MP3(file_path, ID3=ID3)
-            if "APIC:" in audio.tags:
-                album_art = audio.tags["APIC:"].data
-            else:
-                separate_albumart = find_separate_albumart(os.path.dirname(file_path))
-                if separate_albumart:
-                    with open(separate_albumart, "rb") as f:
-                        album_art = f.read()
-                else:
-                    return None
-        
-        elif file_path.lower().endswith(".flac"):
-            audio = FLAC(file_path)
-            if audio.pictures:
-                album_art = audio.pictures[0].data
-            else:
-                separate_albumart = find_separate_albumart(os.path.dirname(file_path))
-                if separate_albumart:
-                    with open(separate_albumart, "rb") as f:
-                        album_art = f.read()
-                else:
-                    return None
-        
-        elif file_path.lower().endswith(".m4a"):
-            audio = MP4(file_path)
-            if "covr" in audio and len(audio["covr"]) > 0:
-                album_art = audio["covr"][0]
-            else:
-                separate_albumart = find_separate_albumart(os.path.dirname(file_path))
-                if separate_albumart:
-                    with open(separate_albumart, "rb") as f:
-                        album_art = f.read()
-                else:
-                    return None
-        
-        else:
-            logging.error(
-                f"Unsupported file format for {file_path}. Extension must be one of: .mp3, .flac, .m4a"
-            )
-            return None  # Unsupported file format
-        
-        return f"data:image/jpeg;base64,{base64.b64encode(album_art).decode('utf-8')}"
-    
+        return read_album_art(audio, file_path, cover_path)
     except Exception as e:
-        print(f"Failed to extract album art from {file_path}: {e}")
+        logging.error(f"Failed to extract album art from {file_path}: {e}")
         return None
 
 
+def move_inline_album_art(cursor: sqlite3.Cursor):
+    """Move base64 album art left in albums.album_art by older scans into the art store."""
+    cursor.execute("PRAGMA table_info(albums)")
+    if "album_art" not in [row[1] for row in cursor.fetchall()]:
+        return
+    cursor.execute("SELECT album_id, album_art FROM albums WHERE album_art IS NOT NULL")
+    for album_id, data_uri in cursor.fetchall():
+        album_art = base64.b64decode(data_uri.split(",", 1)[-1])
+        cursor.execute(
+            "UPDATE albums SET album_art_hash = ?, album_art = NULL WHERE album_id = ?",
+            (art_store.store_art(album_art), album_id),
+        )
+        logging.info(f"Moved album art of album {album_id} to the art store.")
+
+
 def get_or_create_ids(cursor, table_wo_s, values):
     """Retrieve artist IDs from database, or insert new artists if not found."""
     ids = []
@@ -210,82 +275,457 @@ def get_or_create_ids(cursor, table_wo_s, values):
     return ids
 
 
-def scan_basics(cursor: sqlite3.Cursor):
-    """Scan media folder and store metadata in SQLite."""
-    
-    # keys for music table
-    keys_musics = list(AUDIO_METADATA_KEY_TYPES.keys()) + ["file_path"]
+class NameIds:
+    """
+    name -> ID map of a lookup table (albums, artists, genres, organizations), loaded once per scan.
+    Unknown names are collected with add() and inserted together by flush(), instead of a SELECT (and maybe an INSERT)
+    per track and value as in get_or_create_id.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, table_wo_s: str):
+        self.table_wo_s = table_wo_s
+        self.pending = {}  # names to insert, in order of appearance
+        # album names are not unique; like get_or_create_id, the lowest ID wins
+        cursor.execute(f"SELECT {table_wo_s}_id, {table_wo_s}_name FROM {table_wo_s}s ORDER BY {table_wo_s}_id DESC")
+        self.ids = {name: id_ for id_, name in cursor.fetchall()}
+
+    def __getitem__(self, name) -> int:
+        return self.ids[name]
+
+    def add(self, name):
+        """Remember a name to insert on the next flush if it has no ID yet."""
+        if name not in self.ids:
+            self.pending[name] = None
+
+    def flush(self, cursor: sqlite3.Cursor) -> set:
+        """Insert the pending names and read their IDs back. Returns the names that were inserted."""
+        t = self.table_wo_s
+        names = [name for name in self.pending if name is not None]
+        cursor.executemany(f"INSERT INTO {t}s ({t}_name) VALUES (?)", [(name,) for name in names])
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            cursor.execute(
+                f"SELECT {t}_id, {t}_name FROM {t}s WHERE {t}_name IN ({','.join(['?'] * len(chunk))})",
+                chunk,
+            )
+            self.ids.update({name: id_ for id_, name in cursor.fetchall() if name not in self.ids})
+        if None in self.pending:  # only if the default entry is missing
+            cursor.execute(f"INSERT INTO {t}s ({t}_name) VALUES (NULL)")
+            self.ids[None] = cursor.lastrowid
+        inserted = set(self.pending)
+        self.pending.clear()
+        return inserted
+
+
+def split_names(value: str) -> list:
+    """Split a multi-valued tag like "A, B" into names. Missing or "Unknown" values give [None], i.e. ID 0."""
+    values = value.split(", ") if value else []
+    if not values or values == ["Unknown"]:
+        return [None]
+    return values
+
+
+def file_fingerprint(file_path: str) -> tuple:
+    """Return the (size, mtime_ns, inode) fingerprint of a file. Matches the order of FILE_STAT_KEY_TYPES."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def content_hash(file_path: str, chunk_size: int = config.CONTENT_HASH_CHUNK) -> str:
+    """
+    Partial content hash of a file: its size and its first and last chunk_size bytes, read through mmap.
+    These stay the same when a file is moved or renamed, and tags and audio frames make them differ between tracks,
+    so it identifies a file without reading all of it.
+    """
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.sha256(size.to_bytes(8, "little"))
+        if size:  # empty files cannot be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data[:chunk_size])
+                digest.update(data[max(chunk_size, size - chunk_size):])
+    return digest.hexdigest()
+
+
+def get_known_files(cursor: sqlite3.Cursor, dirs: list = None) -> dict:
+    """
+    Get the music ID, stored fingerprint and album ID of every file in the music table, keyed by file path.
+    With dirs, only files under those directories are returned.
+    """
+    select = f"SELECT music_id, file_path, album_id, {', '.join(FILE_STAT_KEY_TYPES.keys())} FROM music"
+    if dirs is None:
+        cursor.execute(select)
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for directory in dirs:
+            # a range on the file_path index: every path starting with "directory/"
+            prefix = os.path.join(directory, "")
+            cursor.execute(f"{select} WHERE file_path >= ? AND file_path < ?",
+                           (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+            rows += cursor.fetchall()
+    return {row[1]: (row[0], tuple(row[3:]), row[2]) for row in rows}
+
+
+def store_music(cursor: sqlite3.Cursor, rows: list) -> list:
+    """
+    Write tracks to the music table in one batch.
+    Args:
+        cursor (sqlite3.Cursor): The cursor to write with.
+        rows (list): List of (metadata, music_id) tuples. music_id is None for new tracks, else the row to update in place.
+    Returns:
+        list: The music ID of each row, in the same order.
+    """
+    keys_musics = (list(AUDIO_METADATA_KEY_TYPES.keys()) + ["file_path"] + list(FILE_STAT_KEY_TYPES.keys())
+                   + list(FILE_INFO_KEY_TYPES.keys()) + list(FILE_HASH_KEY_TYPES.keys()))
+    new_rows = [[metadata.get(key, None) for key in keys_musics]
+                for metadata, music_id in rows if music_id is None]
+    # keep music_id of updated rows so that links (and anything else referring to the track) stay valid
+    updated_rows = [[metadata.get(key, None) for key in keys_musics] + [music_id]
+                    for metadata, music_id in rows if music_id is not None]
+
+    cursor.executemany(
+        f"""
+        INSERT OR REPLACE INTO music ({", ".join(keys_musics)})
+        VALUES ({", ".join(["?"] * len(keys_musics))})
+        """,
+        new_rows,
+    )
+    cursor.executemany(
+        f"UPDATE music SET {', '.join(f'{key} = ?' for key in keys_musics)} WHERE music_id = ?",
+        updated_rows,
+    )
+    for key in IDS_KEYS:
+        cursor.executemany(f"DELETE FROM {key}s_music WHERE music_id = ?", [row[-1:] for row in updated_rows])
+
+    new_ids = {}
+    if new_rows:
+        new_paths = [metadata["file_path"] for metadata, music_id in rows if music_id is None]
+        cursor.execute(
+            f"SELECT file_path, music_id FROM music WHERE file_path IN ({','.join(['?'] * len(new_paths))})",
+            new_paths,
+        )
+        new_ids = dict(cursor.fetchall())
+    return [new_ids[metadata["file_path"]] if music_id is None else music_id for metadata, music_id in rows]
+
+
+def remove_music(cursor: sqlite3.Cursor, music_ids: list):
+    """Delete tracks, their artist links, seek tables and search entries from the database."""
+    if not music_ids:
+        return
+    params = [(music_id,) for music_id in music_ids]
+    for key in IDS_KEYS:
+        cursor.executemany(f"DELETE FROM {key}s_music WHERE music_id = ?", params)
+    cursor.executemany("DELETE FROM seek_tables WHERE music_id = ?", params)
+    search.remove_tracks(cursor, music_ids)
+    cursor.executemany("DELETE FROM music WHERE music_id = ?", params)
+
+
+def remove_empty_albums(cursor: sqlite3.Cursor, album_ids: list = None) -> list:
+    """
+    Delete albums left without tracks, e.g. once their files were removed or retagged, with their artist links.
+    Only the given albums are checked if album_ids is given, e.g. the ones a scan touched. The default album (no name)
+    is kept. Votes on deleted albums stay in the log, and replays skip them (see ratings.replay).
+    Returns:
+        list: The IDs of the deleted albums.
+    """
+    select = ("SELECT album_id FROM albums WHERE album_name IS NOT NULL "
+              "AND NOT EXISTS (SELECT 1 FROM music WHERE music.album_id = albums.album_id)")
+    if album_ids is None:
+        cursor.execute(select)
+        empty = [row[0] for row in cursor.fetchall()]
+    else:
+        empty = []
+        for start in range(0, len(album_ids), 500):
+            chunk = album_ids[start:start + 500]
+            cursor.execute(f"{select} AND album_id IN ({','.join(['?'] * len(chunk))})", chunk)
+            empty += [row[0] for row in cursor.fetchall()]
+    params = [(album_id,) for album_id in empty]
+    cursor.executemany("DELETE FROM artists_albums WHERE album_id = ?", params)
+    cursor.executemany("DELETE FROM albums WHERE album_id = ?", params)
+    if empty:
+        logging.info(f"Removed {len(empty)} albums without tracks.")
+    return empty
+
+
+def relink_moved_files(cursor: sqlite3.Cursor, jobs: list, missing: dict) -> list:
+    """
+    Find new files that are known files moved or renamed, and point the rows of those to their new paths, so that the
+    music ID (and everything referring to it) is kept and the file is not read again.
+    Files are matched by content_hash. Rows stored before content hashes existed have none, so for those the whole
+    fingerprint, size, mtime and inode, which a move within a filesystem keeps, has to match instead: a new file may
+    get the inode of a deleted one, but then its mtime differs.
+    Args:
+        cursor (sqlite3.Cursor): The cursor to write with.
+        jobs (list): Jobs of scan_basics. New files (music_id None) get their content hash as job["content_hash"].
+        missing (dict): file_path -> music_id of known files that no longer exist.
+    Returns:
+        list: The jobs of the files that were relinked. They need no reading.
+    """
+    new_jobs = [job for job in jobs if job["music_id"] is None]
+    if not new_jobs or not missing:
+        return []
+    by_hash, by_stat = {}, {}
+    music_ids = list(missing.values())
+    for start in range(0, len(music_ids), 500):
+        chunk = music_ids[start:start + 500]
+        cursor.execute(
+            f"SELECT music_id, content_hash, {', '.join(FILE_STAT_KEY_TYPES.keys())} FROM music "
+            f"WHERE music_id IN ({','.join(['?'] * len(chunk))})",
+            chunk,
+        )
+        for music_id, hash_, *fingerprint in cursor.fetchall():
+            if hash_:
+                by_hash[hash_] = music_id
+            else:
+                by_stat[tuple(fingerprint)] = music_id
+
+    moved = []
+    for job in new_jobs:
+        try:
+            job["content_hash"] = content_hash(job["file_path"])
+        except OSError as e:
+            logging.error(f"Failed to hash {job['file_path']}: {e}")
+            continue
+        music_id = by_hash.pop(job["content_hash"], None)
+        if music_id is None:
+            music_id = by_stat.pop(job["fingerprint"], None)
+        if music_id is not None:
+            job["music_id"] = music_id
+            moved.append(job)
+
+    keys = ["file_path"] + list(FILE_STAT_KEY_TYPES.keys()) + list(FILE_HASH_KEY_TYPES.keys())
+    cursor.executemany(
+        f"UPDATE music SET {', '.join(f'{key} = ?' for key in keys)} WHERE music_id = ?",
+        [(job["file_path"], *job["fingerprint"], job["content_hash"], job["music_id"]) for job in moved],
+    )
+    return moved
+
+
+def read_audio_file(job: dict) -> tuple:
+    """
+    Read the tags, seek table and content hash of a file, plus its album art if job["want_art"] is set.
+    Runs in the scanner worker processes, so it must not touch the database. Album art is written to the art store here,
+    so that only its hash is sent back to the writer. The seconds each step took are set in job["timings"].
+    Returns:
+        tuple: (job, metadata, album_art_hash) where album_art_hash is None if there is no album art.
+    """
+    logging.info(f"Scanning {job['file_path']}...")
+    timings = job["timings"] = {}
+    metadata, album_art = extract_file(job["file_path"], want_art=job["want_art"], cover_path=job["cover_path"],
+                                       timings=timings)
+    start = time.perf_counter()
+    if metadata:
+        metadata["seek_table"] = seek_index.build_seek_table(job["file_path"], metadata["duration"])
+        start = add_timing(timings, "seek_table", start)
+        try:
+            metadata["content_hash"] = job.get("content_hash") or content_hash(job["file_path"])
+        except OSError as e:
+            logging.error(f"Failed to hash {job['file_path']}: {e}")
+        start = add_timing(timings, "hash", start)
+    album_art_hash = art_store.store_art(album_art) if album_art else None
+    add_timing(timings, "art", start)
+    return job, metadata, album_art_hash
+
+
+def read_audio_files(jobs: list, workers: int):
+    """Yield read_audio_file results in the same order as jobs. Uses a process pool if workers > 1."""
+    workers = min(workers, -(-len(jobs) // 16))  # starting a process costs more than reading a few files
+    if workers <= 1:
+        yield from map(read_audio_file, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(read_audio_file, jobs, chunksize=16)
+
+
+def write_batch(cursor: sqlite3.Cursor, batch: list, stats: dict, names: dict):
+    """
+    Resolve IDs for a batch of read_audio_file results and write them to the music and link tables.
+    names maps each of ID_KEYS + IDS_KEYS to its NameIds; names new to the database are inserted once per batch.
+    """
+    rows = []
+    for job, metadata, album_art_hash in batch:
+        if not metadata:
+            continue
+        metadata.update(zip(FILE_STAT_KEY_TYPES.keys(), job["fingerprint"]))
+        metadata["mime_type"] = utils.guess_mime_type(job["file_path"])
+
+        # Fill in missing metadata
+        metadata['title'] = metadata.get('title', None) or os.path.splitext(os.path.basename(job["file_path"]))[0]
+        metadata['album'] = metadata.get('album', None) or os.path.basename(job["root"])
+        metadata['tracknumber'] = metadata.get('tracknumber', None) or job["index"] + 1
+        metadata['totaltracks'] = metadata.get('totaltracks', None) or job["n_files"]
+        metadata['discnumber'] = metadata.get('discnumber', None) or 1
+        metadata['totaldiscs'] = metadata.get('totaldiscs', None) or 1
+        metadata['albumartist'] = metadata.get('albumartist', None) or metadata.get('artist', None)
+
+        for key in ID_KEYS:
+            names[key].add(metadata.get(key, None))
+        names_stuff = {key: split_names(metadata.get(key, None)) for key in IDS_KEYS}
+        for key in IDS_KEYS:
+            for name in names_stuff[key]:
+                names[key].add(name)
+        # e.g.) names_stuff = {"artist": ["A", "B"], ...}
+
+        stats["new" if job["music_id"] is None else "modified"] += 1
+        rows.append((job, metadata, album_art_hash, names_stuff))
+
+    new_names = {key: names[key].flush(cursor) for key in ID_KEYS + IDS_KEYS}
+
+    album_arts = []
+    for job, metadata, album_art_hash, _ in rows:
+        for key in ID_KEYS:
+            metadata[f"{key}_id"] = names[key][metadata.get(key, None)]
+        stats["albums"].add(metadata["album_id"])
+        if metadata["album"] not in new_names["album"]:
+            continue
+        new_names["album"].discard(metadata["album"])  # the first track of a new album sets its art
+        if not job["want_art"]:  # the album starts mid-directory, so the worker did not read its art
+            album_art = extract_album_art(job["file_path"], job["cover_path"])
+            album_art_hash = art_store.store_art(album_art) if album_art else None
+        if album_art_hash:
+            album_arts.append((album_art_hash, metadata["album_id"]))
+    cursor.executemany("UPDATE albums SET album_art_hash = ? WHERE album_id = ?", album_arts)
+
+    # Insert songs into music table
+    # TODO: only fill the empty fields in case we might use user input
+    music_ids = store_music(cursor, [(metadata, job["music_id"]) for job, metadata, _, _ in rows])
+    for key in IDS_KEYS:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {key}s_music ({key}_id, music_id) VALUES (?, ?)",
+            [(names[key][name], music_id) for music_id, (_, _, _, names_stuff) in zip(music_ids, rows)
+             for name in names_stuff[key]],
+        )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO seek_tables (music_id, seek_table) VALUES (?, ?)",
+        [(music_id, metadata["seek_table"]) for music_id, (_, metadata, _, _) in zip(music_ids, rows)
+         if metadata.get("seek_table")],
+    )
+    db_setup.fill_track_summaries(cursor, music_ids)
+    search.index_tracks(cursor, music_ids)
+
+
+def scan_basics(cursor: sqlite3.Cursor, full: bool = False, workers: int = config.SCAN_WORKERS, media_dir: str = MEDIA_DIR,
+                dirs: list = None, commit_batches: bool = False, remove_unreadable: bool = False) -> dict:
+    """
+    Scan media folder and store metadata in SQLite.
+    Files whose size, mtime and inode match the stored fingerprint are skipped, and rows of files that no longer exist are removed,
+    unless a new file is the same file moved (see relink_moved_files).
+    Tags are read by `workers` processes and written here in batches of config.SCAN_BATCH_SIZE, in directory order.
+    Args:
+        cursor (sqlite3.Cursor): The cursor to write with.
+        full (bool): Re-extract every file even if its fingerprint did not change.
+        workers (int): Number of processes reading tags. 1 reads them in this process.
+        media_dir (str): The folder to scan.
+        dirs (list): Only scan these folders (and their subfolders) instead of media_dir, e.g. the ones the watcher saw
+            change. Only files under them are removed if missing.
+        commit_batches (bool): Commit after each batch, so that other writers (votes in the API) wait for one batch at
+            most instead of the whole scan.
+        remove_unreadable (bool): Remove the rows of known files that cannot be read, as if they were missing, instead
+            of keeping them as they are. For rebuilds, whose seeded rows hold no tags (see shadow.SEEDED_MUSIC_COLUMNS).
+    Returns:
+        dict: Number of files per category, i.e. {"new": ..., "modified": ..., "unchanged": ..., "moved": ..., "removed": ...},
+            "albums", the set of album IDs whose tracks were added, changed or removed, "phases", seconds per phase of
+            the scan, and "file_steps", [total, slowest file] seconds per step of read_audio_file.
+    """
+    stats = {"new": 0, "modified": 0, "unchanged": 0, "moved": 0, "removed": 0, "albums": set(), "phases": {},
+             "file_steps": {}}
+    phases, file_steps = stats["phases"], stats["file_steps"]
+    start = time.perf_counter()
+    known_files = get_known_files(cursor, dirs)
+    start = add_timing(phases, "known_files", start)
+    seen_paths = set()
+    jobs = []
+    covers = CoverIndex()
 
     # Scan files
-    for root, _, files in os.walk(MEDIA_DIR):
-        files = [file for file in files 
-                 if not file.startswith(".") 
-                 and any(file.lower().endswith(ext) for ext in SUPPORTED_EXTS)]
-        files.sort()
-        for i, file in enumerate(files):
-            file_path = os.path.join(root, file)
-            logging.info(f"Scanning {file_path}...")
-            
-            metadata = extract_metadata(file_path)
-            if not metadata:
-                continue
-            
-            # Fill in missing metadata
-            metadata['title'] = metadata.get('title', None) or os.path.splitext(file)[0]
-            metadata['album'] = metadata.get('album', None) or os.path.basename(root)
-            metadata['tracknumber'] = metadata.get('tracknumber', None) or i + 1
-            metadata['totaltracks'] = metadata.get('totaltracks', None) or len(files)
-            metadata['discnumber'] = metadata.get('discnumber', None) or 1
-            metadata['totaldiscs'] = metadata.get('totaldiscs', None) or 1
-            metadata['albumartist'] = metadata.get('albumartist', None) or metadata.get('artist', None)
-            
-            for key in ID_KEYS:
-                if metadata.get(key, None) is None:
-                    print('asdf')  # debug
-                result = get_or_create_id(cursor, key, metadata.get(key, None))
-                metadata[f"{key}_id"] = result[0]
-                if not result[1] or key != "album":
+    for top in (dirs if dirs is not None else [media_dir]):
+        for root, subdirs, files in os.walk(top):
+            covers.add(root, subdirs, files)
+            files = [file for file in files
+                     if not file.startswith(".")
+                     and any(file.lower().endswith(ext) for ext in SUPPORTED_EXTS)]
+            files.sort()
+            for i, file in enumerate(files):
+                file_path = os.path.join(root, file)
+                if file_path in seen_paths:  # dirs overlap
                     continue
-                album_art = extract_album_art(file_path)
-                if not album_art:
+                seen_paths.add(file_path)
+                try:
+                    fingerprint = file_fingerprint(file_path)
+                except OSError as e:
+                    logging.error(f"Failed to stat {file_path}: {e}")
                     continue
-                cursor.execute(
-                    f"""
-                    UPDATE albums
-                    SET album_art = ?
-                    WHERE album_id = ?
-                    """,
-                    (album_art, metadata["album_id"]),
-                )
-                    
-            ids_stuff = {}
-            for key in IDS_KEYS:
-                values_to_seek = metadata.get(key, None)
-                values_to_seek = values_to_seek.split(", ") if values_to_seek else []
-                ids_stuff[key] = get_or_create_ids(cursor, key, values_to_seek)
-            # e.g.) ids_stuff = {"artist": [1, 2, 3], ...}
-
-            # Insert song into music table
-            # TODO: only fill the empty fields in case we might use user input
-            cmd = f"""
-                INSERT OR REPLACE INTO music ({", ".join(keys_musics)})
-                VALUES ({", ".join(["?"] * len(keys_musics))})
-            """
-            cursor.execute(
-                cmd,
-                [metadata.get(key, None) for key in keys_musics],
-            )
-            music_id = cursor.lastrowid
 
-            for key in IDS_KEYS:
-                for id_ in ids_stuff[key]:
-                    cursor.execute(
-                        f"INSERT OR REPLACE INTO {key}s_music ({key}_id, music_id) VALUES (?, ?)",
-                        (id_, music_id),
-                    )
-            # TODO: insert into artists_albums using maximum overlap of artist_ids for each album_id
-            
-    logging.info("Scanning and storing completed.")
+                music_id, known_fingerprint, album_id = known_files.get(file_path, (None, None, None))
+                if not full and known_fingerprint == fingerprint:
+                    stats["unchanged"] += 1
+                    continue
+                if music_id is not None:  # the track may move to another album
+                    stats["albums"].add(album_id)
+                jobs.append({
+                    "file_path": file_path,
+                    "root": root,
+                    "index": i,
+                    "n_files": len(files),
+                    "fingerprint": fingerprint,
+                    "music_id": music_id,
+                    "want_art": i == 0,  # first track of a directory usually creates its album
+                })
+    for job in jobs:  # after the walk, as album art may be in a subdirectory
+        job["cover_path"] = covers.cover(job["root"])
+    start = add_timing(phases, "walk", start)
+
+    missing = {file_path: music_id for file_path, (music_id, _, _) in known_files.items() if file_path not in seen_paths}
+    moved = relink_moved_files(cursor, jobs, missing)
+    if moved:
+        moved_ids = {job["music_id"] for job in moved}
+        missing = {file_path: music_id for file_path, music_id in missing.items() if music_id not in moved_ids}
+        if not full:  # their rows are up to date; a full scan reads them like every other file
+            jobs = [job for job in jobs if job["music_id"] not in moved_ids]
+    stats["moved"] = len(moved)
+
+    def commit():
+        if commit_batches:
+            cursor.connection.commit()
+
+    commit()
+    start = add_timing(phases, "relink_moved", start)
+    names = {key: NameIds(cursor, key) for key in ID_KEYS + IDS_KEYS}
+    batch = []
+    unreadable = {}  # file_path -> music_id of known files whose tags could not be read
+    # "read" is the time spent waiting for the workers, "write" the time spent writing their results
+    for result in read_audio_files(jobs, workers):
+        for step, seconds in result[0].get("timings", {}).items():
+            total, slowest = file_steps.get(step, (0.0, 0.0))
+            file_steps[step] = [total + seconds, max(slowest, seconds)]
+        if not result[1] and result[0]["music_id"] is not None:
+            unreadable[result[0]["file_path"]] = result[0]["music_id"]
+        batch.append(result)
+        if len(batch) >= config.SCAN_BATCH_SIZE:
+            start = add_timing(phases, "read", start)
+            write_batch(cursor, batch, stats, names)
+            commit()
+            start = add_timing(phases, "write", start)
+            batch = []
+    start = add_timing(phases, "read", start)
+    write_batch(cursor, batch, stats, names)
+    commit()
+    start = add_timing(phases, "write", start)
+
+    if remove_unreadable:
+        missing.update(unreadable)
+    remove_music(cursor, list(missing.values()))
+    album_ids = {music_id: album_id for music_id, _, album_id in known_files.values()}
+    stats["albums"].update(album_ids[music_id] for music_id in missing.values())
+    stats["removed"] = len(missing)
+    add_timing(phases, "remove", start)
+
+    logging.info(
+        f"Scanning and storing completed: {stats['new']} new, {stats['modified']} modified, "
+        f"{stats['unchanged']} unchanged, {stats['moved']} moved, {stats['removed']} removed."
+    )
+    return stats
 
 
 def get_artist_id_maps(cursor: sqlite3.Cursor, music_ids: list) -> dict:
@@ -305,55 +745,137 @@ def get_artist_id_maps(cursor: sqlite3.Cursor, music_ids: list) -> dict:
     return artist_id_map
 
 
-def link_albumartists(cursor: sqlite3.Cursor):
-    """Link artists to albums. Use album artists if available, else use artists associated with tracks."""
-    cursor.execute("SELECT DISTINCT album_id FROM albums")
-    album_ids = [row[0] for row in cursor.fetchall() if row[0] != 0]
-    
-    for album_id in album_ids:
-        cursor.execute(
-            "SELECT music_id, albumartist FROM music WHERE album_id = ?",
-            (album_id,),
-        )
-        all_rows = cursor.fetchall()
-        if not all_rows:
-            continue
-        music_ids = [row[0] for row in all_rows]
-        album_artists = [row[1].split(', ') for row in all_rows if row[1]]  # in case only certain tracks have album artists
-        largest_subset = utils.find_largest_subset(album_artists)
-        if largest_subset:  # if largest subset is not empty
-            album_artist = ", ".join(largest_subset)
-            # if all(item in largest_subset for item in album_artists[0]):
-            #     # if the first row is the largest subset. we are doing this to conserve the order as much as possible
-            #     album_artist = album_artists[0]
-            # else:
-            #     album_artist = ", ".join(largest_subset)
-        else:  # if largest subset is not found, use artists associated with tracks
-            artist_ids = get_artist_id_maps(cursor, music_ids)
-            artist_ids = [artist_ids[music_id] for music_id in music_ids]  # list of list of ids
-            largest_subset = utils.find_largest_subset(artist_ids)
-            if largest_subset:
-                album_artist = ", ".join(
-                    [cursor.execute("SELECT artist_name FROM artists WHERE artist_id = ?", (artist_id,)).fetchone()[0] for artist_id in largest_subset]
-                )
-            else:
-                album_artist = "Various Artists"
-        album_artist_ids = get_or_create_ids(cursor, "artist", album_artist.split(", "))
-        for artist_id in album_artist_ids:
+def link_albumartists(cursor: sqlite3.Cursor, album_ids: list = None):
+    """
+    Link artists to albums. Use the album artists every track has if there are any, else the artists every track has,
+    else "Various Artists". Only the given albums are relinked if album_ids is given, e.g. the ones a scan touched.
+    Each step is one grouped query (per 500 albums if album_ids is given), and the links are replaced in bulk.
+    """
+    def query_albums(select: str, album_ids: list, condition: str = "", group_by: str = "") -> list:
+        """Run select on the tracks of album_ids, or of all albums, except album 0."""
+        where = f"WHERE music.album_id != 0 {condition}"
+        if album_ids is None:
+            cursor.execute(f"{select} {where} {group_by}")
+            return cursor.fetchall()
+        rows = []
+        for start in range(0, len(album_ids), 500):
+            chunk = album_ids[start:start + 500]
             cursor.execute(
-                "INSERT OR REPLACE INTO artists_albums (artist_id, album_id) VALUES (?, ?)",
-                (artist_id, album_id),
+                f"{select} {where} AND music.album_id IN ({','.join(['?'] * len(chunk))}) {group_by}", chunk
             )
+            rows += cursor.fetchall()
+        return rows
+
+    # albums without tracks are left unlinked
+    album_ids_with_tracks = [row[0] for row in query_albums("SELECT DISTINCT music.album_id FROM music", album_ids)]
+
+    # each distinct album artist value of an album once, as only what all of them share matters.
+    # tracks without album artists are left out, in case only certain tracks have them
+    album_artists = {}  # album_id -> list of album artist lists
+    rows = query_albums("SELECT album_id, albumartist FROM music", album_ids,
+                        "AND albumartist != ''", "GROUP BY album_id, albumartist")
+    for album_id, albumartist in rows:
+        album_artists.setdefault(album_id, []).append(split_names(albumartist))
+    named_links = []  # (artist name, album_id), for names that may not have an ID yet
+    for album_id, values in album_artists.items():
+        named_links += [(name, album_id) for name in utils.find_largest_subset(values)]
+
+    # else use artists associated with tracks, i.e. the ones linked to as many tracks as the album has
+    linked = {album_id for _, album_id in named_links}
+    links = query_albums(
+        "SELECT artists_music.artist_id, music.album_id FROM music "
+        "JOIN artists_music ON artists_music.music_id = music.music_id",
+        [album_id for album_id in album_ids_with_tracks if album_id not in linked],
+        "",
+        "GROUP BY music.album_id, artists_music.artist_id "
+        "HAVING COUNT(*) = (SELECT COUNT(*) FROM music AS tracks WHERE tracks.album_id = music.album_id)",
+    )
+    linked.update(album_id for _, album_id in links)
+    named_links += [("Various Artists", album_id) for album_id in album_ids_with_tracks if album_id not in linked]
+
+    names = NameIds(cursor, "artist")
+    for name, _ in named_links:
+        names.add(name)
+    names.flush(cursor)
+    links += [(names[name], album_id) for name, album_id in named_links]
+    # replace, so that artists no longer on an album are unlinked
+    if album_ids is None:
+        cursor.execute("DELETE FROM artists_albums")
+    else:
+        cursor.executemany("DELETE FROM artists_albums WHERE album_id = ?", [(album_id,) for album_id in album_ids])
+    cursor.executemany("INSERT OR REPLACE INTO artists_albums (artist_id, album_id) VALUES (?, ?)", links)
     logging.info("Linking artists to albums completed.")
-        
-    
+
+
 def fill_album_ratings(cursor: sqlite3.Cursor):
     """Fill in album ratings based on track ratings."""
     # cursor.execute("UPDATE albums SET album_rating = 1000 WHERE album_id IS NULL")
     cursor.execute("UPDATE OR IGNORE albums SET album_rating = 1000 WHERE album_rating IS NULL")
     
     
-def main():
+def update_database(conn: sqlite3.Connection, full: bool = False, workers: int = config.SCAN_WORKERS, dirs: list = None,
+                    media_dir: str = MEDIA_DIR, remove_unreadable: bool = False) -> dict:
+    """
+    Scan media_dir, or only dirs (see scan_basics), into a migrated database and update the album tables for what
+    changed. Commits every config.SCAN_BATCH_SIZE tracks and albums, so that no write transaction spans the whole scan.
+    Readers see new tracks as their batches commit, and their album links and summaries at the end. Albums left
+    without tracks are deleted (see remove_empty_albums).
+    The counts and timings of the scan are stored with record_scan.
+    """
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    move_inline_album_art(cursor)
+    conn.commit()
+    inline_art_seconds = time.perf_counter() - start
+
+    stats = scan_basics(cursor, full=full, workers=workers, media_dir=media_dir, dirs=dirs, commit_batches=True,
+                        remove_unreadable=remove_unreadable)
+    phases = {"move_inline_art": inline_art_seconds, **stats["phases"]}
+    start = time.perf_counter()
+    # only albums whose tracks were added, changed or removed. A full scan (e.g. a rebuild, whose albums are seeded
+    # from the live database) checks them all
+    removed_albums = set(remove_empty_albums(cursor, None if full else sorted(stats["albums"])))
+    conn.commit()
+    add_timing(phases, "remove_empty_albums", start)
+    stats["albums_removed"] = len(removed_albums)
+    album_ids = sorted(stats["albums"] - removed_albums)
+    for chunk_start in range(0, len(album_ids), config.SCAN_BATCH_SIZE):
+        chunk = album_ids[chunk_start:chunk_start + config.SCAN_BATCH_SIZE]
+        start = time.perf_counter()
+        link_albumartists(cursor, chunk)
+        start = add_timing(phases, "link_albumartists", start)
+        db_setup.fill_album_summaries(cursor, chunk)
+        conn.commit()
+        add_timing(phases, "fill_album_summaries", start)
+    start = time.perf_counter()
+    fill_album_ratings(cursor)
+    if stats["new"] or stats["modified"] or stats["moved"] or stats["removed"] or removed_albums:
+        meta.bump_library_version(cursor)
+    add_timing(phases, "fill_album_ratings", start)
+    stats["phases"] = phases
+    record_scan(cursor, stats)
+    conn.commit()
+    return stats
+
+
+def record_scan(cursor: sqlite3.Cursor, stats: dict):
+    """
+    Store the file counts and timings of a scan (see scan_basics) as the last_scan meta value, a JSON object read by
+    the API's /metrics, and log the phases.
+    """
+    last_scan = {
+        "finished_at": time.time(),
+        "files": {key: stats[key] for key in ("new", "modified", "unchanged", "moved", "removed")},
+        "albums_removed": stats.get("albums_removed", 0),
+        "phases": stats["phases"],
+        "file_steps": stats["file_steps"],
+    }
+    meta.set_meta(cursor, "last_scan", json.dumps(last_scan))
+    logging.info("Scan phases: " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in stats["phases"].items()))
+
+
+def main(full: bool = False, workers: int = config.SCAN_WORKERS, dirs: list = None) -> dict:
+    """Scan MEDIA_DIR, or only dirs (see scan_basics), and update the album tables for what changed."""
     if not os.path.exists(MEDIA_DIR):
         logging.error(
             f"Media directory not found at {MEDIA_DIR}. Please check the configuration."
@@ -361,29 +883,54 @@ def main():
         return
     if not os.path.exists(DB_PATH):
         logging.info("Database not found. Creating tables...")
-        import db_setup
-        db_setup.create_tables()
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
-    # Ensure default entries of NULL for artist and album where we cannot fetch them
-    cols_to_check = AUDIO_METADATA_KEY_TYPES.copy()
-    cols_to_check["file_path"] = "TEXT"
-    check_columns(cursor, "music", cols_to_check)
-    check_columns(cursor, "artists", {"artist_name": "TEXT"})
-    check_columns(cursor, "albums", config.ALBUM_METADATA_KEY_TYPES)
-    ensure_default_entries(cursor)
-    
-    scan_basics(cursor)
-    link_albumartists(cursor)
-    fill_album_ratings(cursor)
-    
-    conn.commit()
+    # WAL, so that the API keeps reading while the scan writes
+    conn = connect(DB_PATH)
+    # creates the tables or brings them up to date, without dropping anything
+    migrations.migrate(conn)
+    stats = update_database(conn, full=full, workers=workers, dirs=dirs)
     conn.close()
+    return stats
+
+
+def rebuild(workers: int = config.SCAN_WORKERS, media_dir: str = MEDIA_DIR, db_path: str = DB_PATH) -> dict:
+    """
+    Scan media_dir from scratch into a shadow database, then swap its contents into db_path in one transaction.
+    Albums keep their IDs, ratings and art, tracks keep their IDs, and votes are kept (see shadow.py). The API keeps
+    reading the old contents until the swap commits, and only its writes wait, for the swap alone.
+    """
+    if not os.path.exists(media_dir):
+        logging.error(f"Media directory not found at {media_dir}. Please check the configuration.")
+        return
+    conn = connect(db_path)
+    migrations.migrate(conn)
+    shadow_path = f"{db_path}.shadow"
+    shadow_conn = shadow.create_shadow(db_path, shadow_path)
+    try:
+        stats = update_database(shadow_conn, full=True, workers=workers, media_dir=media_dir, remove_unreadable=True)
+        shadow_conn.close()
+        start = time.perf_counter()
+        shadow.swap_in(conn, shadow_path)
+        add_timing(stats["phases"], "swap_in", start)
+        record_scan(conn.cursor(), stats)  # the meta table of the shadow database is not swapped in
+        conn.commit()
+    finally:
+        shadow_conn.close()
+        conn.close()
+        shadow.remove_shadow(shadow_path)
+    return stats
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Scan the media folder into the database.")
+    parser.add_argument("--full", action="store_true", help="re-extract every file, even unchanged ones")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the database from scratch in a shadow file and swap it in, keeping ratings")
+    parser.add_argument("--workers", type=int, default=config.SCAN_WORKERS, help="number of processes reading tags")
+    args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    main()
-    
\ No newline at end of file
+    if args.rebuild:
+        rebuild(workers=args.workers)
+    else:
+        main(full=args.full, workers=args.workers)
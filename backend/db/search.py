@@ -0,0 +1,111 @@
+import re
+import sqlite3
+
+# Full text search over tracks, in an FTS5 table whose rowid is music.music_id.
+# The scanner re-indexes the tracks it writes and removes the ones it deletes, so the index is never rebuilt.
+
+SEARCH_COLUMNS = ["title", "album_name", "artist_name", "composer", "genre"]
+SEARCH_WEIGHTS = [10.0, 5.0, 5.0, 1.0, 1.0]  # bm25 weight of each column, in the order above
+MAX_TERMS = 8
+# bm25 has to score every match before ORDER BY rank, about 2 µs each: 20-25 ms for 10k matches, but 200-350 ms for
+# a short prefix matching a quarter of a large library (120k-190k of 500k tracks). Counting matches is cheap (under
+# 10 ms), so queries with up to RANK_ALL_MATCHES matches rank all of them. Beyond that, only the first MAX_CANDIDATES
+# matches by music_id, i.e. the earliest scanned tracks, are ranked: the results are the best of those, not of all
+# matches. Typing more narrows them until every match is ranked.
+RANK_ALL_MATCHES = 10000
+MAX_CANDIDATES = 1000
+
+
+def create_search_index(cursor: sqlite3.Cursor):
+    """Create the search_index table with bm25 ranking as its default rank."""
+    # remove_diacritics lets "beyonce" find "Beyoncé"; the prefix indexes make 2-3 character prefixes a single lookup
+    cursor.execute(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            {", ".join(SEARCH_COLUMNS)},
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+        """
+    )
+    cursor.execute(
+        "INSERT INTO search_index (search_index, rank) VALUES ('rank', ?)",
+        (f"bm25({', '.join(str(weight) for weight in SEARCH_WEIGHTS)})",),
+    )
+
+
+def index_tracks(cursor: sqlite3.Cursor, music_ids: list = None):
+    """(Re-)index the given tracks, or all tracks. Call after the tracks and their artist links are written."""
+    select = """
+        INSERT INTO search_index (rowid, title, album_name, artist_name, composer, genre)
+        SELECT music.music_id, music.title, albums.album_name,
+               (SELECT group_concat(artists.artist_name, ', ') FROM artists_music
+                JOIN artists ON artists.artist_id = artists_music.artist_id
+                WHERE artists_music.music_id = music.music_id),
+               music.composer, genres.genre_name
+        FROM music
+        LEFT JOIN albums ON albums.album_id = music.album_id
+        LEFT JOIN genres ON genres.genre_id = music.genre_id
+        """
+    if music_ids is None:
+        cursor.execute("DELETE FROM search_index")
+        cursor.execute(select)
+        return
+    for start in range(0, len(music_ids), 500):
+        chunk = music_ids[start:start + 500]
+        placeholders = ",".join(["?"] * len(chunk))
+        cursor.execute(f"DELETE FROM search_index WHERE rowid IN ({placeholders})", chunk)
+        cursor.execute(f"{select} WHERE music.music_id IN ({placeholders})", chunk)
+
+
+def remove_tracks(cursor: sqlite3.Cursor, music_ids: list):
+    cursor.executemany("DELETE FROM search_index WHERE rowid = ?", [(music_id,) for music_id in music_ids])
+
+
+def match_expression(query: str) -> str:
+    """
+    Turn user input into an FTS5 query matching tracks that contain every word, each as a prefix.
+    Single characters only match whole words, as nearly every track has a word starting with any given letter.
+    e.g. 'daft pu' -> '"daft"* "pu"*'. Returns None if there are no words.
+    """
+    terms = re.findall(r"\w+", query)[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' if len(term) > 1 else f'"{term}"' for term in terms)
+
+
+def search(cursor: sqlite3.Cursor, query: str, limit: int) -> list:
+    """
+    Find tracks matching query, best first. All matches are ranked if there are at most RANK_ALL_MATCHES, else only
+    the first MAX_CANDIDATES by music_id, so better ones among the rest are missed.
+    Returns:
+        list: (music_id, title, album_id, album_name, artist_name) tuples.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    cursor.execute(
+        "SELECT COUNT(*) FROM (SELECT rowid FROM search_index WHERE search_index MATCH ? LIMIT ?)",
+        (expression, RANK_ALL_MATCHES + 1),
+    )
+    if cursor.fetchone()[0] <= RANK_ALL_MATCHES:
+        # ORDER BY rank inside FTS5 keeps only the best `limit` while scoring, unlike sorting the joined rows
+        hits = "SELECT rowid, artist_name, rank FROM search_index WHERE search_index MATCH ? ORDER BY rank LIMIT ?"
+        params = (expression, limit)
+    else:
+        hits = """
+            SELECT * FROM (SELECT rowid, artist_name, rank FROM search_index WHERE search_index MATCH ? LIMIT ?)
+            ORDER BY rank LIMIT ?
+            """
+        params = (expression, MAX_CANDIDATES, limit)
+    cursor.execute(
+        f"""
+        SELECT music.music_id, music.title, music.album_id, albums.album_name, hits.artist_name
+        FROM ({hits}) AS hits
+        JOIN music ON music.music_id = hits.rowid
+        LEFT JOIN albums ON albums.album_id = music.album_id
+        ORDER BY hits.rank
+        """,
+        params,
+    )
+    return cursor.fetchall()
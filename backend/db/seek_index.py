@@ -0,0 +1,282 @@
+import os
+import struct
+import logging
+from bisect import bisect_right
+
+# A seek table is a list of (seconds, byte_offset) points sorted by time, stored packed as SEEK_POINT_FORMAT per point.
+SEEK_POINT_FORMAT = "<IQ"  # milliseconds, byte offset
+MAX_SEEK_POINTS = 512
+
+# MPEG audio: sample rates by version and header bits, and samples per frame by (version, layer)
+MPEG_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+MPEG_SAMPLES_PER_FRAME = {(1, 1): 384, (1, 2): 1152, (1, 3): 1152,
+                          (2, 1): 384, (2, 2): 1152, (2, 3): 576,
+                          (2.5, 1): 384, (2.5, 2): 1152, (2.5, 3): 576}
+
+
+def pack_seek_table(points: list) -> bytes:
+    """Pack (seconds, byte_offset) points into a seek table blob, thinned out to at most MAX_SEEK_POINTS points."""
+    if len(points) > MAX_SEEK_POINTS:
+        step = (len(points) - 1) / (MAX_SEEK_POINTS - 1)
+        points = [points[round(i * step)] for i in range(MAX_SEEK_POINTS)]
+    return b"".join(struct.pack(SEEK_POINT_FORMAT, round(seconds * 1000), offset) for seconds, offset in points)
+
+
+def unpack_seek_table(seek_table: bytes) -> list:
+    """Unpack a seek table blob into (seconds, byte_offset) points."""
+    return [(ms / 1000, offset) for ms, offset in struct.iter_unpack(SEEK_POINT_FORMAT, seek_table)]
+
+
+def seek_offset(seek_table: bytes, seconds: float) -> int:
+    """
+    Resolve a time to a byte offset with a seek table.
+    Interpolates linearly between the two points around `seconds`. Decoders resync on the next frame header, so landing
+    inside a frame is fine.
+    """
+    points = unpack_seek_table(seek_table)
+    if not points:
+        return 0
+    i = bisect_right([point[0] for point in points], seconds) - 1
+    if i < 0:
+        return points[0][1]
+    if i >= len(points) - 1:
+        return points[-1][1]
+    (t0, offset0), (t1, offset1) = points[i], points[i + 1]
+    if t1 <= t0:
+        return offset0
+    return int(offset0 + (offset1 - offset0) * (seconds - t0) / (t1 - t0))
+
+
+def linear_seek_table(duration: float, file_size: int, audio_start: int = 0) -> bytes:
+    """Seek table for constant bitrate audio, or when nothing better is known."""
+    return pack_seek_table([(0, audio_start), (duration or 0, file_size)])
+
+
+def id3v2_size(header: bytes) -> int:
+    """Size of an ID3v2 tag from the first 10 bytes of a file, or 0 if there is none."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def parse_mpeg_header(data: bytes, pos: int) -> dict:
+    """Parse the 4-byte MPEG audio frame header at data[pos], or return None if it is not a valid header."""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (data[pos + 1] >> 3) & 0x03
+    layer_bits = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    return {
+        "version": version,
+        "layer": layer,
+        "mono": (data[pos + 3] >> 6) == 3,
+        "sample_rate": MPEG_SAMPLE_RATES[version][rate_index],
+        "samples_per_frame": MPEG_SAMPLES_PER_FRAME[(version, layer)],
+    }
+
+
+def mp3_seek_points(f, duration: float, file_size: int) -> list:
+    """Seek points of an MP3 from its Xing/Info or VBRI table of contents, else a constant bitrate estimate."""
+    f.seek(0)
+    audio_start = id3v2_size(f.read(10))
+    f.seek(audio_start)
+    data = f.read(64 * 1024)
+    frame_pos = data.find(b"\xff")
+    while frame_pos != -1 and not parse_mpeg_header(data, frame_pos):
+        frame_pos = data.find(b"\xff", frame_pos + 1)
+    if frame_pos == -1:
+        return [(0, audio_start), (duration, file_size)]
+    frame = parse_mpeg_header(data, frame_pos)
+    first_frame = audio_start + frame_pos
+
+    # Xing/Info header sits right after the side information of the first frame
+    if frame["version"] == 1:
+        xing_pos = frame_pos + (21 if frame["mono"] else 36)
+    else:
+        xing_pos = frame_pos + (13 if frame["mono"] else 21)
+    if data[xing_pos:xing_pos + 4] in (b"Xing", b"Info") and len(data) >= xing_pos + 8:
+        flags = struct.unpack_from(">I", data, xing_pos + 4)[0]
+        pos = xing_pos + 8
+        if flags & 0x1:  # frames
+            pos += 4
+        stream_bytes = file_size - first_frame
+        if flags & 0x2:  # bytes
+            stream_bytes = struct.unpack_from(">I", data, pos)[0] or stream_bytes
+            pos += 4
+        if flags & 0x4 and len(data) >= pos + 100:  # table of contents: byte position at each percent, scaled to 256
+            toc = data[pos:pos + 100]
+            points = [(i * duration / 100, first_frame + toc[i] * stream_bytes // 256) for i in range(100)]
+            return points + [(duration, first_frame + stream_bytes)]
+
+    vbri_pos = frame_pos + 36
+    if data[vbri_pos:vbri_pos + 4] == b"VBRI" and len(data) >= vbri_pos + 26:
+        entries, scale, entry_size, frames_per_entry = struct.unpack_from(">HHHH", data, vbri_pos + 18)
+        toc_start = vbri_pos + 26
+        if entry_size in (1, 2, 3, 4) and len(data) >= toc_start + entries * entry_size:
+            seconds_per_entry = frames_per_entry * frame["samples_per_frame"] / frame["sample_rate"]
+            points, offset = [(0, first_frame)], first_frame
+            for i in range(entries):
+                entry = data[toc_start + i * entry_size:toc_start + (i + 1) * entry_size]
+                offset += int.from_bytes(entry, "big") * scale
+                points.append((min((i + 1) * seconds_per_entry, duration), min(offset, file_size)))
+            return points
+
+    return [(0, first_frame), (duration, file_size)]
+
+
+def flac_seek_points(f, duration: float, file_size: int) -> list:
+    """Seek points of a FLAC file from its SEEKTABLE block, relative to the first audio frame."""
+    f.seek(0)
+    pos = id3v2_size(f.read(10))
+    f.seek(pos)
+    if f.read(4) != b"fLaC":
+        return [(0, 0), (duration, file_size)]
+    pos += 4
+    sample_rate, seekpoints = None, []
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return [(0, pos), (duration, file_size)]
+        is_last, block_type = header[0] & 0x80, header[0] & 0x7F
+        length = int.from_bytes(header[1:], "big")
+        if block_type == 0:  # STREAMINFO
+            sample_rate = int.from_bytes(f.read(length)[10:13], "big") >> 4
+        elif block_type == 3:  # SEEKTABLE
+            block = f.read(length)
+            seekpoints = [point for point in struct.iter_unpack(">QQH", block[:length - length % 18])
+                          if point[0] != 0xFFFFFFFFFFFFFFFF]  # skip placeholders
+        else:
+            f.seek(length, os.SEEK_CUR)
+        pos += 4 + length
+        if is_last:
+            break
+
+    audio_start = pos
+    points = [(0, audio_start)]
+    if sample_rate:
+        points += [(first_sample / sample_rate, audio_start + byte_offset)
+                   for first_sample, byte_offset, _ in seekpoints if first_sample > 0]
+    return points + [(duration, file_size)]
+
+
+def iter_boxes(f, start: int, end: int):
+    """Yield (type, payload_start, box_end) of the MP4 boxes between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        size, box_type = struct.unpack(">I4s", header)
+        payload_start = pos + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload_start += 8
+        elif size == 0:
+            size = end - pos
+        if size < 8:
+            return
+        yield box_type, payload_start, pos + size
+        pos += size
+
+
+def find_box(f, start: int, end: int, path: list):
+    """Find the first box at path (e.g. [b"moov", b"trak"]) and return (payload_start, box_end), or None."""
+    for box_type, payload_start, box_end in iter_boxes(f, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            return payload_start, box_end
+        found = find_box(f, payload_start, box_end, path[1:])
+        if found:
+            return found
+    return None
+
+
+def read_box(f, box) -> bytes:
+    """Read the payload of a box found by find_box."""
+    f.seek(box[0])
+    return f.read(box[1] - box[0])
+
+
+def mp4_seek_points(f, duration: float, file_size: int) -> list:
+    """Seek points of an MP4/M4A file: the start time and offset of every chunk of the first sound track."""
+    moov = find_box(f, 0, file_size, [b"moov"])
+    if not moov:
+        return [(0, 0), (duration, file_size)]
+    for box_type, trak_start, trak_end in iter_boxes(f, *moov):
+        if box_type != b"trak":
+            continue
+        hdlr = find_box(f, trak_start, trak_end, [b"mdia", b"hdlr"])
+        if not hdlr or read_box(f, hdlr)[8:12] != b"soun":
+            continue
+        mdhd = read_box(f, find_box(f, trak_start, trak_end, [b"mdia", b"mdhd"]))
+        timescale = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)[0]
+        stbl = find_box(f, trak_start, trak_end, [b"mdia", b"minf", b"stbl"])
+        if not stbl or not timescale:
+            break
+        boxes = {box_type: (payload_start, box_end) for box_type, payload_start, box_end in iter_boxes(f, *stbl)}
+        if b"stts" not in boxes or b"stsc" not in boxes or not (b"stco" in boxes or b"co64" in boxes):
+            break
+
+        stts = read_box(f, boxes[b"stts"])
+        time_runs = list(struct.iter_unpack(">II", stts[8:8 + 8 * struct.unpack_from(">I", stts, 4)[0]]))
+        stsc = read_box(f, boxes[b"stsc"])
+        chunk_runs = list(struct.iter_unpack(">III", stsc[8:8 + 12 * struct.unpack_from(">I", stsc, 4)[0]]))
+        if b"co64" in boxes:
+            co64 = read_box(f, boxes[b"co64"])
+            chunk_offsets = [offset for offset, in struct.iter_unpack(">Q", co64[8:8 + 8 * struct.unpack_from(">I", co64, 4)[0]])]
+        else:
+            stco = read_box(f, boxes[b"stco"])
+            chunk_offsets = [offset for offset, in struct.iter_unpack(">I", stco[8:8 + 4 * struct.unpack_from(">I", stco, 4)[0]])]
+
+        points = []
+        time, run, left_in_run = 0, 0, time_runs[0][0] if time_runs else 0
+        for chunk_index, offset in enumerate(chunk_offsets, start=1):
+            points.append((time / timescale, offset))
+            # samples in this chunk: from the last stsc entry whose first_chunk <= chunk_index
+            samples = next((count for first_chunk, count, _ in reversed(chunk_runs) if first_chunk <= chunk_index), 0)
+            while samples > 0 and run < len(time_runs):
+                step = min(samples, left_in_run)
+                time += step * time_runs[run][1]
+                samples -= step
+                left_in_run -= step
+                if left_in_run == 0:
+                    run += 1
+                    left_in_run = time_runs[run][0] if run < len(time_runs) else 0
+        return points + [(duration, file_size)] if points else [(0, 0), (duration, file_size)]
+    return [(0, 0), (duration, file_size)]
+
+
+def build_seek_table(file_path: str, duration: float) -> bytes:
+    """
+    Build the packed seek table of an audio file: the Xing/VBRI table of contents of MP3s, the SEEKTABLE of FLACs, or
+    the sample tables of MP4s. Other files get a linear table over the whole file.
+    Args:
+        file_path (str): The audio file.
+        duration (float): Duration in seconds, as read by extract_metadata.
+    Returns:
+        bytes: The packed seek table, or None if the file could not be read.
+    """
+    duration = duration or 0
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            if ext == ".mp3":
+                points = mp3_seek_points(f, duration, file_size)
+            elif ext == ".flac":
+                points = flac_seek_points(f, duration, file_size)
+            elif ext == ".m4a":
+                points = mp4_seek_points(f, duration, file_size)
+            else:
+                points = [(0, 0), (duration, file_size)]
+    except (OSError, struct.error, IndexError, TypeError) as e:
+        logging.error(f"Failed to build seek table for {file_path}: {e}")
+        return None
+    return pack_seek_table(points)
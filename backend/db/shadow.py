@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import logging
+from backend.db import migrations, meta
+from backend.db.connection import connect
+
+# Rebuilds (scan_media.rebuild) scan into a shadow database next to the live one, then copy its tables into the live
+# database in one transaction. The shadow file is not renamed over the live one: connections to a WAL database find its
+# -wal and -shm files by name, so replacing the file under open connections (the API keeps its own open) corrupts it.
+
+# user-owned tables, kept as they are in the live database
+KEPT_TABLES = ["votes", "meta"]
+# album columns copied into the shadow database, so that the scan finds the albums by name and keeps their IDs and art
+SEEDED_ALBUM_COLUMNS = ["album_id", "album_name", "album_art_hash", "album_rating", "album_base_rating"]
+# music columns copied into the shadow database, so that the scan finds the tracks by path (or, if moved, by content
+# hash, see scan_media.relink_moved_files) and keeps their IDs, which clients link to as /stream/{id}. The scan rewrites
+# everything else
+SEEDED_MUSIC_COLUMNS = ["music_id", "file_path", "album_id", "file_size", "file_mtime", "file_inode", "content_hash"]
+# album columns kept from the live database at the swap, as votes may change them while the shadow is built
+KEPT_ALBUM_COLUMNS = ["album_rating", "album_base_rating"]
+
+
+def remove_shadow(shadow_path: str):
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(shadow_path + suffix):
+            os.remove(shadow_path + suffix)
+
+
+def create_shadow(db_path: str, shadow_path: str) -> sqlite3.Connection:
+    """
+    Create a migrated shadow database holding only the albums and the track IDs and paths of the live database at
+    db_path. Returns a connection to it.
+    """
+    remove_shadow(shadow_path)
+    shadow_conn = connect(shadow_path)
+    migrations.migrate(shadow_conn)
+    shadow_conn.execute("ATTACH DATABASE ? AS live", (db_path,))
+    for table, seeded_columns in (("albums", SEEDED_ALBUM_COLUMNS), ("music", SEEDED_MUSIC_COLUMNS)):
+        columns = ", ".join(seeded_columns)
+        shadow_conn.execute(f"INSERT OR REPLACE INTO {table} ({columns}) SELECT {columns} FROM live.{table}")
+    shadow_conn.commit()
+    shadow_conn.execute("DETACH DATABASE live")
+    logging.info(f"Created shadow database {shadow_path}.")
+    return shadow_conn
+
+
+def get_columns(conn: sqlite3.Connection, schema: str, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def swap_in(conn: sqlite3.Connection, shadow_path: str):
+    """
+    Replace the contents of the live database (conn) with those of the shadow database in one IMMEDIATE transaction,
+    except KEPT_TABLES and KEPT_ALBUM_COLUMNS. Full text search is copied through the tables behind the FTS5 table.
+    Readers see the old contents until the commit; writers wait for it.
+    """
+    conn.execute("ATTACH DATABASE ? AS shadow", (shadow_path,))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        tables = [
+            name for name, sql in conn.execute("SELECT name, sql FROM shadow.sqlite_master WHERE type = 'table'")
+            if not name.startswith("sqlite_") and name not in KEPT_TABLES and not sql.upper().startswith("CREATE VIRTUAL")
+        ]
+        for table in tables:
+            shadow_columns = get_columns(conn, "shadow", table)
+            columns = ", ".join(column for column in get_columns(conn, "main", table) if column in shadow_columns)
+            if table == "albums":
+                conn.execute(
+                    f"""
+                    UPDATE shadow.albums SET {", ".join(f"{column} = live.{column}" for column in KEPT_ALBUM_COLUMNS)}
+                    FROM main.albums AS live WHERE live.album_id = shadow.albums.album_id
+                    """
+                )
+            conn.execute(f"DELETE FROM main.{table}")
+            conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM shadow.{table}")
+        meta.bump_library_version(conn.cursor())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE shadow")
+    logging.info(f"Swapped in {len(tables)} tables from {shadow_path}.")
@@ -1,4 +1,5 @@
 import logging
+import mimetypes
 
 
 def find_duplicates(target_list: list) -> list:
@@ -54,7 +55,7 @@ def find_common_substring(strings: list, option: str = "left") -> str:
 
 def find_largest_subset(target_list: list) -> list:
     """
-    Find the largest subset of a list of lists.
+    Find the largest subset of a list of lists, i.e. the items in every list, in the order of the shortest list.
     Args:
         target_list (list): The list of lists.
     Returns:
@@ -64,13 +65,17 @@ def find_largest_subset(target_list: list) -> list:
         return []
     if len(target_list) == 1:
         return target_list[0]
-    
-    largest = []
-    min_list = min(target_list, key=len)
-    for item in min_list:
-        if all(item in sublist for sublist in target_list):
-            largest.append(item)
-    return largest
+
+    # one set per list, so that this takes time linear in the total number of items
+    common = set(target_list[0]).intersection(*target_list[1:])
+    return [item for item in min(target_list, key=len) if item in common]
+
+
+def guess_mime_type(file_path: str) -> str:
+    """Guess the MIME type of a file from its extension, falling back to application/octet-stream."""
+    # NOTE: without html5 audio player, the browser will download the file if the mime type is not audio/mpeg
+    mime_type, _ = mimetypes.guess_type(file_path)
+    return mime_type or "application/octet-stream"
 
 
 if __name__ == "__main__":
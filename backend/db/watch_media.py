@@ -0,0 +1,220 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from backend.config import MEDIA_DIR, SUPPORTED_EXTS
+import backend.config as config
+from backend.db import scan_media
+
+# Keeps the database in sync with MEDIA_DIR while running: changes are noticed with inotify (or, where inotify is not
+# available, by polling directory mtimes), collected until WATCH_DEBOUNCE seconds pass without new ones, and then only
+# the directories they happened in are scanned with scan_media.main.
+#
+#     python -m backend.db.watch_media [--poll]
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# a file is only reported once it is closed after writing, so half-copied files are not scanned
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_media_file(name: str) -> bool:
+    return not name.startswith(".") and any(name.lower().endswith(ext) for ext in SUPPORTED_EXTS)
+
+
+def outermost_dirs(dirs: set) -> list:
+    """Drop directories inside other ones of dirs, as scanning a directory includes its subdirectories."""
+    ret = []
+    for directory in sorted(dirs):
+        if not ret or not directory.startswith(os.path.join(ret[-1], "")):
+            ret.append(directory)
+    return ret
+
+
+class InotifyWatcher:
+    """Recursive inotify watch on a directory tree, through libc with ctypes. Raises OSError where inotify is unavailable."""
+
+    def __init__(self, top: str):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this system")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # watch descriptor -> directory
+        self.top = top
+        self.add_tree(top)
+
+    def add_tree(self, top: str):
+        """Watch a directory and every directory under it."""
+        for root, subdirs, _ in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK | IN_ONLYDIR)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logging.error("Out of inotify watches; raise fs.inotify.max_user_watches or use --poll.")
+                elif err != errno.ENOENT:  # removed while walking
+                    logging.error(f"Failed to watch {root}: {os.strerror(err)}")
+                continue
+            self.paths[wd] = root
+            subdirs[:] = [subdir for subdir in subdirs if not subdir.startswith(".")]
+
+    def read(self, timeout: float) -> set:
+        """
+        Wait up to timeout seconds for events.
+        Returns:
+            set: Directories to rescan. A directory that appeared is returned itself, as it may already contain files.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:  # events were lost
+                logging.warning("inotify queue overflowed, rescanning everything.")
+                changed.add(self.top)
+                continue
+            if mask & IN_IGNORED:  # the directory is gone
+                self.paths.pop(wd, None)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(directory)
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                changed.add(path)
+            elif is_media_file(os.fsdecode(name)) and not mask & IN_CREATE:  # created files follow up with IN_CLOSE_WRITE
+                changed.add(directory)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify: stats every directory each WATCH_POLL_INTERVAL seconds. Adding, removing or
+    renaming a file changes the mtime of its directory, so only directories have to be compared. Files rewritten in
+    place do not, so those are picked up by a full scan every WATCH_RESCAN_INTERVAL seconds instead.
+    """
+
+    def __init__(self, top: str):
+        self.top = top
+        self.mtimes = self.stat_tree()
+        self.last_rescan = time.monotonic()
+
+    def stat_tree(self) -> dict:
+        ret = {}
+        for root, subdirs, _ in os.walk(self.top):
+            subdirs[:] = [subdir for subdir in subdirs if not subdir.startswith(".")]
+            try:
+                ret[root] = os.stat(root).st_mtime_ns
+            except OSError:  # removed while walking
+                pass
+        return ret
+
+    def read(self, timeout: float) -> set:
+        time.sleep(min(timeout, config.WATCH_POLL_INTERVAL))
+        if time.monotonic() - self.last_rescan >= config.WATCH_RESCAN_INTERVAL:
+            self.last_rescan = time.monotonic()
+            self.mtimes = self.stat_tree()
+            return {self.top}
+        mtimes = self.stat_tree()
+        changed = {root for root, mtime in mtimes.items() if self.mtimes.get(root) != mtime}
+        # a removed directory changes the mtime of its parent, which covers it
+        self.mtimes = mtimes
+        return changed
+
+    def close(self):
+        pass
+
+
+def watch(poll: bool = False, workers: int = config.SCAN_WORKERS):
+    """Scan MEDIA_DIR once, then keep rescanning the directories that change until interrupted."""
+    scan_media.main(workers=workers)
+    watcher = None
+    if not poll:
+        try:
+            watcher = InotifyWatcher(MEDIA_DIR)
+        except OSError as e:
+            logging.warning(f"inotify unavailable ({e}), polling instead.")
+    if watcher is None:
+        watcher = PollingWatcher(MEDIA_DIR)
+    logging.info(f"Watching {MEDIA_DIR} with {type(watcher).__name__}.")
+
+    pending = set()
+    first_event = last_event = None
+    try:
+        while True:
+            # wait indefinitely for the first change, then until WATCH_DEBOUNCE passes without more (a whole album being
+            # copied in is one scan), but never longer than WATCH_MAX_DELAY after the first
+            timeout = None
+            if pending:
+                now = time.monotonic()
+                timeout = max(0.0, min(last_event + config.WATCH_DEBOUNCE, first_event + config.WATCH_MAX_DELAY) - now)
+            changed = watcher.read(timeout if timeout is not None else 3600)
+            now = time.monotonic()
+            if changed:
+                if not pending:
+                    first_event = now
+                last_event = now
+                pending |= changed
+            # changes that keep coming (a long copy) postpone the scan until WATCH_MAX_DELAY at most
+            if not pending or (now < last_event + config.WATCH_DEBOUNCE and now < first_event + config.WATCH_MAX_DELAY):
+                continue
+
+            dirs = outermost_dirs(pending)
+            pending = set()
+            start = time.perf_counter()
+            stats = scan_media.main(workers=workers, dirs=dirs)
+            if stats:
+                logging.info(f"Rescanned {len(dirs)} directories in {time.perf_counter() - start:.2f} s: "
+                             f"{stats['new']} new, {stats['modified']} modified, {stats['moved']} moved, "
+                             f"{stats['removed']} removed.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Keep the database in sync with the media folder.")
+    parser.add_argument("--poll", action="store_true", help="poll directories instead of using inotify")
+    parser.add_argument("--workers", type=int, default=config.SCAN_WORKERS, help="number of processes reading tags")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    watch(poll=args.poll, workers=args.workers)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import pytest
+
+# backend.config reads these when it is first imported, so point them into a temporary directory before any test module
+# imports the backend: tests never touch the configured media folder, database or art store
+TMP_DIR = tempfile.mkdtemp(prefix="mediastreamer-tests-")
+os.environ["MEDIA_DIR"] = os.path.join(TMP_DIR, "media")
+os.environ["DB_PATH"] = os.path.join(TMP_DIR, "media.db")
+os.environ["ART_DIR"] = os.path.join(TMP_DIR, "art")
+
+N_TRACKS = 60  # about six albums of the synthetic library
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def library_template() -> str:
+    """A synthetic media folder (see backend/bench/synthetic_library.py), generated once per session. Do not modify it."""
+    from backend.bench import synthetic_library
+
+    root = os.path.join(TMP_DIR, "library_template")
+    synthetic_library.generate(root, N_TRACKS, seed=0)
+    return root
+
+
+@pytest.fixture
+def media_dir(library_template, tmp_path) -> str:
+    """A copy of the synthetic media folder that the test may change."""
+    root = str(tmp_path / "media")
+    shutil.copytree(library_template, root)
+    return root
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """A connection to a new, migrated database."""
+    from backend.db import migrations
+    from backend.db.connection import connect
+
+    conn = connect(str(tmp_path / "test.db"))
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def api(library_template):
+    """
+    The API app on the synthetic library, scanned into the configured (temporary) database. Returns a function making
+    requests to it, in-process: get(path, headers=None) -> (status, headers, body).
+    """
+    import asyncio
+    import backend.config as config
+    from backend.db import migrations, scan_media
+    from backend.db.connection import connect
+    from backend.bench.bench_e2e import asgi_request
+
+    conn = connect(config.DB_PATH)
+    migrations.migrate(conn)
+    scan_media.update_database(conn, workers=1, media_dir=library_template)
+    conn.close()
+    from backend.api.main import app
+
+    def get(path: str, headers: dict = None) -> tuple:
+        response_headers = {}
+
+        async def app_keeping_headers(scope, receive, send):  # asgi_request keeps the status and body only
+            async def keep_headers(message):
+                if message["type"] == "http.response.start":
+                    response_headers.update((k.decode().lower(), v.decode()) for k, v in message["headers"])
+                await send(message)
+            await app(scope, receive, keep_headers)
+
+        status, body = asyncio.run(asgi_request(app_keeping_headers, "GET", path, headers))
+        return status, response_headers, body
+
+    return get
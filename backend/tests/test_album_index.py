@@ -0,0 +1,66 @@
+from backend.api.album_index import AlbumIndex
+from backend.db import ratings, meta
+
+
+def add_albums(conn, n: int):
+    conn.executemany("INSERT INTO albums (album_id, album_name, album_rating) VALUES (?, ?, 1000)",
+                     [(album_id, f"Album {album_id}") for album_id in range(1, n + 1)])
+    meta.bump_library_version(conn.cursor())
+    conn.commit()
+
+
+def vote(conn, winner_id: int, loser_id: int) -> tuple:
+    conn.execute("BEGIN IMMEDIATE")
+    ret = ratings.record_vote(conn.cursor(), winner_id, loser_id)
+    version = meta.get_meta(conn.cursor(), "ratings_version")
+    conn.commit()
+    return ret, version
+
+
+def test_refresh_loads_albums_without_the_default_one(conn):
+    add_albums(conn, 3)
+    index = AlbumIndex()
+    index.refresh(conn.cursor())
+    assert sorted(index.album_ids) == [1, 2, 3]
+    assert index.random_album() in (1, 2, 3)
+
+
+def test_refresh_reloads_ratings_changed_by_other_processes(conn):
+    add_albums(conn, 3)
+    index = AlbumIndex()
+    index.refresh(conn.cursor())
+    (_, _, new_winner, new_loser), _ = vote(conn, 1, 2)  # e.g. another API worker
+    index.refresh(conn.cursor())
+    assert (new_winner, 1) in index.by_rating and (new_loser, 2) in index.by_rating
+
+
+def test_own_votes_do_not_reload(conn, caplog):
+    add_albums(conn, 3)
+    index = AlbumIndex()
+    index.refresh(conn.cursor())
+    (old_winner, old_loser, new_winner, new_loser), version = vote(conn, 1, 2)
+    index.update_rating(1, old_winner, new_winner)
+    index.update_rating(2, old_loser, new_loser)
+    index.mark_ratings_version(version)
+
+    caplog.set_level("INFO")
+    index.refresh(conn.cursor())
+    assert "Loaded" not in caplog.text
+    assert index.by_rating == sorted([(new_winner, 1), (new_loser, 2), (1000, 3)])
+
+
+def test_own_vote_after_another_change_reloads(conn):
+    add_albums(conn, 3)
+    index = AlbumIndex()
+    index.refresh(conn.cursor())
+    vote(conn, 3, 1)  # not seen by the index
+    (old_winner, old_loser, new_winner, new_loser), version = vote(conn, 1, 2)
+    index.update_rating(1, old_winner, new_winner)
+    index.mark_ratings_version(version)
+    assert index.ratings_version != version
+
+    index.refresh(conn.cursor())
+    assert index.ratings_version == version
+    assert sorted(index.by_rating) == sorted(
+        (rating, album_id) for album_id, rating in conn.execute("SELECT album_id, album_rating FROM albums WHERE album_id != 0"))
+
@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+from backend.db import migrations, db_setup
+
+
+def test_migrate_new_database(tmp_path):
+    conn = sqlite3.connect(tmp_path / "new.db")
+    assert migrations.get_version(conn) == 0
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert migrations.get_version(conn) == migrations.SCHEMA_VERSION
+    assert migrations.check_query_plans(conn.cursor()) == []
+    # nothing left to apply
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    conn.close()
+
+
+def test_migrate_keeps_ratings_of_unversioned_database(tmp_path):
+    """Databases made before versioning have the baseline schema at user_version 0."""
+    conn = sqlite3.connect(tmp_path / "old.db")
+    db_setup.create_schema(conn.cursor(), overwrite=False)
+    conn.execute("INSERT INTO albums (album_id, album_name, album_rating) VALUES (1, 'Blue', 1234)")
+    conn.commit()
+    assert migrations.get_version(conn) == 0
+
+    migrations.migrate(conn)
+    assert conn.execute("SELECT album_rating, album_base_rating FROM albums WHERE album_id = 1").fetchone() == (1234, 1234)
+    assert migrations.check_query_plans(conn.cursor()) == []
+    conn.close()
+
+
+def test_migrate_rejects_newer_database(tmp_path):
+    conn = sqlite3.connect(tmp_path / "newer.db")
+    conn.execute(f"PRAGMA user_version = {migrations.SCHEMA_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn)
+    conn.close()
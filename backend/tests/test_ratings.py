@@ -0,0 +1,75 @@
+import random
+from backend.config import ELO_DEFAULT_RATING
+from backend.db import ratings, meta
+
+
+def add_albums(conn, n: int, base_rating: float = None):
+    conn.executemany(
+        "INSERT INTO albums (album_id, album_name, album_rating, album_base_rating) VALUES (?, ?, ?, ?)",
+        [(album_id, f"Album {album_id}", base_rating, base_rating) for album_id in range(1, n + 1)],
+    )
+    conn.commit()
+
+
+def vote(conn, winner_id: int, loser_id: int, k: float = None) -> tuple:
+    conn.execute("BEGIN IMMEDIATE")
+    ret = ratings.record_vote(conn.cursor(), winner_id, loser_id, *([k] if k is not None else []))
+    conn.commit()
+    return ret
+
+
+def current_ratings(conn) -> dict:
+    return dict(conn.execute("SELECT album_id, album_rating FROM albums WHERE album_id != 0"))
+
+
+def replay(conn, k: float = None) -> dict:
+    """ratings.replay without album 0, the default album of a migrated database, which is never voted on."""
+    return {album_id: rating for album_id, rating in ratings.replay(conn.cursor(), k).items() if album_id != 0}
+
+
+def test_elo_update():
+    assert ratings.elo_update(1000, 1000, k=32) == (1016, 984)
+    winner, loser = ratings.elo_update(1400, 1000, k=32)
+    assert 1400 < winner < 1416 and 984 < loser < 1000  # an expected win moves little
+
+
+def test_replay_matches_recorded_votes(conn):
+    add_albums(conn, 8)
+    rng = random.Random(0)
+    for i in range(200):
+        winner_id, loser_id = rng.sample(range(1, 9), 2)
+        vote(conn, winner_id, loser_id, k=16 if i % 3 else 32)  # replays use each vote's logged K factor
+
+    assert replay(conn) == current_ratings(conn)
+    assert conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0] == 200
+    assert meta.get_meta(conn.cursor(), "ratings_version") == 200
+
+
+def test_replay_from_base_ratings_with_other_k(conn):
+    add_albums(conn, 2, base_rating=1200)
+    vote(conn, 1, 2, k=32)
+    assert current_ratings(conn) == {1: 1216, 2: 1184}
+    assert replay(conn, k=10) == {1: 1205, 2: 1195}
+    assert current_ratings(conn) == {1: 1216, 2: 1184}  # replay writes nothing
+
+
+def test_replay_skips_votes_on_removed_albums(conn):
+    add_albums(conn, 3)
+    vote(conn, 1, 2)
+    vote(conn, 3, 1)
+    conn.execute("DELETE FROM albums WHERE album_id = 2")
+    conn.commit()
+    replayed = replay(conn)
+    assert set(replayed) == {1, 3}
+    assert replayed == dict(zip((3, 1), ratings.elo_update(ELO_DEFAULT_RATING, ELO_DEFAULT_RATING)))
+
+
+def test_write_ratings(conn):
+    add_albums(conn, 2)
+    vote(conn, 1, 2)
+    conn.execute("UPDATE albums SET album_rating = 0")  # drifted from the log
+    version = meta.get_meta(conn.cursor(), "ratings_version")
+    ratings.write_ratings(conn.cursor(), ratings.replay(conn.cursor()))
+    conn.commit()
+    assert current_ratings(conn) == replay(conn)
+    assert meta.get_meta(conn.cursor(), "ratings_version") == version + 1
@@ -0,0 +1,145 @@
+import os
+import shutil
+from backend.db import scan_media
+
+
+def scan(conn, media_dir: str, **kwargs) -> dict:
+    return scan_media.update_database(conn, workers=1, media_dir=media_dir, **kwargs)
+
+
+def track_ids(conn) -> dict:
+    """file_path -> music_id of every track."""
+    return {path: music_id for music_id, path in conn.execute("SELECT music_id, file_path FROM music")}
+
+
+def audio_files(media_dir: str) -> list:
+    return sorted(os.path.join(root, file) for root, _, files in os.walk(media_dir) for file in files
+                  if os.path.splitext(file)[1] in scan_media.SUPPORTED_EXTS)
+
+
+def test_rescan_skips_unchanged_files(conn, media_dir):
+    stats = scan(conn, media_dir)
+    assert stats["new"] == len(audio_files(media_dir))
+    stats = scan(conn, media_dir)
+    assert (stats["new"], stats["modified"], stats["removed"]) == (0, 0, 0)
+    assert stats["unchanged"] == len(audio_files(media_dir))
+
+
+def test_moved_files_keep_their_ids(conn, media_dir):
+    scan(conn, media_dir)
+    before = track_ids(conn)
+    moved_file, renamed_file = audio_files(media_dir)[:2]
+    os.makedirs(os.path.join(media_dir, "Moved"))
+    new_path = os.path.join(media_dir, "Moved", os.path.basename(moved_file))
+    renamed_path = os.path.join(os.path.dirname(renamed_file), "renamed" + os.path.splitext(renamed_file)[1])
+    os.rename(moved_file, new_path)
+    os.rename(renamed_file, renamed_path)
+
+    stats = scan(conn, media_dir)
+    assert (stats["moved"], stats["new"], stats["removed"]) == (2, 0, 0)
+    after = track_ids(conn)
+    assert after[new_path] == before[moved_file]
+    assert after[renamed_path] == before[renamed_file]
+    assert moved_file not in after and renamed_file not in after
+    # a rescan finds them unchanged at their new paths
+    assert scan(conn, media_dir)["moved"] == 0
+
+
+def test_copies_and_moves_without_hashes(conn, media_dir):
+    scan(conn, media_dir)
+    before = track_ids(conn)
+    first, second = audio_files(media_dir)[:2]
+    # a copy is a new track, as the original is still there
+    copy_path = os.path.join(os.path.dirname(first), "copy" + os.path.splitext(first)[1])
+    shutil.copy2(first, copy_path)
+    # rows stored before content hashes existed are matched by size, mtime and inode, which a rename keeps
+    conn.execute("UPDATE music SET content_hash = NULL WHERE music_id = ?", (before[second],))
+    conn.commit()
+    renamed_path = os.path.join(os.path.dirname(second), "renamed" + os.path.splitext(second)[1])
+    os.rename(second, renamed_path)
+
+    stats = scan(conn, media_dir)
+    assert (stats["new"], stats["moved"]) == (1, 1)
+    after = track_ids(conn)
+    assert after[first] == before[first]
+    assert after[copy_path] not in before.values()
+    assert after[renamed_path] == before[second]
+
+
+def test_reused_inode_is_not_a_move(conn, media_dir):
+    """A new file may get the inode of a deleted one. Without a content hash, its mtime tells them apart."""
+    scan(conn, media_dir)
+    deleted = audio_files(media_dir)[0]
+    music_id = track_ids(conn)[deleted]
+    os.remove(deleted)
+    new_path = os.path.join(os.path.dirname(deleted), "new" + os.path.splitext(deleted)[1])
+    shutil.copy(audio_files(media_dir)[1], new_path)  # another track, with a new mtime
+    size, mtime, inode = scan_media.file_fingerprint(new_path)
+    # as if the deleted file had been stored without a hash, and its inode were now the new file's
+    conn.execute("UPDATE music SET content_hash = NULL, file_size = ?, file_mtime = ?, file_inode = ? WHERE music_id = ?",
+                 (size, mtime - 10 ** 9, inode, music_id))
+    conn.commit()
+
+    stats = scan(conn, media_dir)
+    assert (stats["moved"], stats["new"], stats["removed"]) == (0, 1, 1)
+    assert track_ids(conn)[new_path] != music_id
+    assert deleted not in track_ids(conn)
+
+
+def test_removed_files_are_deleted(conn, media_dir):
+    scan(conn, media_dir)
+    removed = audio_files(media_dir)[0]
+    music_id = track_ids(conn)[removed]
+    os.remove(removed)
+
+    assert scan(conn, media_dir)["removed"] == 1
+    assert removed not in track_ids(conn)
+    for table in ("artists_music", "seek_tables"):
+        assert conn.execute(f"SELECT COUNT(*) FROM {table} WHERE music_id = ?", (music_id,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM search_index WHERE rowid = ?", (music_id,)).fetchone()[0] == 0
+
+
+def test_albums_without_tracks_are_deleted(conn, media_dir):
+    scan(conn, media_dir)
+    album_id = conn.execute("SELECT album_id FROM music WHERE album_id != 0 ORDER BY music_id LIMIT 1").fetchone()[0]
+    version = scan_media.meta.get_meta(conn.cursor(), "library_version")
+    for path in [path for path, in conn.execute("SELECT file_path FROM music WHERE album_id = ?", (album_id,))]:
+        os.remove(path)
+
+    stats = scan(conn, media_dir)
+    assert stats["albums_removed"] == 1
+    assert conn.execute("SELECT COUNT(*) FROM albums WHERE album_id = ?", (album_id,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM artists_albums WHERE album_id = ?", (album_id,)).fetchone()[0] == 0
+    assert scan_media.meta.get_meta(conn.cursor(), "library_version") == version + 1
+    # every other album still has tracks, and the default album is kept
+    assert conn.execute("SELECT COUNT(*) FROM albums WHERE album_name IS NOT NULL AND album_id NOT IN "
+                        "(SELECT album_id FROM music)").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM albums WHERE album_id = 0").fetchone()[0] == 1
+
+
+def test_rebuild_keeps_album_and_track_ids(conn, media_dir, tmp_path):
+    db_path = str(tmp_path / "test.db")  # the database of the conn fixture
+    scan(conn, media_dir)
+    conn.execute("UPDATE albums SET album_rating = 1234 WHERE album_id != 0")
+    conn.commit()
+    before = track_ids(conn)
+    albums_before = dict(conn.execute("SELECT album_id, album_name FROM albums"))
+    moved_file, unreadable_file = audio_files(media_dir)[:2]
+    moved_path = os.path.join(os.path.dirname(moved_file), "moved" + os.path.splitext(moved_file)[1])
+    os.rename(moved_file, moved_path)
+    with open(unreadable_file, "wb") as f:
+        f.write(b"\0" * 4096)
+
+    stats = scan_media.rebuild(workers=1, media_dir=media_dir, db_path=db_path)
+    assert stats["moved"] == 1
+    after = track_ids(conn)
+    assert after[moved_path] == before[moved_file]
+    assert unreadable_file not in after
+    assert {path: music_id for path, music_id in after.items() if path != moved_path} == {
+        path: music_id for path, music_id in before.items() if path not in (moved_file, unreadable_file)}
+    # moved files are read again, as the shadow database only has their IDs and paths
+    assert conn.execute("SELECT title IS NOT NULL AND duration IS NOT NULL FROM music WHERE music_id = ?",
+                        (after[moved_path],)).fetchone()[0]
+    assert dict(conn.execute("SELECT album_id, album_name FROM albums")) == albums_before
+    assert {rating for rating, in conn.execute("SELECT album_rating FROM albums WHERE album_id != 0")} == {1234}
+    assert not os.path.exists(f"{db_path}.shadow")
@@ -0,0 +1,27 @@
+from backend.db import search
+
+
+def add_tracks(conn, titles: list):
+    conn.execute("INSERT INTO genres (genre_id, genre_name) VALUES (1, 'Lovers Rock')")
+    conn.executemany(
+        "INSERT INTO music (music_id, title, genre_id, file_path) VALUES (?, ?, 1, ?)",
+        [(i, title, f"/synthetic/{i}.mp3") for i, title in enumerate(titles, start=1)],
+    )
+    search.index_tracks(conn.cursor())
+
+
+def test_search_ranks_every_match(conn, monkeypatch):
+    """Below RANK_ALL_MATCHES, the best match is found even if it is scanned after MAX_CANDIDATES others."""
+    monkeypatch.setattr(search, "MAX_CANDIDATES", 10)
+    monkeypatch.setattr(search, "RANK_ALL_MATCHES", 100)
+    add_tracks(conn, [f"Track {i}" for i in range(50)] + ["Lovers"])  # all match "lovers" in their genre
+    assert search.search(conn.cursor(), "lovers", 3)[0][1] == "Lovers"
+
+
+def test_search_ranks_first_candidates_beyond_rank_all_matches(conn, monkeypatch):
+    monkeypatch.setattr(search, "MAX_CANDIDATES", 10)
+    monkeypatch.setattr(search, "RANK_ALL_MATCHES", 20)
+    add_tracks(conn, [f"Track {i}" for i in range(50)] + ["Lovers"])
+    hits = search.search(conn.cursor(), "lovers", 20)
+    assert len(hits) == 10
+    assert "Lovers" not in [title for _, title, _, _, _ in hits]
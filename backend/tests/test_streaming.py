@@ -0,0 +1,135 @@
+import os
+import anyio
+from backend.api import streaming
+
+
+def run_response(response, method: str = "GET", disconnect_after: int = None) -> tuple:
+    """
+    Run an ASGI response with a server that implements ASGI 2.3, like uvicorn: sends after the client is gone are
+    dropped. With disconnect_after, the client leaves after that many body messages.
+    Returns (status, headers, body bytes received, number of body messages sent).
+    """
+    start, chunks, sent = {}, [], [0]
+
+    async def run():
+        gone = anyio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                sent[0] += 1
+                if not gone.is_set():
+                    chunks.append(message.get("body", b""))
+                if disconnect_after is not None and sent[0] >= disconnect_after:
+                    gone.set()
+                elif not message.get("more_body", False):
+                    gone.set()  # the client closes once the response is complete
+
+        scope = {"type": "http", "method": method, "asgi": {"version": "3.0", "spec_version": "2.3"}, "extensions": {}}
+        await response(scope, receive, send)
+
+    anyio.run(run)
+    headers = {key.decode(): value.decode() for key, value in start["headers"]}
+    return start["status"], headers, b"".join(chunks), sent[0]
+
+
+def write_file(tmp_path, size: int) -> str:
+    path = tmp_path / "song.bin"
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_file_range_response_sends_range(tmp_path):
+    path = write_file(tmp_path, 10_000)
+    data = open(path, "rb").read()
+    file = open(path, "rb")
+    status, headers, body, _ = run_response(streaming.FileRangeResponse(file, 100, 5000, status_code=206))
+    assert status == 206
+    assert headers["content-length"] == "5000"
+    assert body == data[100:5100]
+    assert file.closed
+
+
+def test_file_range_response_head_sends_no_body(tmp_path):
+    file = open(write_file(tmp_path, 1000), "rb")
+    _, headers, body, _ = run_response(streaming.FileRangeResponse(file, 0, 1000), method="HEAD")
+    assert headers["content-length"] == "1000"
+    assert body == b""
+
+
+def test_file_range_response_stops_when_client_disconnects(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming.config, "STREAM_CHUNK_SIZE", 1024)
+    reads = []
+    pread = os.pread
+    monkeypatch.setattr(streaming.os, "pread", lambda fd, n, offset: reads.append(n) or pread(fd, n, offset))
+    file = open(write_file(tmp_path, 100 * 1024), "rb")
+
+    _, _, body, sent = run_response(streaming.FileRangeResponse(file, 0, 100 * 1024), disconnect_after=1)
+    assert len(body) == 1024  # the first body message is the only chunk the client got
+    assert sent < 10 and len(reads) < 10, "the file kept being read after the client disconnected"
+    assert file.closed
+
+
+def test_parse_range_header():
+    size = 1000
+    assert streaming.parse_range_header("bytes=0-499", size) == [(0, 499)]
+    assert streaming.parse_range_header("bytes=500-", size) == [(500, 999)]
+    assert streaming.parse_range_header("bytes=-100", size) == [(900, 999)]
+    assert streaming.parse_range_header("bytes=-5000", size) == [(0, 999)]  # suffix longer than the file
+    assert streaming.parse_range_header("bytes=900-5000", size) == [(900, 999)]  # clamped
+    assert streaming.parse_range_header("BYTES = 0-0 , -1", size) == [(0, 0), (999, 999)]
+    # overlapping and adjacent ranges are merged, in order
+    assert streaming.parse_range_header("bytes=500-599,0-99,100-199,550-700", size) == [(0, 199), (500, 700)]
+
+
+def test_parse_range_header_unsatisfiable():
+    assert streaming.parse_range_header("bytes=1000-", 1000) == []
+    assert streaming.parse_range_header("bytes=-0", 1000) == []
+    assert streaming.parse_range_header("bytes=0-", 0) == []
+
+
+def test_parse_range_header_ignored():
+    for header in ("items=0-1", "bytes=", "bytes=abc", "bytes=5-1", "bytes=1-2-3", "bytes=-", "bytes=0x10-"):
+        assert streaming.parse_range_header(header, 1000) is None, header
+    too_many = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(streaming.MAX_RANGES + 1))
+    assert streaming.parse_range_header(too_many, 1000) is None
+
+
+def test_if_range_and_conditionals():
+    etag, last_modified = streaming.make_validators(1000, 1_700_000_000 * 10 ** 9, 42)
+    assert streaming.if_range_matches(None, etag, last_modified)
+    assert streaming.if_range_matches(etag, etag, last_modified)
+    assert not streaming.if_range_matches(f"W/{etag}", etag, last_modified)  # If-Range needs a strong match
+    assert streaming.if_range_matches(last_modified, etag, last_modified)
+    assert streaming.etag_matches(f'"other", W/{etag}', etag)
+    assert streaming.etag_matches("*", etag)
+
+
+def test_multipart_file_range_response(tmp_path):
+    path = write_file(tmp_path, 10_000)
+    data = open(path, "rb").read()
+    ranges = [(0, 9), (5000, 5099), (9990, 9999)]
+    response = streaming.MultipartFileRangeResponse(open(path, "rb"), ranges, len(data), "audio/mpeg")
+    status, headers, body, _ = run_response(response)
+
+    assert status == 206
+    assert int(headers["content-length"]) == len(body)
+    media_type, _, boundary = headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    parts = body.split(f"--{boundary}".encode())
+    assert parts[0] == b"\r\n" and parts[-1] == b"--\r\n"
+    for part, (start, end) in zip(parts[1:-1], ranges):
+        part_headers, _, content = part.partition(b"\r\n\r\n")
+        assert b"Content-Type: audio/mpeg" in part_headers
+        assert f"Content-Range: bytes {start}-{end}/{len(data)}".encode() in part_headers
+        assert content == data[start:end + 1] + b"\r\n"
@@ -0,0 +1,44 @@
+import time
+import pytest
+from backend.db import watch_media
+
+
+class FakeWatcher:
+    """Reports a change in the same directory every `interval` seconds, like a long copy into it."""
+
+    def __init__(self, top: str, interval: float = 0.05, give_up_after: float = 3.0):
+        self.top = top
+        self.interval = interval
+        self.deadline = time.monotonic() + give_up_after
+
+    def read(self, timeout: float) -> set:
+        if time.monotonic() > self.deadline:
+            raise AssertionError("no rescan while changes kept coming")
+        time.sleep(min(timeout, self.interval))
+        return {f"{self.top}/Album"}
+
+    def close(self):
+        pass
+
+
+def test_continuous_changes_are_scanned_by_the_max_delay(monkeypatch):
+    monkeypatch.setattr(watch_media.config, "WATCH_DEBOUNCE", 0.2)
+    monkeypatch.setattr(watch_media.config, "WATCH_MAX_DELAY", 0.4)
+    monkeypatch.setattr(watch_media, "PollingWatcher", FakeWatcher)
+    scans = []
+
+    def fake_scan(workers, dirs=None):
+        scans.append((time.monotonic(), dirs))
+        if dirs is not None:  # the first rescan after the initial full scan
+            raise KeyboardInterrupt
+        return None
+
+    monkeypatch.setattr(watch_media.scan_media, "main", fake_scan)
+    start = time.monotonic()
+    watch_media.watch(poll=True, workers=1)
+
+    assert len(scans) == 2
+    scanned_at, dirs = scans[1]
+    assert dirs == [f"{watch_media.MEDIA_DIR}/Album"]
+    # never quiet for WATCH_DEBOUNCE, so the scan comes at WATCH_MAX_DELAY after the first change
+    assert scanned_at - start == pytest.approx(0.4, abs=0.2)
@@ -1,22 +1,41 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
 import "./MainPage.css";
 
 function MainPage() {
     const navigate = useNavigate();
     const [albums, setAlbums] = useState([]);
+    const nextCursor = useRef(null);  // "after" of the next page, null when all albums are loaded
+    const loading = useRef(false);
+
+    const fetchAlbums = (after) => {
+        loading.current = true;
+        fetch("http://127.0.0.1:8000/albums" + (after ? `?after=${after}` : ""))
+            .then((res) => {
+                nextCursor.current = res.headers.get("X-Next-Cursor");
+                return res.json();
+            })
+            .then((data) => setAlbums((prev) => (after ? [...prev, ...data] : data)))
+            .catch((error) => console.error("Error fetching albums:", error))
+            .finally(() => (loading.current = false));
+    };
 
     useEffect(() => {
-        fetch("http://127.0.0.1:8000/albums")
-            .then((res) => res.json())
-            .then((data) => setAlbums(data))
-            .catch((error) => console.error("Error fetching albums:", error));
+        fetchAlbums(null);
     }, []);
 
+    // load the next page when scrolled near the bottom of the grid
+    const onScroll = (e) => {
+        const grid = e.currentTarget;
+        if (!loading.current && nextCursor.current && grid.scrollTop + grid.clientHeight > grid.scrollHeight - 400) {
+            fetchAlbums(nextCursor.current);
+        }
+    };
+
     return (
         <>
             <h1>All Albums</h1>
-            <div style={styles.gridContainer} id="album-grid">
+            <div style={styles.gridContainer} id="album-grid" onScroll={onScroll}>
                 {albums.map((album) => (
                     <div className="album-card" key={album.key} style={styles.card} onClick={() => navigate(`/album/${album.key}`)}>
                         <img